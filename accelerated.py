@@ -0,0 +1,281 @@
+import array
+import importlib.metadata
+import types
+from datetime import datetime
+
+import numpy as np
+
+import bloom_filter
+from caches import LRUCache, FIFOCache, ClockCache
+from filters import NullFilter, BloomFilter
+from logger import log_window
+from simulation import Simulation, do_nothing
+from trace_to_block import BlockTraceReader
+from traces import BlockCacheTraceIterator
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    njit = None
+    NUMBA_AVAILABLE = False
+
+POLICY_LRU = 0
+POLICY_FIFO = 1
+POLICY_CLOCK = 2
+
+# exact classes only, subclasses may change the semantics
+_cache_cls_to_policy = {
+    LRUCache: POLICY_LRU,
+    FIFOCache: POLICY_FIFO,
+    ClockCache: POLICY_CLOCK,
+}
+_SUPPORTED_FILTERS = (NullFilter, BloomFilter)
+
+BLOOM_ERROR_RATE = 0.001
+
+
+def _replay(policy, capacity, sizes, key_ids, key_count, bloom_probes, bloom_n, bloom_words):
+    """
+    Replays a columnar trace, mirroring CachingSystem with LRUCache/FIFOCache/ClockCache and
+    NullFilter/BloomFilter request for request.
+    Cached objects form a doubly linked list over dense key ids, head is evicted first.
+    :param bloom_probes: (key_count, k) bit indexes per key, or an empty array for NullFilter
+    :return: numpy.ndarray(uint8), 1 for every miss
+    """
+    prev = np.full(key_count, -1, dtype=np.int64)
+    nxt = np.full(key_count, -1, dtype=np.int64)
+    cached = np.zeros(key_count, dtype=np.bool_)
+    referenced = np.zeros(key_count, dtype=np.bool_)
+    object_size = np.zeros(key_count, dtype=np.int64)
+    head = -1
+    tail = -1
+    curr_capacity = 0
+
+    use_bloom = bloom_probes.shape[0] > 0
+    bloom_bits = np.zeros((2, bloom_words), dtype=np.uint32)
+    bloom_current = 0
+    bloom_i = 0
+
+    misses = np.zeros(len(sizes), dtype=np.uint8)
+    for r in range(len(sizes)):
+        key = key_ids[r]
+        size = sizes[r]
+        if cached[key]:
+            if policy == POLICY_LRU and key != tail:
+                # move to the back of the list
+                if prev[key] == -1:
+                    head = nxt[key]
+                else:
+                    nxt[prev[key]] = nxt[key]
+                prev[nxt[key]] = prev[key]
+                prev[key] = tail
+                nxt[key] = -1
+                nxt[tail] = key
+                tail = key
+            elif policy == POLICY_CLOCK:
+                referenced[key] = True
+            continue
+        misses[r] = 1
+
+        if use_bloom:
+            exists = False
+            for f in range(2):
+                in_filter = True
+                for j in range(bloom_probes.shape[1]):
+                    bit = bloom_probes[key, j]
+                    if (bloom_bits[f, bit >> 5] & np.uint32(1 << (bit & 31))) == 0:
+                        in_filter = False
+                        break
+                if in_filter:
+                    exists = True
+                    break
+            if not exists:
+                if bloom_i > bloom_n:
+                    bloom_i = 0
+                    bloom_current = 1 - bloom_current
+                    bloom_bits[bloom_current, :] = 0
+                for j in range(bloom_probes.shape[1]):
+                    bit = bloom_probes[key, j]
+                    bloom_bits[bloom_current, bit >> 5] |= np.uint32(1 << (bit & 31))
+                bloom_i += 1
+                continue
+
+        if size > capacity:
+            continue
+        while curr_capacity + size > capacity:
+            victim = head
+            if policy == POLICY_CLOCK:
+                while referenced[victim]:
+                    referenced[victim] = False
+                    if victim != tail:
+                        head = nxt[victim]
+                        prev[head] = -1
+                        prev[victim] = tail
+                        nxt[victim] = -1
+                        nxt[tail] = victim
+                        tail = victim
+                    victim = head
+            head = nxt[victim]
+            if head == -1:
+                tail = -1
+            else:
+                prev[head] = -1
+            nxt[victim] = -1
+            cached[victim] = False
+            curr_capacity -= object_size[victim]
+
+        cached[key] = True
+        object_size[key] = size
+        curr_capacity += size
+        prev[key] = tail
+        nxt[key] = -1
+        if tail == -1:
+            head = key
+        else:
+            nxt[tail] = key
+        tail = key
+    return misses
+
+
+if NUMBA_AVAILABLE:
+    _replay = njit(cache=True, nogil=True)(_replay)
+
+
+def load_trace_arrays(trace_iterator):
+    """
+    :return: (sizes, dense key ids) as numpy.ndarray(int64) and the original keys ordered by id
+    """
+    if isinstance(trace_iterator, BlockCacheTraceIterator) and trace_iterator.start_index == 0 \
+            and trace_iterator.end_index is None and trace_iterator.start_ts is None \
+            and trace_iterator.end_ts is None:
+        with open(trace_iterator.file_path, "rb") as f:
+            reader = BlockTraceReader(f)
+            blocks = [reader.read_block(block) for block in range(len(reader.counts))]
+            keys = reader.key_table.tolist()
+        sizes = np.concatenate([block[1] for block in blocks])
+        trace_iterator.total_count = len(sizes)
+        trace_iterator.total_size = int(sizes.sum())
+        return sizes, np.concatenate([block[2] for block in blocks]), keys
+
+    key_to_id = {}
+    sizes = array.array("q")
+    key_ids = array.array("q")
+    for request in trace_iterator:
+        sizes.append(request.size)
+        key_ids.append(key_to_id.setdefault(request.key, len(key_to_id)))
+    return np.frombuffer(sizes, dtype=np.int64), np.frombuffer(key_ids, dtype=np.int64), list(key_to_id.keys())
+
+
+def bloom_key_hashes(keys):
+    """
+    The two hash values bloom_filter derives its probes from, (hash1 + probe * hash2) % num_bits_m for
+    probe in 1..num_probes_k. They depend on the key only, so they are computed once for every filter size.
+    :return: (list of hash1, list of hash2) ordered like keys
+    """
+    template = bloom_filter.BloomFilter(1, error_rate=BLOOM_ERROR_RATE)
+    # with a modulus above any linear combination the first two probes are hash1 + hash2 and hash1 + 2 * hash2
+    unreduced = types.SimpleNamespace(num_probes_k=2, num_bits_m=1 << 1024)
+    hashes1 = []
+    hashes2 = []
+    for key in keys:
+        first, second = template.probe_bitnoer(unreduced, key)
+        hashes1.append(2 * first - second)
+        hashes2.append(second - first)
+    return hashes1, hashes2
+
+
+def bloom_probe_table(keys, n, error_rate=BLOOM_ERROR_RATE, hashes=None):
+    """
+    Bit indexes of every key in a bloom_filter.BloomFilter(n, error_rate=error_rate),
+    computed once per unique key with the library's own hash functions.
+    :param hashes: bloom_key_hashes(keys), when probe tables of several filters are built
+    :return: (numpy.ndarray(int64) of shape (len(keys), k), number of 32 bit words in the filter)
+    """
+    template = bloom_filter.BloomFilter(n, error_rate=error_rate)
+    m = template.num_bits_m
+    hashes1, hashes2 = hashes if hashes is not None else bloom_key_hashes(keys)
+    # reduced modulo m first, the combination then fits in int64
+    reduced1 = np.array([h % m for h in hashes1], dtype=np.int64)
+    reduced2 = np.array([h % m for h in hashes2], dtype=np.int64)
+    probe_numbers = np.arange(1, template.num_probes_k + 1, dtype=np.int64)
+    probes = (reduced1[:, None] + probe_numbers[None, :] * reduced2[:, None]) % m
+    probes = probes.reshape(len(keys), template.num_probes_k)
+    _check_probes(template, keys, probes)
+    return probes, (m + 31) // 32
+
+
+def _check_probes(template, keys, probes, sample=16):
+    """
+    bloom_key_hashes relies on how bloom_filter (pinned in requirements.txt) combines its hashes,
+    checks the derived probes of a few keys against the library's own.
+    """
+    for i, key in enumerate(keys[:sample]):
+        if list(template.probe_bitnoer(template, key)) != probes[i].tolist():
+            raise RuntimeError(f"bloom-filter {importlib.metadata.version('bloom-filter')} derives its probes "
+                               f"differently than bloom_key_hashes expects, install the version of requirements.txt")
+
+
+class AcceleratedSimulation(Simulation):
+    """
+    Runs LRU, FIFO and CLOCK caches behind a Null or Bloom filter as a Numba compiled kernel
+    over columnar trace arrays. Results are identical to Simulation.run.
+    Falls back to Simulation.run when Numba is not installed or the stack is not supported.
+    Hit/miss callbacks, event subscribers and per tenant statistics are not supported by the kernel.
+    """
+
+    @property
+    def is_accelerated(self):
+        return NUMBA_AVAILABLE \
+               and type(self._simulator.cache_instance) in _cache_cls_to_policy \
+               and type(self._simulator.filter_instance) in _SUPPORTED_FILTERS \
+               and self.on_miss_callback is do_nothing and self.on_hit_callback is do_nothing \
+               and self._simulator.cache_instance.expiry is None \
+               and self._tenant_statistics is None \
+               and self._events is None \
+               and self._simulator.cache_instance.eviction_fn == self._simulator.cache_instance._evict_without_logging
+
+    def run(self):
+        if not self.is_accelerated:
+            return super().run()
+        start_time = datetime.now()
+        cache_instance = self._simulator.cache_instance
+        filter_instance = self._simulator.filter_instance
+        sizes, key_ids, keys = load_trace_arrays(self._trace_iterator)
+        if isinstance(filter_instance, BloomFilter):
+            bloom_probes, bloom_words = bloom_probe_table(keys, filter_instance.args.n)
+            bloom_n = filter_instance.args.n
+        else:
+            bloom_probes, bloom_words, bloom_n = np.empty((0, 0), dtype=np.int64), 0, 0
+        misses = _replay(
+            _cache_cls_to_policy[type(cache_instance)], cache_instance.capacity, sizes, key_ids, len(keys),
+            bloom_probes, bloom_n, bloom_words
+        )
+        self._record_segments(sizes, misses)
+        self._curr_trace_index = len(sizes)
+        end_time = datetime.now()
+        res = self.get_state()
+        res["simulation_time"] = (end_time - start_time).total_seconds()
+        res["simulation_timestamp"] = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+        return res
+
+    def _record_segments(self, sizes, misses):
+        # vectorised ordinal_window_index
+        windows = np.maximum(np.arange(len(sizes)) - 1, 0) // self._ordinal_window
+        total_count = np.bincount(windows)
+        # bincount weights are float64 and lose bytes past 2 ** 53, sums stay in int64
+        total_bytes = np.zeros(len(total_count), dtype=np.int64)
+        np.add.at(total_bytes, windows, sizes)
+        miss_count = np.bincount(windows, weights=misses, minlength=len(total_count))
+        miss_bytes = np.zeros(len(total_count), dtype=np.int64)
+        np.add.at(miss_bytes, windows, sizes * misses)
+        statistics = self._segment_statistics
+        for i in range(len(total_count)):
+            statistics.segment_total_count = int(total_count[i])
+            statistics.segment_total_bytes = int(total_bytes[i])
+            statistics.segment_miss_count = int(miss_count[i])
+            statistics.segment_miss_bytes = int(miss_bytes[i])
+            if i != len(total_count) - 1:
+                log_window(self._execution_logger, (i + 1) * self._ordinal_window, self._trace_iterator,
+                           statistics.curr_bmr(), statistics.curr_omr())
+            statistics.record_segment()
@@ -0,0 +1,346 @@
+"""
+Content addressed cache of artifacts derived from traces.
+
+An artifact is stored once per (trace content fingerprint, artifact name, artifact version) as
+    {ARTIFACT_CACHE_DIRECTORY}/{fingerprint[:2]}/{fingerprint}.{name}.v{version}{suffix}
+so renamed or copied traces share artifacts and bumping a version invalidates old ones.
+A file's mtime is its last use; when the directory exceeds ARTIFACT_CACHE_BUDGET bytes the least recently
+used artifacts are deleted. Fingerprints (blake2b of the trace content) are memoized per
+(path, size, mtime) so an unchanged trace is hashed once.
+Builders write to a temporary file renamed into place and hold an O_EXCL lock file while building, so
+concurrent processes build an artifact at most once.
+"""
+import hashlib
+import os
+import pickle
+import time
+
+ARTIFACT_CACHE_DIRECTORY = "ARTIFACT_CACHE_DIRECTORY"
+ARTIFACT_CACHE_BUDGET = "ARTIFACT_CACHE_BUDGET"
+
+_HASH_CHUNK_SIZE = 1 << 22
+
+
+def _parse_requests(trace_path, trace_type="string"):
+    from traces import initialize_iterator
+    return iter(initialize_iterator(trace_type, trace_path))
+
+
+def _lossy_conversion(trace_path):
+    return ValueError(f"{trace_path} has ttl or range columns, which the binary, bin_arr and block trace types "
+                      f"drop; use its string or pickle trace")
+
+
+def _checked_lines(trace_path, source):
+    """
+    Lines of source, raising on the first one with ttl or range columns, see traces.parse_tr_line.
+    A cached conversion is reported under the string trace's name, so it must not change the results.
+    """
+    for line in source:
+        split_line = line.split()
+        if len(split_line) > 4 or (len(split_line) == 4 and split_line[3] != "-"):
+            raise _lossy_conversion(trace_path)
+        yield line
+
+
+def _checked_requests(trace_path):
+    for request in _parse_requests(trace_path):
+        if request.ttl is not None or request.range_start is not None:
+            raise _lossy_conversion(trace_path)
+        yield request
+
+
+def _build_binary(trace_path, dest):
+    from trace_to_binary import BinTraceWriter
+    with open(trace_path) as source:
+        BinTraceWriter(1, int).dump(_checked_lines(trace_path, source), dest)
+
+
+def _build_bin_arr(trace_path, dest):
+    from trace_to_binary import BinArrTraceWriter
+    with open(trace_path) as source:
+        BinArrTraceWriter().dump(_checked_lines(trace_path, source), dest)
+
+
+def _build_pickle(trace_path, dest):
+    from trace_to_pickle import s_dump
+    s_dump(_parse_requests(trace_path), dest)
+
+
+def _build_block(trace_path, dest):
+    from trace_to_block import BlockTraceWriter
+    BlockTraceWriter().dump(_checked_requests(trace_path), dest)
+
+
+def _compute_first_occurrence(trace_path, trace_type):
+    """
+    :return: numpy bool array, True at the first request of every key
+    """
+    import numpy as np
+    seen = set()
+    first = []
+    for request in _parse_requests(trace_path, trace_type):
+        key = request.key
+        first.append(key not in seen)
+        seen.add(key)
+    return np.asarray(first, dtype=np.bool_)
+
+
+def _compute_second_occurrence(trace_path, trace_type):
+    """
+    :return: numpy int64 array of the request indexes at which a key is requested the second time
+    """
+    import numpy as np
+    counts = {}
+    indexes = []
+    for request in _parse_requests(trace_path, trace_type):
+        count = counts.get(request.key, 0) + 1
+        counts[request.key] = count
+        if count == 2:
+            indexes.append(request.index)
+    return np.asarray(indexes, dtype=np.int64)
+
+
+def _compute_repeated_keys(trace_path, trace_type):
+    """
+    :return: set of the keys requested more than once
+    """
+    seen = set()
+    repeated = set()
+    for request in _parse_requests(trace_path, trace_type):
+        if request.key in seen:
+            repeated.add(request.key)
+        else:
+            seen.add(request.key)
+    return repeated
+
+
+def _save_numpy(value, dest):
+    import numpy as np
+    np.save(dest, value, allow_pickle=False)
+
+
+def _load_numpy(file):
+    import numpy as np
+    return np.load(file, allow_pickle=False)
+
+
+def _save_pickle(value, dest):
+    pickle.dump(value, dest, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+# file artifacts: name -> {"version", "suffix", "build": fn(trace_path, binary file)}, handed out as paths
+# value artifacts: name -> {"version", "suffix", "compute": fn(trace_path, trace_type), "save", "load"},
+# handed out as values; file artifacts are built from string traces
+_name_to_artifact = {
+    "binary": {"version": 1, "suffix": ".bin", "build": _build_binary, "trace_type": "binary"},
+    "bin_arr": {"version": 1, "suffix": ".binarr", "build": _build_bin_arr, "trace_type": "bin_arr"},
+    "pickle": {"version": 1, "suffix": ".pkl", "build": _build_pickle, "trace_type": "pickle"},
+    "block": {"version": 1, "suffix": ".blk", "build": _build_block, "trace_type": "block"},
+    "first_occurrence": {"version": 1, "suffix": ".npy", "compute": _compute_first_occurrence,
+                         "save": _save_numpy, "load": _load_numpy},
+    "second_occurrence": {"version": 1, "suffix": ".npy", "compute": _compute_second_occurrence,
+                          "save": _save_numpy, "load": _load_numpy},
+    "repeated_keys": {"version": 1, "suffix": ".pkl", "compute": _compute_repeated_keys,
+                      "save": _save_pickle, "load": pickle.load},
+}
+
+# trace type -> file artifact converting a string trace to it
+TRACE_TYPE_ARTIFACTS = {
+    spec["trace_type"]: name for name, spec in _name_to_artifact.items() if "trace_type" in spec
+}
+
+
+class ArtifactCache:
+    def __init__(self, cache_dir, budget_bytes=None, lock_timeout=3600):
+        self.cache_dir = cache_dir
+        self.budget_bytes = budget_bytes
+        self.lock_timeout = lock_timeout
+        os.makedirs(f"{cache_dir}/fingerprints", exist_ok=True)
+
+    def fingerprint(self, trace_path):
+        """
+        :return: hex blake2b digest of the trace content
+        """
+        stat = os.stat(trace_path)
+        memo_key = hashlib.blake2s(
+            f"{os.path.realpath(trace_path)}|{stat.st_size}|{stat.st_mtime_ns}|{stat.st_ino}".encode()
+        ).hexdigest()
+        memo_path = f"{self.cache_dir}/fingerprints/{memo_key}"
+        try:
+            with open(memo_path) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            pass
+        h = hashlib.blake2b(digest_size=20)
+        with open(trace_path, "rb") as f:
+            chunk = f.read(_HASH_CHUNK_SIZE)
+            while chunk:
+                h.update(chunk)
+                chunk = f.read(_HASH_CHUNK_SIZE)
+        fingerprint = h.hexdigest()
+        self._write_atomic(memo_path, lambda f: f.write(fingerprint.encode()))
+        return fingerprint
+
+    def _artifact_path(self, trace_path, name):
+        spec = _name_to_artifact[name]
+        fingerprint = self.fingerprint(trace_path)
+        return f"{self.cache_dir}/{fingerprint[:2]}/{fingerprint}.{name}.v{spec['version']}{spec['suffix']}"
+
+    def _write_atomic(self, path, write):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                write(f)
+            os.rename(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _ensure(self, trace_path, name, trace_type="string"):
+        """
+        :return: path of the artifact file, built first if missing
+        """
+        spec = _name_to_artifact[name]
+        path = self._artifact_path(trace_path, name)
+        if os.path.exists(path):
+            os.utime(path, None)
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lock_path = f"{path}.lock"
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                # another process is building it
+                if os.path.exists(path):
+                    os.utime(path, None)
+                    return path
+                try:
+                    if time.time() - os.stat(lock_path).st_mtime > self.lock_timeout:
+                        os.remove(lock_path)
+                except FileNotFoundError:
+                    pass
+                time.sleep(1)
+        try:
+            if not os.path.exists(path):
+                if "build" in spec:
+                    self._write_atomic(path, lambda f: spec["build"](trace_path, f))
+                else:
+                    value = spec["compute"](trace_path, trace_type)
+                    self._write_atomic(path, lambda f: spec["save"](value, f))
+        finally:
+            os.remove(lock_path)
+        self.evict(keep=path)
+        return path
+
+    def path(self, trace_path, name):
+        """
+        :return: path of a file artifact, e.g. the "block" conversion of a string trace
+        """
+        assert "build" in _name_to_artifact[name], f"{name} is not a file artifact"
+        return self._ensure(trace_path, name)
+
+    def load(self, trace_path, name, trace_type="string"):
+        """
+        :return: value of a value artifact, e.g. "second_occurrence"
+        """
+        spec = _name_to_artifact[name]
+        assert "compute" in spec, f"{name} is not a value artifact"
+        with open(self._ensure(trace_path, name, trace_type), "rb") as f:
+            return spec["load"](f)
+
+    def entries(self):
+        """
+        :return: list of (last use, size, path), least recently used first
+        """
+        entries = []
+        for directory in os.listdir(self.cache_dir):
+            if directory == "fingerprints" or not os.path.isdir(f"{self.cache_dir}/{directory}"):
+                continue
+            for filename in os.listdir(f"{self.cache_dir}/{directory}"):
+                if filename.endswith(".tmp") or filename.endswith(".lock"):
+                    continue
+                path = f"{self.cache_dir}/{directory}/{filename}"
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        return entries
+
+    def evict(self, keep=None):
+        """
+        Deletes least recently used artifacts until the cache fits the budget.
+        :return: bytes freed
+        """
+        if self.budget_bytes is None:
+            return 0
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        for _, size, path in entries:
+            if total - freed <= self.budget_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                freed += size
+            except FileNotFoundError:
+                pass
+        return freed
+
+
+def default_cache():
+    """
+    :return: ArtifactCache configured by the environment, None when ARTIFACT_CACHE_DIRECTORY is unset
+    """
+    cache_dir = os.environ.get(ARTIFACT_CACHE_DIRECTORY)
+    if not cache_dir:
+        return None
+    budget = os.environ.get(ARTIFACT_CACHE_BUDGET)
+    return ArtifactCache(cache_dir, int(budget) if budget else None)
+
+
+def load_or_compute(trace_path, name, trace_type="string"):
+    """
+    Value artifact through the default cache, computed without storing when no cache is configured.
+    """
+    cache = default_cache()
+    if cache is None:
+        return _name_to_artifact[name]["compute"](trace_path, trace_type)
+    return cache.load(trace_path, name, trace_type)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="build artifacts of a string trace")
+    build_parser.add_argument('traceFile')
+    build_parser.add_argument('artifacts', nargs='+', choices=sorted(_name_to_artifact.keys()))
+    fingerprint_parser = subparsers.add_parser("fingerprint")
+    fingerprint_parser.add_argument('traceFile')
+    subparsers.add_parser("list")
+    subparsers.add_parser("evict")
+    args = parser.parse_args()
+
+    cache = default_cache()
+    if cache is None:
+        raise SystemExit(f"set {ARTIFACT_CACHE_DIRECTORY}")
+    if args.command == "build":
+        for artifact in args.artifacts:
+            start = time.time()
+            path = cache._ensure(args.traceFile, artifact)
+            print(f"{artifact}: {path} ({time.time() - start:.2f} s)")
+    elif args.command == "fingerprint":
+        print(cache.fingerprint(args.traceFile))
+    elif args.command == "list":
+        for last_use, size, path in cache.entries():
+            print(f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(last_use))} {size:>14} {path}")
+    else:
+        print(f"freed {cache.evict()} bytes")
@@ -3,38 +3,34 @@ import json
 
 import os
 
-from filters import BloomFilter, SetFilter, SetFilterArgs, BloomFilterArgs
+from artifact_cache import load_or_compute
+from filters import BloomFilter, BloomFilterArgs
 from traces import initialize_iterator, DEFAULT_TRACE_TYPE
 
 
 def run_experiment(trace_dir, trace_file, n, result_dir):
     trace_file_path = f"{trace_dir}/{trace_file}"
     bloom_filter = BloomFilter(BloomFilterArgs(n))
-    set_filter = SetFilter(SetFilterArgs())
     trace_iterator = initialize_iterator(DEFAULT_TRACE_TYPE, trace_file_path)
+    # A set filter passes exactly the requests that are not the first for their key.
+    first_occurrence = load_or_compute(trace_file_path, "first_occurrence")
+    non_one_hit_wonder = load_or_compute(trace_file_path, "repeated_keys")
+    unique_key_count = int(first_occurrence.sum())
+    non_one_hit_wonder_count = len(first_occurrence) - unique_key_count
 
     bloom_filter_false_positives = set()  # contains false positives for one hit wonders and non one hit wonders
-    unique_keys = set()
     false_positive_count = 0
-    non_one_hit_wonder = set()
-    non_one_hit_wonder_count = 0
     # Set filter filters both one hit wonders and non one hit wonders on their initial request.
     # If Bloom filter has a false positive, the false positive can be a one hit wonder or a non one hit wonder.
     #   since at the time of filtering, the request may have been the first for the non one hit wonder that passes.
 
-    for request in trace_iterator:
-        should_filter_set = set_filter.should_filter(request)
+    for request, should_filter_set in zip(trace_iterator, first_occurrence.tolist()):
         should_filter_bloom = bloom_filter.should_filter(request)
         if not should_filter_bloom and should_filter_set:
             bloom_filter_false_positives.add(request.key)
             false_positive_count += 1
 
-        if not should_filter_set:  # at least second time key is seen.
-            non_one_hit_wonder.add(request.key)
-            non_one_hit_wonder_count += 1
-        unique_keys.add(request.key)
-
-    true_negative_count = len(unique_keys)  # The only true negatives are the initial time a key is seen.
+    true_negative_count = unique_key_count  # The only true negatives are the initial time a key is seen.
     # false_positive_object_rate: fp unique objects / (fp unique objects + tn unique objects).
     #                             tn unique objects is the entire unique object set.
     # false_positive_request_rate: shows the false positive rate of bloom filter compared to using a hash set
@@ -44,8 +40,8 @@ def run_experiment(trace_dir, trace_file, n, result_dir):
         "trace_file": trace_iterator.trace_filename,
         "n": n,
         "total_request_count": trace_iterator.total_count,
-        "total_object_count": len(unique_keys),
-        "one_hit_wonder_object_count": len(unique_keys) - len(non_one_hit_wonder),
+        "total_object_count": unique_key_count,
+        "one_hit_wonder_object_count": unique_key_count - len(non_one_hit_wonder),
         "non_one_hit_wonder_request_count": non_one_hit_wonder_count,
         "non_one_hit_wonder_object_count": len(non_one_hit_wonder),
         "false_positive_request_count": false_positive_count,
@@ -4,23 +4,13 @@ import json
 import os
 
 import settings
+from artifact_cache import load_or_compute
 from caches import initialize_cache
 from caching_system import CachingSystem
+from event_sink import HitBitmap, bitmap_of, bitmap_count_and_bytes
 from filters import initialize_filter, SetFilter, SetFilterArgs, BloomFilter, BloomFilterArgs
 from simulation import Simulation
-from traces import DEFAULT_TRACE_TYPE, initialize_iterator, CacheRequest
-
-
-class Callback:
-    def __init__(self):
-        self.hit = {}
-        self.total_hit_count = 0
-        self.total_byte_hit_size = 0
-
-    def on_hit_callback(self, request: CacheRequest):
-        self.hit[request.index] = request.size
-        self.total_hit_count += 1
-        self.total_byte_hit_size += request.size
+from traces import DEFAULT_TRACE_TYPE, initialize_iterator
 
 
 def run_simulation(cache_type, cache_size, trace_type, file_path, n, result_dir):
@@ -35,42 +25,36 @@ def run_simulation(cache_type, cache_size, trace_type, file_path, n, result_dir)
 
     trace_iterator_1 = initialize_iterator(trace_type, file_path)
     trace_iterator_2 = initialize_iterator(trace_type, file_path)
-    set_callback_container = Callback()
-    bloom_callback_container = Callback()
-    set_simulation = Simulation(set_filter_caching_stack, trace_iterator_1, 1000000, 600,
-                                on_hit_callback=set_callback_container.on_hit_callback)
-    bloom_simulation = Simulation(bloom_filter_caching_stack, trace_iterator_2, 1000000, 600,
-                                  on_hit_callback=bloom_callback_container.on_hit_callback)
+    set_hits = HitBitmap()
+    bloom_hits = HitBitmap()
+    set_simulation = Simulation(set_filter_caching_stack, trace_iterator_1, 1000000, 600)
+    set_simulation.subscribe(set_hits)
+    bloom_simulation = Simulation(bloom_filter_caching_stack, trace_iterator_2, 1000000, 600)
+    bloom_simulation.subscribe(bloom_hits)
 
-    trace_iterator_3 = iter(initialize_iterator(trace_type, file_path))
-    tracking_set_filter = SetFilter(SetFilterArgs())
     # when the second time a key is seen, if the caching_system.get returns True, it's a surprise hit.
-    second_occurence_keys = set()
-    key_seen_second_time_index = set()
     set_simulation.run()
     bloom_simulation.run()
-    for request in trace_iterator_3:
-        if not tracking_set_filter.should_filter(request) and request.key not in second_occurence_keys:
-            key_seen_second_time_index.add(request.index)
-            second_occurence_keys.add(request.key)
-
-    bloom_hit_request_indexes = set(bloom_callback_container.hit.keys())
-    set_hit_request_indexes = set(set_callback_container.hit.keys())
-    unique_bloom_hit_request_indexes = bloom_hit_request_indexes - set_hit_request_indexes
-    common_hit_request_indexes = bloom_hit_request_indexes.intersection(set_hit_request_indexes)
-    common_hit_request_bytes = sum([bloom_callback_container.hit[k] for k in common_hit_request_indexes])
-
-    bloom_at_second_hit_keys = unique_bloom_hit_request_indexes.intersection(key_seen_second_time_index)
-    bloom_at_second_hit_bytes = sum([bloom_callback_container.hit[k] for k in bloom_at_second_hit_keys])
-    unique_bloom_hit_request_bytes = sum([bloom_callback_container.hit[k] for k in unique_bloom_hit_request_indexes])
+    sizes = bloom_hits.sizes
+    key_seen_second_time = bitmap_of(load_or_compute(file_path, "second_occurrence", trace_type), len(sizes))
+
+    bloom_hit = bloom_hits.bitmap()
+    set_hit = set_hits.bitmap()
+    unique_bloom_hit = bloom_hit & ~set_hit
+    total_bloom_hit_count, total_bloom_hit_bytes = bitmap_count_and_bytes(bloom_hit, sizes)
+    unique_bloom_hit_request_count, unique_bloom_hit_request_bytes = bitmap_count_and_bytes(unique_bloom_hit, sizes)
+    common_hit_request_count, common_hit_request_bytes = bitmap_count_and_bytes(bloom_hit & set_hit, sizes)
+    bloom_at_second_hit_count, bloom_at_second_hit_bytes = bitmap_count_and_bytes(
+        unique_bloom_hit & key_seen_second_time, sizes
+    )
     res = {
-        "total_bloom_hit_count": len(bloom_hit_request_indexes),
-        "total_bloom_hit_bytes": bloom_callback_container.total_byte_hit_size,
-        "unique_bloom_hit_request_count": len(unique_bloom_hit_request_indexes),
+        "total_bloom_hit_count": total_bloom_hit_count,
+        "total_bloom_hit_bytes": total_bloom_hit_bytes,
+        "unique_bloom_hit_request_count": unique_bloom_hit_request_count,
         "unique_bloom_hit_request_bytes": unique_bloom_hit_request_bytes,
-        "common_hit_request_count": len(common_hit_request_indexes),
+        "common_hit_request_count": common_hit_request_count,
         "common_hit_request_bytes": common_hit_request_bytes,
-        "bloom_at_second_hit_request_count": len(bloom_at_second_hit_keys),
+        "bloom_at_second_hit_request_count": bloom_at_second_hit_count,
         "bloom_at_second_hit_request_bytes": bloom_at_second_hit_bytes,
     }
 
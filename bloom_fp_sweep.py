@@ -0,0 +1,191 @@
+"""
+bloom_filter_fp_experiment for many Bloom filters in one pass over the trace.
+The trace is read once into dense key ids, an occurrence tracker marks the first and second request of
+every key in key id bitmaps, and every (n, error rate) lane replays filters.BloomFilter's rotating pair of
+filters over the key ids with probe tables derived from hashes computed once per key.
+Lanes run as Numba kernels when Numba is installed and as plain Python otherwise.
+The pass is not streaming: lanes replay the trace arrays one after the other, so memory peaks at
+17 bytes per request (size, key id, occurrence) plus, per unique key, the key, its two hashes and the
+8 * k byte probe table of the lane being run, k being the number of probes (10 at error rate 0.001).
+
+Besides the fields of bloom_filter_fp_experiment every row counts the requests a Set filter passes but the
+Bloom filter filters again because the key was rotated out ("refiltered").
+"""
+import argparse
+import csv
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+from accelerated import NUMBA_AVAILABLE, njit, load_trace_arrays, bloom_key_hashes, bloom_probe_table, \
+    BLOOM_ERROR_RATE
+from traces import initialize_iterator, DEFAULT_TRACE_TYPE
+
+FIRST_OCCURRENCE = 1
+SECOND_OCCURRENCE = 2
+
+# lane statistics
+_FALSE_POSITIVE_COUNT = 0
+_FALSE_POSITIVE_BYTES = 1
+_REFILTERED_COUNT = 2
+_REFILTERED_BYTES = 3
+_REFILTERED_SECOND_COUNT = 4
+_STAT_COUNT = 5
+
+
+def _track_occurrences(key_ids, key_count):
+    """
+    :return: (numpy.ndarray(uint8) with FIRST_OCCURRENCE/SECOND_OCCURRENCE per request, 0 for later ones,
+              bitmap of the keys requested more than once)
+    """
+    key_words = (key_count + 63) >> 6
+    seen = np.zeros(key_words, dtype=np.uint64)
+    repeated = np.zeros(key_words, dtype=np.uint64)
+    occurrence = np.zeros(len(key_ids), dtype=np.uint8)
+    for r in range(len(key_ids)):
+        key = key_ids[r]
+        word = key >> 6
+        bit = np.uint64(1) << np.uint64(key & 63)
+        if seen[word] & bit == 0:
+            seen[word] |= bit
+            occurrence[r] = FIRST_OCCURRENCE
+        elif repeated[word] & bit == 0:
+            repeated[word] |= bit
+            occurrence[r] = SECOND_OCCURRENCE
+    return occurrence, repeated
+
+
+def _bloom_lane(key_ids, sizes, occurrence, probes, n, words, key_words):
+    """
+    Runs filters.BloomFilter.should_filter for every request.
+    :return: (numpy.ndarray(int64) of lane statistics, bitmap of the keys with a false positive)
+    """
+    bits = np.zeros((2, words), dtype=np.uint32)
+    current = 0
+    i = 0
+    false_positive_keys = np.zeros(key_words, dtype=np.uint64)
+    stats = np.zeros(_STAT_COUNT, dtype=np.int64)
+    for r in range(len(key_ids)):
+        key = key_ids[r]
+        exists = False
+        for f in range(2):
+            in_filter = True
+            for j in range(probes.shape[1]):
+                bit = probes[key, j]
+                if (bits[f, bit >> 5] & np.uint32(1 << (bit & 31))) == 0:
+                    in_filter = False
+                    break
+            if in_filter:
+                exists = True
+                break
+        if exists:
+            # passed, a Set filter filters the first request of a key
+            if occurrence[r] == FIRST_OCCURRENCE:
+                stats[_FALSE_POSITIVE_COUNT] += 1
+                stats[_FALSE_POSITIVE_BYTES] += sizes[r]
+                false_positive_keys[key >> 6] |= np.uint64(1) << np.uint64(key & 63)
+            continue
+        if occurrence[r] != FIRST_OCCURRENCE:
+            stats[_REFILTERED_COUNT] += 1
+            stats[_REFILTERED_BYTES] += sizes[r]
+            if occurrence[r] == SECOND_OCCURRENCE:
+                stats[_REFILTERED_SECOND_COUNT] += 1
+        if i > n:
+            i = 0
+            current = 1 - current
+            bits[current, :] = 0
+        for j in range(probes.shape[1]):
+            bit = probes[key, j]
+            bits[current, bit >> 5] |= np.uint32(1 << (bit & 31))
+        i += 1
+    return stats, false_positive_keys
+
+
+if NUMBA_AVAILABLE:
+    _track_occurrences = njit(cache=True, nogil=True)(_track_occurrences)
+    _bloom_lane = njit(cache=True, nogil=True)(_bloom_lane)
+
+
+def _popcount(bitmap):
+    return int(np.unpackbits(bitmap.view(np.uint8)).sum())
+
+
+def run_sweep(trace_iterator, ns, error_rates=(BLOOM_ERROR_RATE,)):
+    """
+    :return: list of rows, one per (n, error rate), with the fields of bloom_filter_fp_experiment
+    """
+    sizes, key_ids, keys = load_trace_arrays(trace_iterator)
+    key_count = len(keys)
+    occurrence, repeated = _track_occurrences(key_ids, key_count)
+    hashes = bloom_key_hashes(keys)
+
+    total_request_count = len(key_ids)
+    unique_key_count = key_count
+    non_one_hit_wonder_object_count = _popcount(repeated)
+    # the only true negatives are the first requests of keys
+    true_negative_count = unique_key_count
+    rows = []
+    for error_rate in error_rates:
+        for n in ns:
+            probes, words = bloom_probe_table(keys, n, error_rate, hashes)
+            stats, false_positive_keys = _bloom_lane(
+                key_ids, sizes, occurrence, probes, n, words, len(repeated)
+            )
+            false_positive_count = int(stats[_FALSE_POSITIVE_COUNT])
+            false_positive_object_count = _popcount(false_positive_keys)
+            non_one_hit_wonder_pass_object_count = _popcount(false_positive_keys & repeated)
+            rows.append({
+                "trace_file": trace_iterator.trace_filename,
+                "n": n,
+                "error_rate": error_rate,
+                # both filters of the rotating pair
+                "filter_bytes": 2 * words * 4,
+                "num_probes_k": probes.shape[1],
+                "total_request_count": total_request_count,
+                "total_object_count": unique_key_count,
+                "one_hit_wonder_object_count": unique_key_count - non_one_hit_wonder_object_count,
+                "non_one_hit_wonder_request_count": total_request_count - unique_key_count,
+                "non_one_hit_wonder_object_count": non_one_hit_wonder_object_count,
+                "false_positive_request_count": false_positive_count,
+                "false_positive_request_bytes": int(stats[_FALSE_POSITIVE_BYTES]),
+                "false_positive_object_count": false_positive_object_count,
+                "false_positive_request_rate": false_positive_count / (false_positive_count + true_negative_count),
+                "false_positive_object_rate": false_positive_object_count / (
+                        false_positive_object_count + true_negative_count),
+                "one_hit_wonder_pass_object_count":
+                    false_positive_object_count - non_one_hit_wonder_pass_object_count,
+                "non_one_hit_wonder_pass_object_count": non_one_hit_wonder_pass_object_count,
+                "refiltered_request_count": int(stats[_REFILTERED_COUNT]),
+                "refiltered_request_bytes": int(stats[_REFILTERED_BYTES]),
+                "refiltered_second_occurrence_count": int(stats[_REFILTERED_SECOND_COUNT]),
+            })
+    return rows
+
+
+def write_rows(rows, output_prefix):
+    with open(f"{output_prefix}.json", "w") as f:
+        json.dump(rows, f, sort_keys=True, indent=4)
+    with open(f"{output_prefix}.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('traceFile')
+    parser.add_argument('--n', nargs='+', type=int, required=True)
+    parser.add_argument('--errorRate', nargs='+', type=float, default=[BLOOM_ERROR_RATE], dest='errorRate',
+                        help=f"filters.BloomFilter uses {BLOOM_ERROR_RATE}")
+    parser.add_argument('--traceType', default=DEFAULT_TRACE_TYPE, dest='traceType')
+    args = parser.parse_args()
+
+    trace_dir = os.environ["TRACE_DIRECTORY"]
+    result_dir = os.environ["BLOOM_FP_RESULT_DIRECTORY"]
+
+    start_time = datetime.now()
+    rows = run_sweep(initialize_iterator(args.traceType, f"{trace_dir}/{args.traceFile}"), args.n, args.errorRate)
+    write_rows(rows, f"{result_dir}/{args.traceFile}_bloomfp_sweep")
+    print(f"{len(rows)} filters in {(datetime.now() - start_time).total_seconds():.2f} s")
@@ -0,0 +1,174 @@
+"""
+In-process stand-in for a memcached server, speaking the text protocol subset the replay client uses:
+get (one or more keys), set, delete and quit.
+"""
+import asyncio
+
+from traces import CacheRequest
+
+
+_zeros = memoryview(bytearray(1 << 20))
+
+
+def zero_payload(size):
+    """
+    :return: memoryview of `size` zero bytes, sliced from a shared buffer
+    """
+    global _zeros
+    if size > len(_zeros):
+        _zeros = memoryview(bytearray(max(size, 2 * len(_zeros))))
+    return _zeros[:size]
+
+
+def parse_key(key: bytes):
+    try:
+        return int(key)
+    except ValueError:
+        return key.decode()
+
+
+class CacheServer:
+    """
+    Serves a CachingSystem over the memcached text protocol.
+    Values are not stored: a hit returns zero bytes of the size last set for the key, a set only admits
+    a CacheRequest of the payload size through the filter and answers NOT_STORED when filtered.
+    Requests are numbered in arrival order. ts_of(raw key) gives the ts of the request for a key, e.g. the
+    trace ts a replay client issued it at (see replay_client.replay_against_stand_in); without it requests
+    are stamped with seconds since the server started.
+    """
+
+    def __init__(self, caching_system, ts_of=None):
+        self.caching_system = caching_system
+        self._ts_of = ts_of
+        self._sizes = {}
+        self._request_count = 0
+        self._server = None
+        self._start_time = None
+
+    def describe(self):
+        """
+        :return: the cache and filter fields of Simulation.get_state
+        """
+        cache_instance = self.caching_system.cache_instance
+        filter_instance = self.caching_system.filter_instance
+        return {
+            "cache_type": str(cache_instance),
+            "cache_args": dict(cache_instance.args._asdict()),
+            "cache_id": cache_instance.id,
+            "cache_size": cache_instance.capacity,
+            "filter_type": str(filter_instance),
+            "filter_args": dict(filter_instance.args._asdict()),
+            "filter_id": filter_instance.id,
+        }
+
+    async def start(self, host="127.0.0.1", port=0):
+        """
+        :return: (host, port) the server listens on, port 0 picks a free one
+        """
+        loop = asyncio.get_running_loop()
+        self._start_time = loop.time()
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    def _request(self, raw_key, key, size):
+        if self._ts_of is not None:
+            ts = self._ts_of(raw_key)
+        else:
+            ts = int(asyncio.get_running_loop().time() - self._start_time)
+        request = CacheRequest(key, size, ts, self._request_count)
+        self._request_count += 1
+        return request
+
+    def _get(self, writer, raw_key):
+        key = parse_key(raw_key)
+        size = self._sizes.get(key)
+        if size is None or self.caching_system.get(self._request(raw_key, key, size)) is None:
+            return
+        writer.write(b"VALUE %s 0 %d\r\n" % (raw_key, size))
+        writer.write(zero_payload(size))
+        writer.write(b"\r\n")
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                parts = line.split()
+                if not parts:
+                    continue
+                command = parts[0]
+                if command == b"get" or command == b"gets":
+                    for raw_key in parts[1:]:
+                        self._get(writer, raw_key)
+                    writer.write(b"END\r\n")
+                elif command == b"set" and len(parts) >= 5:
+                    size = int(parts[4])
+                    remaining = size + 2
+                    while remaining:
+                        chunk = await reader.read(min(remaining, 1 << 20))
+                        if not chunk:
+                            raise ConnectionResetError
+                        remaining -= len(chunk)
+                    key = parse_key(parts[1])
+                    self._sizes[key] = size
+                    if self.caching_system.put(self._request(parts[1], key, size)) is False:
+                        reply = b"NOT_STORED\r\n"
+                    else:
+                        reply = b"STORED\r\n"
+                    if b"noreply" not in parts[5:]:
+                        writer.write(reply)
+                elif command == b"delete" and len(parts) >= 2:
+                    key = parse_key(parts[1])
+                    removed = self._sizes.pop(key, None) is not None
+                    try:
+                        removed = self.caching_system.cache_instance._remove(key) is not None or removed
+                    except NotImplementedError:
+                        # still a miss from now on, its size is forgotten
+                        pass
+                    writer.write(b"DELETED\r\n" if removed else b"NOT_FOUND\r\n")
+                elif command == b"quit":
+                    break
+                else:
+                    writer.write(b"ERROR\r\n")
+                await writer.drain()
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from caches import initialize_cache
+    from caching_system import CachingSystem
+    from filters import initialize_filter
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('cacheType')
+    parser.add_argument('cacheSize', type=int)
+    parser.add_argument('--filterType', default="Null", dest='filterType')
+    parser.add_argument('--filterArgs', default="{}")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', default=11211, type=int)
+    args = parser.parse_args()
+
+    async def main():
+        server = CacheServer(CachingSystem(
+            initialize_filter(args.filterType, **json.loads(args.filterArgs)),
+            initialize_cache(args.cacheType, args.cacheSize)
+        ))
+        host, port = await server.start(args.host, args.port)
+        print(f"serving {server.caching_system} on {host}:{port}")
+        await server.serve_forever()
+
+    asyncio.run(main())
@@ -1,12 +1,21 @@
 import hashlib
+import random
+from array import array
 from abc import ABC, abstractmethod
 from enum import IntEnum
 from heapq import heappush, heappop
 from logging import Logger
 from typing import NewType, Optional, NamedTuple
-from collections import OrderedDict, namedtuple, defaultdict
+from collections import OrderedDict, namedtuple, defaultdict, deque
+
+import plugins
+from timing_wheel import HierarchicalTimingWheel
 from traces import CacheRequest
-from sortedcontainers import SortedDict
+
+futures = plugins.lazy_import("concurrent.futures")
+learned_model = plugins.lazy_import("learned_model")
+np = plugins.lazy_import("numpy")
+sortedcontainers = plugins.lazy_import("sortedcontainers")
 
 
 class CacheState(IntEnum):
@@ -15,6 +24,8 @@ class CacheState(IntEnum):
 
 
 class CacheObject:
+    __slots__ = ("key", "size", "ts", "index", "frequency")
+
     def __init__(self, key, size, ts, index):
         self.key = key
         self.size = size
@@ -36,7 +47,11 @@ class BaseCache(ABC):
         self.args: NamedTuple = args
         self.curr_capacity = 0
         self.eviction_logger: Logger = None
+        self.eviction_sink = None
         self.eviction_fn = self._evict_without_logging
+        self.expiry: Optional[HierarchicalTimingWheel] = None
+        self.expired_count = 0
+        self.last_get_expired = False
 
     def __repr__(self):
         return f"{self.__class__.__name__}({self.capacity},{self.args})"
@@ -65,17 +80,102 @@ class BaseCache(ABC):
         self.eviction_logger.info(obj.as_log(request))
         return obj
 
+    def set_eviction_sink(self, sink):
+        """
+        :param sink: eviction_log.EvictionLogWriter
+        """
+        self.eviction_sink = sink
+        self.eviction_fn = self._evict_with_sink
+
+    def _evict_with_sink(self, request):
+        obj = self._evict()
+        self.eviction_sink.write(obj, request)
+        return obj
+
     def _evict_without_logging(self, request):
         obj = self._evict()
         return obj
 
+    def enable_expiry(self, tick=1, default_ttl=None, slots=256, levels=4, expired_keys_limit=1 << 20):
+        """
+        Expires objects request.ttl (or default_ttl when the request has none) trace ts units after
+        admission, at most one tick late. Expired objects are removed through a timing wheel
+        driven by request.ts, and get() sets last_get_expired on a miss caused by expiry.
+        Only the last expired_keys_limit expired keys are remembered, a miss on a key that expired before
+        them is not reported as expired.
+        """
+        self.expiry = HierarchicalTimingWheel(slots=slots, levels=levels)
+        self._expiry_tick = tick
+        self._default_ttl = default_ttl
+        self._expire_at = {}
+        self._expired_keys = OrderedDict()
+        self._expired_keys_limit = expired_keys_limit
+
+    def _expire(self, request):
+        expired_keys = self._expired_keys
+        for expire_tick, key in self.expiry.advance(request.ts // self._expiry_tick):
+            if self._expire_at.get(key) == expire_tick:
+                del self._expire_at[key]
+                if self._remove(key) is not None:
+                    self.expired_count += 1
+                    expired_keys[key] = None
+                    if len(expired_keys) > self._expired_keys_limit:
+                        expired_keys.popitem(last=False)
+
+    def _get_with_expiry(self, request: CacheRequest) -> Optional[CacheObject]:
+        self._expire(request)
+        obj = self._get(request)
+        if obj:
+            obj.touch()
+            self.last_get_expired = False
+            return obj
+        self.last_get_expired = self._expired_keys.pop(request.key, False) is None
+        return None
+
+    def _admit_with_expiry(self, request: CacheRequest) -> Optional[bool]:
+        admitted = self._admit(request)
+        if admitted is False:
+            # an earlier timer still covers any copy cached before the rejection
+            return False
+        # pickled traces written before CacheRequest.ttl existed have no ttl attribute
+        ttl = getattr(request, "ttl", None)
+        if ttl is None:
+            ttl = self._default_ttl
+        if ttl is None:
+            self._expire_at.pop(request.key, None)
+            return admitted
+        expire_tick = -(-(request.ts + ttl) // self._expiry_tick)
+        self._expire_at[request.key] = expire_tick
+        self.expiry.schedule(request.key, expire_tick)
+        return admitted
+
+    def _remove(self, key) -> Optional[CacheObject]:
+        """
+        Removes the object without counting it as an eviction.
+        :return: the removed object, None if key is not cached
+        """
+        raise NotImplementedError(f"{self} does not support removal")
+
+    def cached_objects(self):
+        """
+        :return: iterable of the cached CacheObjects
+        """
+        raise NotImplementedError(f"{self} does not list its objects")
+
     def evict(self, request: CacheRequest) -> Optional[CacheObject]:
         return self.eviction_fn(request)
 
-    def admit(self, request: CacheRequest) -> None:
-        self._admit(request)
+    def admit(self, request: CacheRequest) -> Optional[bool]:
+        """
+        :return: False if the cache rejected the request
+        """
+        if self.expiry is not None:
+            return self._admit_with_expiry(request)
+        return self._admit(request)
 
     def get(self, request: CacheRequest) -> Optional[CacheObject]:
+        if self.expiry is not None:
+            return self._get_with_expiry(request)
         obj = self._get(request)
         if obj:
             obj.touch()
@@ -83,6 +183,30 @@ class BaseCache(ABC):
         else:
             return None
 
+    def get_batch(self, keys, sizes, request: CacheRequest) -> list:
+        """
+        Looks up several keys on behalf of one request, e.g. the chunks of a range request.
+        last_get_expired is set when any of the keys missed because of expiry.
+        This default makes one get call per key, LRUCache overrides it with a single loop over its map.
+        :return: positions in keys that missed
+        """
+        missing = []
+        any_expired = False
+        ttl = getattr(request, "ttl", None)
+        tenant = getattr(request, "tenant", None)
+        for i, (key, size) in enumerate(zip(keys, sizes)):
+            if self.get(CacheRequest(key, size, request.ts, request.index, ttl, tenant=tenant)) is None:
+                missing.append(i)
+                any_expired = any_expired or self.last_get_expired
+        self.last_get_expired = any_expired
+        return missing
+
+    def admit_batch(self, keys, sizes, request: CacheRequest) -> None:
+        ttl = getattr(request, "ttl", None)
+        tenant = getattr(request, "tenant", None)
+        for key, size in zip(keys, sizes):
+            self.admit(CacheRequest(key, size, request.ts, request.index, ttl, tenant=tenant))
+
     @abstractmethod
     def _evict(self) -> CacheObject:
         """
@@ -143,6 +267,47 @@ class LRUCache(BaseCache):
         self.map.move_to_end(request.key)
         return True
 
+    def _remove(self, key):
+        obj = self.map.pop(key, None)
+        if obj is not None:
+            self.curr_capacity -= obj.size
+        return obj
+
+    def cached_objects(self):
+        return self.map.values()
+
+    def _is_plain_lru(self):
+        return self.expiry is None and type(self)._get is LRUCache._get
+
+    def get_batch(self, keys, sizes, request: CacheRequest) -> list:
+        if not self._is_plain_lru():
+            return super().get_batch(keys, sizes, request)
+        cache_map = self.map
+        move_to_end = cache_map.move_to_end
+        missing = []
+        for i, key in enumerate(keys):
+            obj = cache_map.get(key)
+            if obj is None:
+                missing.append(i)
+            else:
+                move_to_end(key)
+                obj.frequency += 1
+        return missing
+
+    def admit_batch(self, keys, sizes, request: CacheRequest) -> None:
+        if self.expiry is not None or type(self)._admit is not LRUCache._admit:
+            return super().admit_batch(keys, sizes, request)
+        cache_map = self.map
+        for key, size in zip(keys, sizes):
+            if size > self.capacity:
+                continue
+            while self.curr_capacity + size > self.capacity:
+                self.evict(request)
+            if key not in cache_map:
+                self.curr_capacity += size
+                cache_map[key] = CacheObject(key, size, request.ts, request.index)
+            cache_map.move_to_end(key)
+
     def pop(self, key):
         try:
             cache_obj = self.map.pop(key)
@@ -153,6 +318,144 @@ class LRUCache(BaseCache):
             return None
 
 
+FIFOArgs = namedtuple("FIFOArgs", [])
+
+
+class FIFOCache(BaseCache):
+    """
+    Evicts in admission order, hits do not reorder.
+    Objects need no identity here, so they live in array slots appended in admission order instead of one
+    CacheObject each; map holds the slot of every key. A removed object leaves a hole, skipped on eviction,
+    and the evicted prefix is compacted away once it is half of the slots.
+    get() and evict() return a CacheObject copy of the slot, which later calls do not change.
+    """
+
+    def __init__(self, capacity, args):
+        super().__init__(capacity, args)
+        self.map = {}
+        self._keys = []
+        self._sizes = array("q")
+        self._ts = array("q")
+        self._indexes = array("q")
+        self._frequencies = array("q")
+        self._head = 0
+
+    def _get(self, request: CacheRequest):
+        slot = self.map.get(request.key)
+        if slot is None:
+            return None
+        obj = self._object(slot)
+        # get() touches the copy, the slot counts the hit here
+        self._frequencies[slot] += 1
+        return obj
+
+    def _append(self, key, size, ts, index, frequency):
+        self.map[key] = len(self._keys)
+        self._keys.append(key)
+        self._sizes.append(size)
+        self._ts.append(ts)
+        self._indexes.append(index)
+        self._frequencies.append(frequency)
+
+    def _admit(self, request: CacheRequest):
+        if request.size > self.capacity:
+            return False
+
+        while self.curr_capacity + request.size > self.capacity:
+            self.evict(request)
+
+        slot = self.map.get(request.key)
+        if slot is None:
+            self.curr_capacity += request.size
+            self._append(request.key, request.size, request.ts, request.index, 1)
+        else:
+            # readmitting a cached key moves it to the back, as in LRUCache
+            self._keys[slot] = None
+            self._append(request.key, self._sizes[slot], self._ts[slot], self._indexes[slot],
+                         self._frequencies[slot])
+        return True
+
+    def _object(self, slot):
+        obj = CacheObject(self._keys[slot], self._sizes[slot], self._ts[slot], self._indexes[slot])
+        obj.frequency = self._frequencies[slot]
+        return obj
+
+    def _evict(self):
+        keys = self._keys
+        head = self._head
+        while keys[head] is None:
+            head += 1
+        obj = self._object(head)
+        keys[head] = None
+        del self.map[obj.key]
+        self.curr_capacity -= obj.size
+        self._head = head + 1
+        if self._head << 1 > len(keys):
+            self._compact()
+        return obj
+
+    def _compact(self):
+        head = self._head
+        del self._keys[:head]
+        for column in (self._sizes, self._ts, self._indexes, self._frequencies):
+            del column[:head]
+        self._head = 0
+        cache_map = self.map
+        for slot, key in enumerate(self._keys):
+            if key is not None:
+                cache_map[key] = slot
+
+    def _remove(self, key):
+        slot = self.map.pop(key, None)
+        if slot is None:
+            return None
+        obj = self._object(slot)
+        self._keys[slot] = None
+        self.curr_capacity -= obj.size
+        return obj
+
+    def cached_objects(self):
+        return [self._object(slot) for slot in self.map.values()]
+
+
+ClockArgs = namedtuple("ClockArgs", [])
+
+
+class ClockCache(LRUCache):
+    """
+    CLOCK as second chance FIFO: a hit sets the reference bit and eviction moves
+    referenced objects to the back of the queue, clearing their bit.
+    """
+
+    def __init__(self, capacity, args):
+        super().__init__(capacity, args)
+        self.referenced = set()
+
+    def _get(self, request: CacheRequest):
+        obj = self.map.get(request.key)
+        if obj is not None:
+            self.referenced.add(request.key)
+        return obj
+
+    def _evict(self):
+        while True:
+            key, obj = self.map.popitem(last=False)
+            if key not in self.referenced:
+                break
+            self.referenced.discard(key)
+            self.map[key] = obj
+        self.curr_capacity -= obj.size
+        return obj
+
+    def _remove(self, key):
+        self.referenced.discard(key)
+        return super()._remove(key)
+
+    def pop(self, key):
+        self.referenced.discard(key)
+        return super().pop(key)
+
+
 class SLRUArgs:
     def __init__(self, n=4, ratios=[0.25, 0.25, 0.25, 0.25]):
         self.n = n
@@ -175,6 +478,17 @@ class SLRUCache(BaseCache):
     def __repr__(self):
         return "S4LRU"
 
+    # a full segment evicts out of the cache in its own admit, so every segment logs its evictions
+    def set_eviction_logger(self, logger):
+        super().set_eviction_logger(logger)
+        for segment in self.segments:
+            segment.set_eviction_logger(logger)
+
+    def set_eviction_sink(self, sink):
+        super().set_eviction_sink(sink)
+        for segment in self.segments:
+            segment.set_eviction_sink(sink)
+
     def _set_capacity(self, capacity, ratios):
         for i, ratio in enumerate(ratios):
             self.segments[i].capacity = int(capacity * ratio)
@@ -189,15 +503,25 @@ class SLRUCache(BaseCache):
         return None
 
     def _admit(self, request):
-        self._segment_put(0, request)
+        return self._segment_put(0, request)
 
     def _evict(self):
         pass
 
+    def _remove(self, key):
+        for segment in self.segments:
+            obj = segment._remove(key)
+            if obj is not None:
+                return obj
+        return None
+
+    def cached_objects(self):
+        return [obj for segment in self.segments for obj in segment.cached_objects()]
+
     def _segment_put(self, i, request):
-        self.segments[i].admit(request)
+        admitted = self.segments[i].admit(request)
         if i == 0:
-            return
+            return admitted
 
         while self.segments[i].curr_capacity > self.segments[i].capacity:
             self._segment_put(i - 1, self.segments[i].evict(request))
@@ -207,17 +531,27 @@ GDSFArgs = namedtuple("GDSFArgs", [])
 
 
 class GreedyDualCacheObj(CacheObject):
-    def __init__(self, key, size, ts, index, priority):
+    __slots__ = ("priority", "order")
+
+    def __init__(self, key, size, ts, index, priority, order=0):
         super().__init__(key, size, ts, index)
         self.priority = priority
+        # admission sequence number of the current priority, ties are evicted oldest first
+        self.order = order
 
 
 class GDSFCache(BaseCache):
+    """
+    The queue is a SortedList of (priority, order, key) tuples, the smallest priority and within it the
+    oldest entry first.
+    """
+
     def __init__(self, capacity, args):
         super().__init__(capacity, args)
-        self._value_map = SortedDict()
+        self._queue = sortedcontainers.SortedList()
         self._cache_map = dict()
         self._current_l = 0
+        self._order = 0
 
     def _compute_priority(self, request):
         freq = self._cache_map[request.key].frequency
@@ -226,52 +560,634 @@ class GDSFCache(BaseCache):
     def _has(self, _id):
         return _id in self._cache_map
 
+    def _enqueue(self, obj, priority):
+        self._order += 1
+        obj.priority = priority
+        obj.order = self._order
+        self._queue.add((priority, self._order, obj.key))
+
     def _get(self, request: CacheRequest):
         obj = self._cache_map.get(request.key)
         if obj:
             new_priority = self._compute_priority(request)
-            key_dict = self._value_map[obj.priority]
-            del key_dict[request.key]
-            if len(key_dict) == 0:
-                del self._value_map[obj.priority]
-            self._value_map.setdefault(new_priority, OrderedDict())
-            self._value_map[new_priority][request.key] = 1
-            obj.priority = new_priority
+            self._queue.remove((obj.priority, obj.order, obj.key))
+            self._enqueue(obj, new_priority)
             return obj
         return None
 
     def _evict(self):
-        priority, key_dict = self._value_map.peekitem(0)  # item with smallest priority
-        key, _ = key_dict.popitem(last=False)  # item that was inserted the oldest
-        if len(key_dict) == 0:
-            del self._value_map[priority]
-        cache_obj = self._cache_map[key]
-        self.curr_capacity -= self._cache_map[key].size
+        priority, _, key = self._queue.pop(0)
+        cache_obj = self._cache_map.pop(key)
+        self.curr_capacity -= cache_obj.size
         self._current_l = priority
-        del self._cache_map[key]
         return cache_obj
 
+    def _remove(self, key):
+        obj = self._cache_map.pop(key, None)
+        if obj is None:
+            return None
+        self._queue.remove((obj.priority, obj.order, key))
+        self.curr_capacity -= obj.size
+        return obj
+
+    def cached_objects(self):
+        return self._cache_map.values()
+
     def _admit(self, request: CacheRequest):
         if request.size >= self.capacity:
             return False
-        self._cache_map[request.key] = GreedyDualCacheObj(
-            request.key, request.size, request.ts, request.index, 0
-        )
-        priority = self._compute_priority(request)
-        self._cache_map[request.key].priority = priority
-        self._value_map.setdefault(priority, OrderedDict())
-        self._value_map[priority][request.key] = 1
+        obj = GreedyDualCacheObj(request.key, request.size, request.ts, request.index, 0)
+        self._cache_map[request.key] = obj
+        self._enqueue(obj, self._compute_priority(request))
         self.curr_capacity += request.size
         while self.curr_capacity > self.capacity:
             self.evict(request)
         return True
 
 
+LFUArgs = namedtuple("LFUArgs", ["halving_interval"], defaults=[0])
+
+
+class _FrequencyBucket:
+    __slots__ = ("count", "objects", "prev", "next")
+
+    def __init__(self, count, prev, next):
+        self.count = count
+        # key -> LFUCacheObj in the order they entered the bucket
+        self.objects = OrderedDict()
+        self.prev = prev
+        self.next = next
+
+
+class LFUCacheObj(CacheObject):
+    __slots__ = ("bucket",)
+
+    def __init__(self, key, size, ts, index, bucket):
+        # assigned here rather than through CacheObject.__init__, admission is on the hot path
+        self.key = key
+        self.size = size
+        self.ts = ts
+        self.index = index
+        self.frequency = 1
+        self.bucket = bucket
+
+
+class LFUCache(BaseCache):
+    """
+    O(1) LFU: a doubly linked list of frequency buckets in increasing count order, every bucket holding its
+    objects in the order they entered it. A hit moves the object to the bucket of the next count, created
+    next to its own when missing (the only object of a bucket just bumps the bucket's count), and eviction
+    pops the oldest object of the first bucket.
+    The count is kept on the bucket, apart from CacheObject.frequency: every args.halving_interval requests
+    (0 never) the counts are halved, merging the buckets that end up with the same count.
+    """
+
+    def __init__(self, capacity, args):
+        super().__init__(capacity, args)
+        self.map = dict()
+        self._head: Optional[_FrequencyBucket] = None
+        self._requests = 0
+        if getattr(args, "halving_interval", 0):
+            self._get = self._get_with_halving
+
+    def _insert_bucket(self, count, prev, next):
+        bucket = _FrequencyBucket(count, prev, next)
+        if prev is None:
+            self._head = bucket
+        else:
+            prev.next = bucket
+        if next is not None:
+            next.prev = bucket
+        return bucket
+
+    def _unlink_bucket(self, bucket):
+        if bucket.prev is None:
+            self._head = bucket.next
+        else:
+            bucket.prev.next = bucket.next
+        if bucket.next is not None:
+            bucket.next.prev = bucket.prev
+
+    def _bucket_of(self, count):
+        """
+        :return: the bucket of count, walking from the head, so count must be at most the second bucket's
+        """
+        prev = None
+        bucket = self._head
+        while bucket is not None and bucket.count < count:
+            prev = bucket
+            bucket = bucket.next
+        if bucket is not None and bucket.count == count:
+            return bucket
+        return self._insert_bucket(count, prev, bucket)
+
+    def _take(self, obj):
+        bucket = obj.bucket
+        del bucket.objects[obj.key]
+        if not bucket.objects:
+            self._unlink_bucket(bucket)
+
+    def _promote(self, obj):
+        bucket = obj.bucket
+        count = bucket.count + 1
+        target = bucket.next
+        if target is None or target.count != count:
+            if len(bucket.objects) == 1:
+                # the only object of its bucket keeps it
+                bucket.count = count
+                return
+            target = self._insert_bucket(count, bucket, target)
+        objects = bucket.objects
+        del objects[obj.key]
+        if not objects:
+            self._unlink_bucket(bucket)
+        target.objects[obj.key] = obj
+        obj.bucket = target
+
+    def _demote(self, obj):
+        bucket = obj.bucket
+        count = bucket.count - 1
+        target = bucket.prev
+        if target is None or target.count != count:
+            if len(bucket.objects) == 1:
+                bucket.count = count
+                return
+            target = self._insert_bucket(count, target, bucket)
+        self._take(obj)
+        target.objects[obj.key] = obj
+        obj.bucket = target
+
+    def _admission_count(self):
+        return 1
+
+    def _halve(self):
+        buckets = []
+        bucket = self._head
+        while bucket is not None:
+            count = max(bucket.count >> 1, 1)
+            if buckets and buckets[-1].count == count:
+                merged = buckets[-1]
+                for key, obj in bucket.objects.items():
+                    merged.objects[key] = obj
+                    obj.bucket = merged
+            else:
+                bucket.count = count
+                buckets.append(bucket)
+            bucket = bucket.next
+        self._head = None
+        prev = None
+        for bucket in buckets:
+            bucket.prev = prev
+            bucket.next = None
+            if prev is None:
+                self._head = bucket
+            else:
+                prev.next = bucket
+            prev = bucket
+
+    def _get(self, request: CacheRequest):
+        obj = self.map.get(request.key)
+        if obj is None:
+            return None
+        # _promote inlined
+        bucket = obj.bucket
+        count = bucket.count + 1
+        target = bucket.next
+        if target is None or target.count != count:
+            if len(bucket.objects) == 1:
+                bucket.count = count
+                return obj
+            target = self._insert_bucket(count, bucket, target)
+        objects = bucket.objects
+        del objects[obj.key]
+        if not objects:
+            self._unlink_bucket(bucket)
+        target.objects[obj.key] = obj
+        obj.bucket = target
+        return obj
+
+    def _get_with_halving(self, request: CacheRequest):
+        self._requests += 1
+        if self._requests == self.args.halving_interval:
+            self._requests = 0
+            self._halve()
+        return LFUCache._get(self, request)
+
+    def _evict(self):
+        bucket = self._head
+        key, obj = bucket.objects.popitem(last=False)
+        if not bucket.objects:
+            self._unlink_bucket(bucket)
+        del self.map[key]
+        self.curr_capacity -= obj.size
+        return obj
+
+    def _admit(self, request: CacheRequest):
+        if request.size > self.capacity:
+            return False
+        obj = self.map.get(request.key)
+        if obj is not None:
+            if obj.size == request.size:
+                return True
+            # a size update readmits the object
+            self._remove(request.key)
+
+        while self.curr_capacity + request.size > self.capacity:
+            self.evict(request)
+
+        bucket = self._bucket_of(self._admission_count())
+        obj = LFUCacheObj(request.key, request.size, request.ts, request.index, bucket)
+        bucket.objects[request.key] = obj
+        self.map[request.key] = obj
+        self.curr_capacity += request.size
+        return True
+
+    def _remove(self, key):
+        obj = self.map.pop(key, None)
+        if obj is not None:
+            self._take(obj)
+            self.curr_capacity -= obj.size
+        return obj
+
+    def cached_objects(self):
+        return self.map.values()
+
+
+LFUDAArgs = namedtuple("LFUDAArgs", ["halving_interval"], defaults=[0])
+
+
+class LFUDACache(LFUCache):
+    """
+    LFU with dynamic aging: objects are admitted with the count of the last evicted object plus one, so
+    objects that stopped being requested are eventually evicted by newer ones.
+    A hit adds one to the count instead of recomputing it from the current age as GDSF does, which keeps
+    it a move to the neighbouring bucket. Halving halves the age with the counts.
+    """
+
+    def __init__(self, capacity, args):
+        super().__init__(capacity, args)
+        self.age = 0
+
+    def _admission_count(self):
+        return self.age + 1
+
+    def _evict(self):
+        self.age = self._head.count
+        return super()._evict()
+
+    def _halve(self):
+        super()._halve()
+        self.age >>= 1
+
+
+WindowLFUArgs = namedtuple("WindowLFUArgs", ["window"], defaults=[1 << 16])
+
+
+class WindowLFUCache(LFUCache):
+    """
+    LFU counting only the hits of the last args.window requests: every request enters a window queue, the
+    hit object or None, and the object of the request leaving the window moves back one bucket if it is
+    still cached. The count of an object is one for its admission plus its hits in the window.
+    """
+
+    def __init__(self, capacity, args):
+        super().__init__(capacity, args)
+        self._window = deque()
+
+    def _get(self, request: CacheRequest):
+        window = self._window
+        if len(window) == self.args.window:
+            leaving = window.popleft()
+            if leaving is not None and self.map.get(leaving.key) is leaving:
+                self._demote(leaving)
+        obj = self.map.get(request.key)
+        if obj is not None:
+            self._promote(obj)
+        window.append(obj)
+        return obj
+
+
+LRBArgs = namedtuple(
+    "LRBArgs", [
+        "model", "deltas", "sample_size", "evict_batch", "memory_window",
+        "training_window", "retrain_interval", "sample_rate", "background", "seed"
+    ],
+    defaults=["gbdt", 8, 64, 8, 200000, 65536, 4096, 0.1, False, 0]
+)
+
+
+class LRBCacheObj(CacheObject):
+    __slots__ = ("slot",)
+
+    def __init__(self, key, size, ts, index, slot):
+        super().__init__(key, size, ts, index)
+        self.slot = slot
+
+
+class LRBCache(BaseCache):
+    """
+    Learned relaxed Belady: evicts the sampled object predicted to be requested again furthest in the future.
+    Time is the request index. Every cached object owns a slot in NumPy feature arrays holding its last
+    access, frequency, size and a ring of its last `deltas` inter-arrival gaps.
+    On eviction `sample_size` random objects are scored with one model call and the `evict_batch` worst
+    are queued, so later evictions pop the queue until it runs dry or holds only re-accessed objects.
+    On a `sample_rate` fraction of requests a random cached object's features are sampled for training,
+    labelled with log of the gap to its next request (or 2 * memory_window when none comes within memory_window), kept in a
+    ring of the last `training_window` labels. A new model is fit every `retrain_interval` labels, inline by
+    default so runs are reproducible for a given seed. With `background` set the fit runs on a thread and is
+    swapped in once done, which is faster but makes the results depend on thread timing.
+    Until the first fit, candidates are ranked by age as in sampled LRU.
+    """
+
+    def __init__(self, capacity, args=LRBArgs()):
+        super().__init__(capacity, args)
+        self._model = learned_model._name_to_model[args.model]()
+        self._params = None
+        self._training = None
+        self._executor = None
+        self._rng = np.random.default_rng(args.seed)
+        self._sample_random = random.Random(args.seed).random
+        self._cache_map = dict()
+        self._now = 0
+        self._missing_delta = np.log1p(2 * args.memory_window)
+
+        slots = 1024
+        self._slot_keys = [None] * slots
+        self._last_access = np.zeros(slots, dtype=np.int64)
+        self._frequency = np.zeros(slots, dtype=np.float64)
+        self._log_size = np.zeros(slots, dtype=np.float64)
+        self._log_deltas = np.full((slots, args.deltas), self._missing_delta)
+        self._delta_head = np.zeros(slots, dtype=np.int64)
+        self._occupied = np.zeros(slots, dtype=np.int64)
+        self._occupied_pos = np.zeros(slots, dtype=np.int64)
+        self._occupied_count = 0
+        self._free_slots = list(range(slots - 1, -1, -1))
+        self._evict_queue = []
+
+        # key -> (features, index) awaiting a label, in sampling order
+        self._pending = OrderedDict()
+        feature_count = args.deltas + 4
+        self._train_features = np.zeros((args.training_window, feature_count))
+        self._train_labels = np.zeros(args.training_window)
+        self._train_count = 0
+        self._labels_since_fit = 0
+
+    def _grow(self):
+        slots = len(self._slot_keys)
+        self._slot_keys.extend([None] * slots)
+        self._last_access = np.concatenate([self._last_access, np.zeros(slots, dtype=np.int64)])
+        self._frequency = np.concatenate([self._frequency, np.zeros(slots)])
+        self._log_size = np.concatenate([self._log_size, np.zeros(slots)])
+        self._log_deltas = np.concatenate([self._log_deltas, np.full((slots, self.args.deltas), self._missing_delta)])
+        self._delta_head = np.concatenate([self._delta_head, np.zeros(slots, dtype=np.int64)])
+        self._occupied = np.concatenate([self._occupied, np.zeros(slots, dtype=np.int64)])
+        self._occupied_pos = np.concatenate([self._occupied_pos, np.zeros(slots, dtype=np.int64)])
+        self._free_slots.extend(range(2 * slots - 1, slots - 1, -1))
+
+    def _features(self, slots):
+        """
+        :return: features x (deltas + 4) matrix: bias, log age, log size, log frequency, deltas newest first
+        """
+        deltas = self.args.deltas
+        ring_index = (self._delta_head[slots, None] - 1 - np.arange(deltas)) % deltas
+        features = np.empty((len(slots), deltas + 4))
+        features[:, 0] = 1
+        features[:, 1] = np.log1p(self._now - self._last_access[slots])
+        features[:, 2] = self._log_size[slots]
+        features[:, 3] = np.log1p(self._frequency[slots])
+        features[:, 4:] = self._log_deltas[slots[:, None], ring_index]
+        return features
+
+    def _record_label(self, features, label):
+        position = self._train_count % self.args.training_window
+        self._train_features[position] = features
+        self._train_labels[position] = label
+        self._train_count += 1
+        self._labels_since_fit += 1
+        if self._labels_since_fit >= self.args.retrain_interval:
+            self._labels_since_fit = 0
+            self._retrain()
+
+    def _retrain(self):
+        if self._training is not None and not self._training.done():
+            return
+        count = min(self._train_count, self.args.training_window)
+        features = self._train_features[:count].copy()
+        labels = self._train_labels[:count].copy()
+        if not self.args.background:
+            self._params = self._model.fit(features, labels)
+            return
+        if self._executor is None:
+            self._executor = futures.ThreadPoolExecutor(max_workers=1)
+        self._training = self._executor.submit(self._model.fit, features, labels)
+
+    def _label(self, key):
+        now = self._now
+        pending = self._pending
+        sampled = pending.pop(key, None)
+        if sampled is not None:
+            self._record_label(sampled[0], np.log1p(now - sampled[1]))
+        # samples that saw no request within memory_window get the largest label
+        while pending:
+            oldest_key, (features, index) = next(iter(pending.items()))
+            if now - index <= self.args.memory_window:
+                break
+            del pending[oldest_key]
+            self._record_label(features, self._missing_delta)
+
+    def _access(self, request, slot):
+        now = request.index
+        deltas = self.args.deltas
+        head = self._delta_head[slot]
+        self._log_deltas[slot, head % deltas] = np.log1p(now - self._last_access[slot])
+        self._delta_head[slot] = head + 1
+        self._last_access[slot] = now
+        self._frequency[slot] += 1
+
+    def _sample(self):
+        position = self._rng.integers(self._occupied_count)
+        slot = self._occupied[position]
+        key = self._slot_keys[slot]
+        if key not in self._pending:
+            self._pending[key] = (self._features(self._occupied[position:position + 1])[0], self._now)
+
+    def _get(self, request: CacheRequest):
+        self._now = request.index
+        if self._pending:
+            self._label(request.key)
+        if self._occupied_count and self._sample_random() < self.args.sample_rate:
+            self._sample()
+        obj = self._cache_map.get(request.key)
+        if obj is None:
+            return None
+        self._access(request, obj.slot)
+        return obj
+
+    def _admit(self, request: CacheRequest):
+        if request.size > self.capacity:
+            return False
+        self._now = request.index
+        key = request.key
+        if key in self._cache_map:
+            return True
+        while self.curr_capacity + request.size > self.capacity:
+            self.evict(request)
+        if not self._free_slots:
+            self._grow()
+        slot = self._free_slots.pop()
+        self._slot_keys[slot] = key
+        self._last_access[slot] = request.index
+        self._frequency[slot] = 1
+        self._log_size[slot] = np.log(request.size) if request.size > 0 else 0
+        self._log_deltas[slot] = self._missing_delta
+        self._delta_head[slot] = 0
+        self._occupied[self._occupied_count] = slot
+        self._occupied_pos[slot] = self._occupied_count
+        self._occupied_count += 1
+        self._cache_map[key] = LRBCacheObj(key, request.size, request.ts, request.index, slot)
+        self.curr_capacity += request.size
+        return True
+
+    def _release(self, obj):
+        slot = obj.slot
+        position = self._occupied_pos[slot]
+        self._occupied_count -= 1
+        last_slot = self._occupied[self._occupied_count]
+        self._occupied[position] = last_slot
+        self._occupied_pos[last_slot] = position
+        self._slot_keys[slot] = None
+        self._free_slots.append(slot)
+        self.curr_capacity -= obj.size
+
+    def _refill_evict_queue(self):
+        if self._training is not None and self._training.done():
+            self._params = self._training.result()
+            self._training = None
+        sample_size = min(self.args.sample_size, self._occupied_count)
+        positions = self._rng.choice(self._occupied_count, sample_size, replace=False)
+        slots = self._occupied[positions]
+        if self._params is None:
+            scores = self._now - self._last_access[slots]
+        else:
+            scores = self._model.predict(self._params, self._features(slots))
+        order = np.argsort(-scores)[:self.args.evict_batch]
+        # worst last, stamped with the access it was scored at
+        self._evict_queue = [(self._slot_keys[slot], slot, self._last_access[slot])
+                             for slot in slots[order[::-1]].tolist()]
+
+    def _evict(self):
+        while True:
+            queue = self._evict_queue
+            while queue:
+                key, slot, last_access = queue.pop()
+                if self._slot_keys[slot] == key and self._last_access[slot] == last_access:
+                    obj = self._cache_map.pop(key)
+                    self._release(obj)
+                    return obj
+            self._refill_evict_queue()
+
+    def _remove(self, key):
+        obj = self._cache_map.pop(key, None)
+        if obj is not None:
+            self._release(obj)
+        return obj
+
+    def cached_objects(self):
+        return self._cache_map.values()
+
+
+TenantPartitionedArgs = namedtuple(
+    "TenantPartitionedArgs", ["cache_type", "quotas", "cache_args"], defaults=["LRU", {}, {}]
+)
+
+
+class TenantPartitionedCache(BaseCache):
+    """
+    Partitions the capacity between the tenants of CacheRequest.tenant (see traces.MergedCacheTraceIterator).
+    args.quotas maps tenants to the fraction of the capacity they get as a partition of their own; the
+    tenants without a quota share a partition of the remaining capacity. Every partition is a cache of
+    args.cache_type, so a tenant only evicts objects of its own partition.
+    """
+
+    def __init__(self, capacity, args):
+        super().__init__(capacity, args)
+        if sum(args.quotas.values()) > 1:
+            raise ValueError(f"quotas add up to more than the capacity: {args.quotas}")
+        self.partitions = {
+            tenant: initialize_cache(args.cache_type, int(capacity * quota), **args.cache_args)
+            for tenant, quota in args.quotas.items()
+        }
+        self.shared = initialize_cache(
+            args.cache_type, capacity - sum(partition.capacity for partition in self.partitions.values()),
+            **args.cache_args
+        )
+
+    def _partition(self, request):
+        return self.partitions.get(request.tenant, self.shared)
+
+    def _all_partitions(self):
+        return [*self.partitions.values(), self.shared]
+
+    def tenant_bytes(self):
+        """
+        :return: bytes cached in every partition, the shared one under None
+        """
+        usage = {tenant: partition.curr_capacity for tenant, partition in self.partitions.items()}
+        usage[None] = self.shared.curr_capacity
+        return usage
+
+    def set_eviction_logger(self, logger):
+        super().set_eviction_logger(logger)
+        for partition in self._all_partitions():
+            partition.set_eviction_logger(logger)
+
+    def set_eviction_sink(self, sink):
+        super().set_eviction_sink(sink)
+        for partition in self._all_partitions():
+            partition.set_eviction_sink(sink)
+
+    def _get(self, request: CacheRequest):
+        return self._partition(request)._get(request)
+
+    def _admit(self, request: CacheRequest):
+        partition = self._partition(request)
+        used = partition.curr_capacity
+        admitted = partition.admit(request)
+        self.curr_capacity += partition.curr_capacity - used
+        return admitted
+
+    def _evict(self):
+        # only reached through an explicit evict(), the partitions evict for themselves on admission
+        partition = max(self._all_partitions(), key=lambda partition: partition.curr_capacity)
+        obj = partition._evict()
+        self.curr_capacity -= obj.size
+        return obj
+
+    def cached_objects(self):
+        return [obj for partition in self._all_partitions() for obj in partition.cached_objects()]
+
+    def _remove(self, key):
+        for partition in self._all_partitions():
+            obj = partition._remove(key)
+            if obj is not None:
+                self.curr_capacity -= obj.size
+                return obj
+        return None
+
+
 _name_to_cls = {
     "LRU": {
         "cache": LRUCache,
         "args": LRUArgs,
     },
+    "FIFO": {
+        "cache": FIFOCache,
+        "args": FIFOArgs
+    },
+    "CLOCK": {
+        "cache": ClockCache,
+        "args": ClockArgs
+    },
     "SLRU": {
         "cache": SLRUCache,
         "args": SLRUArgs
@@ -279,17 +1195,40 @@ _name_to_cls = {
     "GDSF": {
         "cache": GDSFCache,
         "args": GDSFArgs
+    },
+    "LFU": {
+        "cache": LFUCache,
+        "args": LFUArgs
+    },
+    "LFUDA": {
+        "cache": LFUDACache,
+        "args": LFUDAArgs
+    },
+    "WLFU": {
+        "cache": WindowLFUCache,
+        "args": WindowLFUArgs
+    },
+    "LRB": {
+        "cache": LRBCache,
+        "args": LRBArgs
+    },
+    "TenantPartitioned": {
+        "cache": TenantPartitionedCache,
+        "args": TenantPartitionedArgs
     }
 }
 
 
 def initialize_cache(cache_name, capacity, **kwargs):
+    """
+    Looks the name up in the plugin registry, see plugins.py.
+    """
     try:
-        cls = _name_to_cls[cache_name]["cache"]
+        plugin = plugins.resolve(plugins.CACHE, cache_name)
     except KeyError:
         raise KeyError(f"Cache with {cache_name} is not implemented. Check _name_to_cls in caches.py")
-    args = _name_to_cls[cache_name]["args"](**kwargs)
-    return cls(capacity, args)
+    args = plugin["args"](**kwargs)
+    return plugin["cache"](capacity, args)
 
 
 Cache = NewType("Cache", BaseCache)
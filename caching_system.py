@@ -1,7 +1,15 @@
 from typing import TypeVar, Tuple, Any
 
 from caches import Cache, CacheObject
-from filters import Filter
+from filters import Filter, BaseFilter
+
+
+def observer_of(filter_instance):
+    """
+    :return: the filter's observe method if it overrides BaseFilter.observe, else None
+    """
+    observe = getattr(type(filter_instance), "observe", BaseFilter.observe)
+    return None if observe is BaseFilter.observe else filter_instance.observe
 
 
 class CachingSystem:
@@ -12,6 +20,7 @@ class CachingSystem:
     def __init__(self, filter_instance: Filter, cache_instance: Cache):
         self.filter_instance = filter_instance
         self.cache_instance = cache_instance
+        self._observe = observer_of(filter_instance)
 
     def __repr__(self):
         return f"CachingSystemSimulator(filter={self.filter_instance}, cache={self.cache_instance.id})"
@@ -32,4 +41,6 @@ class CachingSystem:
         :param request: traces.CacheRequest
         :return:
         """
+        if self._observe is not None:
+            self._observe(request)
         return self.cache_instance.get(request)
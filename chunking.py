@@ -0,0 +1,205 @@
+"""
+Chunked caching of large objects.
+An object of `size` bytes is stored as chunks (key, 0), (key, 1), ... of `chunk_size` bytes, the last
+one holding the remainder. A request for the byte range [range_start, range_end) of an object touches
+only the chunks overlapping the range; requests without a range ask for the whole object.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from caching_system import observer_of
+from logger import log_window
+from simulation import Simulation, do_nothing
+
+ChunkingArgs = namedtuple("ChunkingArgs", ["chunk_size"])
+
+
+def chunk_span(request, chunk_size):
+    """
+    :return: (first chunk, last chunk + 1, range start, range end) of the request
+    """
+    # pickled traces written before CacheRequest had ranges lack the attributes
+    range_start = getattr(request, "range_start", None)
+    range_end = getattr(request, "range_end", None)
+    range_start = 0 if range_start is None else range_start
+    range_end = request.size if range_end is None else min(range_end, request.size)
+    if range_end <= range_start:
+        return 0, 0, range_start, range_start
+    return range_start // chunk_size, (range_end - 1) // chunk_size + 1, range_start, range_end
+
+
+class ChunkedCachingSystem:
+    """
+    Wraps a CachingSystem so that its cache holds chunks instead of whole objects.
+    Chunk lookups and admissions of one request go through BaseCache.get_batch/admit_batch, so any cache
+    works; only a plain LRUCache batches them, other policies fall back to one get/admit call per chunk.
+    The filter decides once per request: either every missing chunk of the request is admitted or none.
+    """
+
+    def __init__(self, caching_system, chunk_size):
+        assert chunk_size > 0
+        self.caching_system = caching_system
+        self.filter_instance = caching_system.filter_instance
+        self.cache_instance = caching_system.cache_instance
+        self.chunk_size = chunk_size
+        self._observe = observer_of(self.filter_instance)
+
+    def __repr__(self):
+        return f"ChunkedCachingSystem({self.caching_system}, chunk_size={self.chunk_size})"
+
+    @property
+    def id(self):
+        return f"{self.caching_system.id}_chunk{self.chunk_size}"
+
+    def _chunk_sizes(self, request, first, end):
+        chunk_size = self.chunk_size
+        sizes = [chunk_size] * (end - first)
+        if sizes and end * chunk_size > request.size:
+            sizes[-1] = request.size - (end - 1) * chunk_size
+        return sizes
+
+    def get(self, request):
+        """
+        :return: (first chunk, range start, range end, missing chunk numbers, missing chunk sizes)
+        """
+        if self._observe is not None:
+            self._observe(request)
+        first, end, range_start, range_end = chunk_span(request, self.chunk_size)
+        key = request.key
+        sizes = self._chunk_sizes(request, first, end)
+        missing = self.cache_instance.get_batch([(key, chunk_no) for chunk_no in range(first, end)], sizes, request)
+        return first, range_start, range_end, [first + i for i in missing], [sizes[i] for i in missing]
+
+    def put(self, request, missing, missing_sizes):
+        if self.filter_instance.should_filter(request):
+            return False
+        key = request.key
+        self.cache_instance.admit_batch([(key, chunk_no) for chunk_no in missing], missing_sizes, request)
+        return True
+
+
+def missing_range_bytes(missing, chunk_size, range_start, range_end):
+    """
+    :return: bytes of [range_start, range_end) that fall into the missing chunks
+    """
+    if not missing:
+        return 0
+    total = len(missing) * chunk_size
+    first_chunk_no = missing[0]
+    if first_chunk_no == range_start // chunk_size:
+        total -= range_start - first_chunk_no * chunk_size
+    last_chunk_no = missing[-1]
+    if last_chunk_no == (range_end - 1) // chunk_size:
+        total -= (last_chunk_no + 1) * chunk_size - range_end
+    return total
+
+
+class ChunkStatistics:
+    def __init__(self):
+        self.segment_chunk_total_count_list = []
+        self.segment_chunk_miss_count_list = []
+        self.segment_chunk_fetch_bytes_list = []
+        self.segment_chunk_total_count = 0
+        self.segment_chunk_miss_count = 0
+        self.segment_chunk_fetch_bytes = 0
+
+    def record_segment(self):
+        self.segment_chunk_total_count_list.append(self.segment_chunk_total_count)
+        self.segment_chunk_miss_count_list.append(self.segment_chunk_miss_count)
+        self.segment_chunk_fetch_bytes_list.append(self.segment_chunk_fetch_bytes)
+        self.segment_chunk_total_count = 0
+        self.segment_chunk_miss_count = 0
+        self.segment_chunk_fetch_bytes = 0
+
+    def as_dict(self):
+        total_count = sum(self.segment_chunk_total_count_list)
+        return {
+            "chunk_miss_ratio": sum(self.segment_chunk_miss_count_list) / total_count if total_count else None,
+            "chunk_fetch_bytes": sum(self.segment_chunk_fetch_bytes_list),
+            "segment_stats": {
+                "segment_chunk_total_count": self.segment_chunk_total_count_list,
+                "segment_chunk_miss_count": self.segment_chunk_miss_count_list,
+                "segment_chunk_fetch_bytes": self.segment_chunk_fetch_bytes_list,
+            }
+        }
+
+
+class ChunkedSimulation(Simulation):
+    """
+    Replays the trace against a ChunkedCachingSystem.
+    A request misses when any chunk it touches misses; total and miss bytes count only the requested range,
+    so the byte miss ratio is over bytes clients asked for. Chunk stats add the chunk level miss ratio and
+    the bytes fetched from origin, i.e. the whole missing chunks.
+    """
+
+    def __init__(self, caching_stack, trace_iterator,
+                 ordinal_window=100000, temporal_window=600,
+                 temporal_format='s', on_miss_callback=do_nothing, on_hit_callback=do_nothing,
+                 chunking_args=ChunkingArgs(4 * 1024 * 1024)):
+        super().__init__(ChunkedCachingSystem(caching_stack, chunking_args.chunk_size), trace_iterator,
+                         ordinal_window, temporal_window, temporal_format, on_miss_callback, on_hit_callback)
+        self._chunking_args = chunking_args
+        self._chunk_statistics = ChunkStatistics()
+
+    def get_state(self):
+        state = super().get_state()
+        state["chunking_args"] = dict(self._chunking_args._asdict())
+        state["chunk_stats"] = self._chunk_statistics.as_dict()
+        return state
+
+    def run(self):
+        start_time = datetime.now()
+        simulator = self._simulator
+        chunk_size = self._chunking_args.chunk_size
+        segment_statistics = self._segment_statistics
+        chunk_statistics = self._chunk_statistics
+        cache_instance = simulator.cache_instance
+        track_expiry = cache_instance.expiry is not None
+        tenant_statistics = self._tenant_statistics
+        on_miss, on_hit, events = self._hooks()
+        for request in self._trace_iterator:
+            first, range_start, range_end, missing, missing_sizes = simulator.get(request)
+            chunk_statistics.segment_chunk_total_count += (range_end - 1) // chunk_size + 1 - first \
+                if range_end > range_start else 0
+            if missing:
+                miss_bytes = missing_range_bytes(missing, chunk_size, range_start, range_end)
+                segment_statistics.segment_miss_count += 1
+                segment_statistics.segment_miss_bytes += miss_bytes
+                if track_expiry and cache_instance.last_get_expired:
+                    segment_statistics.segment_expired_miss_count += 1
+                    segment_statistics.segment_expired_miss_bytes += miss_bytes
+                chunk_statistics.segment_chunk_miss_count += len(missing)
+                chunk_statistics.segment_chunk_fetch_bytes += sum(missing_sizes)
+                if tenant_statistics is not None:
+                    tenant_statistics.update_miss(request.tenant, miss_bytes)
+                simulator.put(request, missing, missing_sizes)
+                if on_miss is not None:
+                    on_miss(request)
+            elif on_hit is not None:
+                on_hit(request)
+            if events is not None:
+                events.append(request.index, range_end - range_start, not missing)
+            segment_statistics.segment_total_count += 1
+            segment_statistics.segment_total_bytes += range_end - range_start
+            if tenant_statistics is not None:
+                tenant_statistics.update_stat(request.tenant, range_end - range_start)
+            if self._curr_trace_index != 0 and self._curr_trace_index % self._ordinal_window == 0:
+                log_window(self._execution_logger, self._curr_trace_index,
+                           self._trace_iterator, segment_statistics.curr_bmr(),
+                           segment_statistics.curr_omr())
+                segment_statistics.record_segment()
+                self._record_residency_window()
+                chunk_statistics.record_segment()
+            self._curr_trace_index += 1
+
+        if (self._curr_trace_index - 1) % self._ordinal_window != 0:
+            segment_statistics.record_segment()
+            self._record_residency_window()
+            chunk_statistics.record_segment()
+        if events is not None:
+            events.flush()
+        end_time = datetime.now()
+        res = self.get_state()
+        res["simulation_time"] = (end_time - start_time).total_seconds()
+        res["simulation_timestamp"] = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+        return res
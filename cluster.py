@@ -0,0 +1,346 @@
+"""
+Cluster of cache nodes that requests are routed to by consistent hashing ("ring") or rendezvous hashing.
+ClusterArgs.membership_events: list of (trace index, "add" | "remove", node name), applied
+                               before the request at that trace index is routed.
+"""
+import argparse
+import bisect
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from collections import namedtuple, defaultdict
+from datetime import datetime
+from json import JSONDecodeError
+from multiprocessing import Pool
+from urllib import parse
+
+from caches import initialize_cache
+from caching_system import CachingSystem
+from filters import initialize_filter
+from simulation import ordinal_window_index
+from trace_to_pickle import s_dump_elt
+from traces import initialize_iterator, DEFAULT_TRACE_TYPE, CacheRequest
+
+HASHING_TYPES = {
+    "ring", "rendezvous"
+}
+
+ClusterArgs = namedtuple(
+    "ClusterArgs", [
+        "nodes", "hashing", "virtual_nodes", "membership_events"
+    ],
+    defaults=[4, "ring", 100, ()]
+)
+
+
+def _hash64(value) -> int:
+    """
+    Stable across processes, unlike the builtin hash() of a str.
+    """
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "little")
+
+
+class ConsistentHashRing:
+    def __init__(self, nodes, virtual_nodes=100):
+        self.virtual_nodes = virtual_nodes
+        self._nodes = set()
+        self._points = []
+        self._point_to_node = {}
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node(self, node):
+        """
+        Adding a node that is already on the ring is a no-op.
+        """
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for i in range(self.virtual_nodes):
+            point = _hash64(f"{node}#{i}")
+            self._point_to_node[point] = node
+            bisect.insort(self._points, point)
+
+    def remove_node(self, node):
+        self._nodes.remove(node)
+        for i in range(self.virtual_nodes):
+            point = _hash64(f"{node}#{i}")
+            del self._point_to_node[point]
+            del self._points[bisect.bisect_left(self._points, point)]
+
+    def route(self, key):
+        i = bisect.bisect(self._points, _hash64(key))
+        if i == len(self._points):
+            i = 0
+        return self._point_to_node[self._points[i]]
+
+
+class RendezvousHash:
+    def __init__(self, nodes):
+        self._nodes = list(nodes)
+
+    def add_node(self, node):
+        if node not in self._nodes:
+            self._nodes.append(node)
+
+    def remove_node(self, node):
+        self._nodes.remove(node)
+
+    def route(self, key):
+        return max(self._nodes, key=lambda node: _hash64(f"{node}#{key}"))
+
+
+def initialize_router(hashing, nodes, virtual_nodes):
+    if hashing == "ring":
+        return ConsistentHashRing(nodes, virtual_nodes)
+    elif hashing == "rendezvous":
+        return RendezvousHash(nodes)
+    raise KeyError(f"Hashing with {hashing} is not implemented. Check HASHING_TYPES in cluster.py")
+
+
+def _initial_nodes(cluster_args):
+    return [f"node-{i}" for i in range(cluster_args.nodes)]
+
+
+def _validate_membership_events(cluster_args):
+    """
+    Replays the membership events on the node names alone, so a bad event fails before the trace is read
+    instead of in the middle of the routing pass.
+    :raises ValueError: on an unknown action, on removing a node that is not in the cluster, or when the events
+                        at a trace index leave no node to route that request to
+    """
+    nodes = set(_initial_nodes(cluster_args))
+    if not nodes:
+        raise ValueError(f"A cluster needs at least one node, got nodes={cluster_args.nodes}")
+    events = sorted(cluster_args.membership_events, key=lambda event: event[0])
+    for position, (index, action, node) in enumerate(events):
+        if action == "add":
+            nodes.add(node)
+        elif action == "remove":
+            if node not in nodes:
+                raise ValueError(f"Membership event {(index, action, node)} removes {node}, which is not in "
+                                 f"the cluster at trace index {index}")
+            nodes.remove(node)
+        else:
+            raise ValueError(f"Membership event {(index, action, node)} is not supported, "
+                             f"the action must be \"add\" or \"remove\"")
+        # events at the same index are applied together before the request at that index is routed
+        if not nodes and (position == len(events) - 1 or events[position + 1][0] != index):
+            raise ValueError(f"Membership events at trace index {index} remove every node of the cluster")
+
+
+def _partition_trace(trace_iterator, cluster_args, shard_dir, buff_size=100000):
+    """
+    Routes every request once and writes each shard's sub-stream as streaming pickle chunks.
+    A shard is one incarnation of a node, so a re-added node starts with an empty cache.
+    :return: list of (shard id, node name, shard file path)
+    """
+    router = initialize_router(cluster_args.hashing, _initial_nodes(cluster_args), cluster_args.virtual_nodes)
+    incarnation = defaultdict(int)
+    pending_events = sorted(cluster_args.membership_events, key=lambda event: event[0])
+    shards = {}
+    buffers = defaultdict(list)
+    files = {}
+
+    def flush(shard_id):
+        if shard_id not in files:
+            files[shard_id] = open(shards[shard_id][2], "wb")
+        s_dump_elt(buffers[shard_id], files[shard_id])
+        buffers[shard_id] = []
+
+    for request in trace_iterator:
+        while pending_events and pending_events[0][0] <= request.index:
+            _, action, node = pending_events.pop(0)
+            # validated by _validate_membership_events
+            if action == "add":
+                router.add_node(node)
+            else:
+                router.remove_node(node)
+                incarnation[node] += 1
+        node = router.route(request.key)
+        shard_id = f"{node}.{incarnation[node]}"
+        if shard_id not in shards:
+            shards[shard_id] = (shard_id, node, f"{shard_dir}/{shard_id}.pickle")
+        buffer = buffers[shard_id]
+        buffer.append((request.key, request.size, request.ts, request.index))
+        if len(buffer) == buff_size:
+            flush(shard_id)
+
+    for shard_id, buffer in buffers.items():
+        if buffer:
+            flush(shard_id)
+    for f in files.values():
+        f.close()
+    return list(shards.values())
+
+
+def _simulate_shard(task):
+    """
+    Replays one shard and aggregates its statistics into global ordinal windows,
+    so shard results can be summed window by window.
+    """
+    shard_id, node, shard_path, cache_type, cache_size, filter_type, filter_args, ordinal_window = task
+    caching_system = CachingSystem(
+        initialize_filter(filter_type, **filter_args), initialize_cache(cache_type, cache_size)
+    )
+    total_count = defaultdict(int)
+    total_bytes = defaultdict(int)
+    miss_count = defaultdict(int)
+    miss_bytes = defaultdict(int)
+    with open(shard_path, "rb") as f:
+        while True:
+            try:
+                records = pickle.load(f)
+            except EOFError:
+                break
+            for key, size, ts, index in records:
+                request = CacheRequest(key, size, ts, index)
+                window = ordinal_window_index(index, ordinal_window)
+                if caching_system.get(request) is None:
+                    miss_count[window] += 1
+                    miss_bytes[window] += size
+                    caching_system.put(request)
+                total_count[window] += 1
+                total_bytes[window] += size
+    return {
+        "shard_id": shard_id,
+        "node": node,
+        "total_count": dict(total_count),
+        "total_bytes": dict(total_bytes),
+        "miss_count": dict(miss_count),
+        "miss_bytes": dict(miss_bytes),
+    }
+
+
+def _load_imbalance(values):
+    if not values:
+        return {"max_over_mean": None, "coefficient_of_variation": None}
+    mean = sum(values) / len(values)
+    if mean == 0:
+        return {"max_over_mean": None, "coefficient_of_variation": None}
+    variance = sum((v - mean) ** 2 for v in values) / len(values)
+    return {
+        "max_over_mean": max(values) / mean,
+        "coefficient_of_variation": variance ** 0.5 / mean,
+    }
+
+
+def simulate_cluster(cache_type, cache_size, trace_iterator, filter_type, filter_args,
+                     cluster_args: ClusterArgs, ordinal_window=1000000, processes=None, shard_dir=None):
+    """
+    Partitions the trace by node in one routing pass, replays every shard in its own process
+    and merges the per window statistics. cache_size is the capacity of a single node.
+    :raises ValueError: if cluster_args.membership_events cannot be applied, see _validate_membership_events
+    """
+    assert cluster_args.hashing in HASHING_TYPES
+    _validate_membership_events(cluster_args)
+    start_time = datetime.now()
+    cleanup = shard_dir is None
+    if cleanup:
+        shard_dir = tempfile.mkdtemp(prefix="cluster_shards_")
+    try:
+        shards = _partition_trace(trace_iterator, cluster_args, shard_dir)
+        tasks = [
+            (shard_id, node, shard_path, cache_type, cache_size, filter_type, filter_args, ordinal_window)
+            for shard_id, node, shard_path in shards
+        ]
+        if processes == 1:
+            shard_results = [_simulate_shard(task) for task in tasks]
+        else:
+            with Pool(processes) as pool:
+                shard_results = pool.map(_simulate_shard, tasks)
+    finally:
+        if cleanup:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+
+    window_count = ordinal_window_index(trace_iterator.total_count - 1, ordinal_window) + 1
+    segment_stats = {
+        name: [0] * window_count
+        for name in ("segment_total_count", "segment_total_bytes", "segment_miss_count", "segment_miss_bytes")
+    }
+    node_stats = defaultdict(lambda: defaultdict(int))
+    for shard_result in shard_results:
+        stats = node_stats[shard_result["node"]]
+        for name, field in (("segment_total_count", "total_count"), ("segment_total_bytes", "total_bytes"),
+                            ("segment_miss_count", "miss_count"), ("segment_miss_bytes", "miss_bytes")):
+            for window, value in shard_result[field].items():
+                segment_stats[name][window] += value
+                stats[field] += value
+
+    def ratio(miss_name, total_name, warmup=0):
+        start_index = int(window_count * warmup / 100)
+        total = sum(segment_stats[total_name][start_index:])
+        return sum(segment_stats[miss_name][start_index:]) / total if total else None
+
+    node_request_counts = [stats["total_count"] for stats in node_stats.values()]
+    node_request_bytes = [stats["total_bytes"] for stats in node_stats.values()]
+    end_time = datetime.now()
+    return {
+        "cache_type": cache_type,
+        "cache_size": cache_size,
+        "filter_type": filter_type,
+        "filter_args": filter_args,
+        "cluster_args": dict(cluster_args._asdict()),
+        "trace_file": trace_iterator.trace_filename,
+        "no_warmup_byte_miss_ratio": ratio("segment_miss_bytes", "segment_total_bytes"),
+        "segment_stats": segment_stats,
+        "20p_warmup_bmr": ratio("segment_miss_bytes", "segment_total_bytes", 20),
+        "20p_warmup_omr": ratio("segment_miss_count", "segment_total_count", 20),
+        "node_stats": {node: dict(stats) for node, stats in node_stats.items()},
+        "request_count_imbalance": _load_imbalance(node_request_counts),
+        "request_bytes_imbalance": _load_imbalance(node_request_bytes),
+        "simulation_time": (end_time - start_time).total_seconds(),
+        "simulation_timestamp": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('cacheType')
+    parser.add_argument('cacheSize', type=int)
+    parser.add_argument('traceFile')
+    parser.add_argument('--traceType', default=DEFAULT_TRACE_TYPE, dest='traceType')
+    parser.add_argument('--filterType', default="Null", dest='filterType')
+    parser.add_argument('--filterArgs', default="{}")
+    parser.add_argument('--ordinalWindowSize', default=1000000, type=int)
+    parser.add_argument('--nodes', default=4, type=int)
+    parser.add_argument('--hashing', default="ring", choices=sorted(HASHING_TYPES))
+    parser.add_argument('--virtualNodes', default=100, type=int)
+    parser.add_argument('--membershipEvents', default="[]",
+                        help='JSON list of [trace index, "add" | "remove", node name]')
+    parser.add_argument('--processes', default=None, type=int)
+    parser.add_argument('--resultIdentifier', default="regular", dest='resultIdentifier')
+    args = parser.parse_args()
+
+    trace_dir = os.environ["TRACE_DIRECTORY"]
+    simulation_res_dir = os.environ["SIMULATION_RESULT_DIRECTORY"]
+    if not os.path.exists(simulation_res_dir):
+        os.makedirs(simulation_res_dir)
+
+    try:
+        filter_args = json.loads(args.filterArgs)
+    except JSONDecodeError:
+        filter_args = json.loads(parse.unquote(args.filterArgs))
+    cluster_args = ClusterArgs(
+        args.nodes, args.hashing, args.virtualNodes,
+        tuple(tuple(event) for event in json.loads(args.membershipEvents))
+    )
+    try:
+        _validate_membership_events(cluster_args)
+    except ValueError as e:
+        parser.error(str(e))
+    trace_iterator = initialize_iterator(args.traceType, f"{trace_dir}/{args.traceFile}")
+    res = simulate_cluster(
+        args.cacheType, args.cacheSize, trace_iterator, args.filterType, filter_args,
+        cluster_args, args.ordinalWindowSize, args.processes
+    )
+
+    h = hashlib.blake2s(digest_size=16)
+    h.update(f"cluster_{cluster_args}_{args.cacheType}_{args.cacheSize}_{args.filterType}_"
+             f"{filter_args}_{trace_iterator.trace_filename}_{args.resultIdentifier}".encode())
+    with open(f"{simulation_res_dir}/{h.hexdigest()}.json", "w") as f:
+        json.dump(res, f, sort_keys=True, indent=4)
+    print(res)
@@ -0,0 +1,205 @@
+"""
+Counting cuckoo filter (Fan et al., CoNEXT 2014) over NumPy arrays.
+
+A key hashes once to 64 bits; the low bits pick its first bucket and bits 32.. its non zero fingerprint,
+the second bucket is the first xor a hash of the fingerprint. Every slot holds a fingerprint and a
+saturating 8 bit occurrence count, so adding a key again counts it instead of taking another slot.
+A key that cannot be placed after max_kicks relocations is kept in a one entry victim stash; add()
+fails only when the stash is taken too.
+The arrays are read and written through memoryviews, which index much faster than NumPy scalars.
+"""
+import hashlib
+import random
+
+import numpy as np
+
+_MASK64 = (1 << 64) - 1
+_FINGERPRINT_MULTIPLIER = 0x5bd1e995
+_DTYPE_OF_BITS = {8: "uint8", 16: "uint16", 32: "uint32"}
+
+
+def key_hash(key):
+    """
+    :return: 64 bit hash of an int (splitmix64 finaliser) or of str(key) (blake2b), stable across processes
+    """
+    if isinstance(key, int):
+        z = (key + 0x9E3779B97F4A7C15) & _MASK64
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+        return z ^ (z >> 31)
+    return int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), "little")
+
+
+class CuckooFilter:
+    def __init__(self, capacity, fingerprint_bits=16, bucket_size=4, max_kicks=500, seed=0, load_factor=0.95):
+        """
+        :param capacity: distinct keys the filter holds at load_factor
+        """
+        assert fingerprint_bits in _DTYPE_OF_BITS
+        num_buckets = 1
+        while num_buckets * bucket_size * load_factor < capacity:
+            num_buckets <<= 1
+        self.num_buckets = num_buckets
+        self.bucket_size = bucket_size
+        self.fingerprint_bits = fingerprint_bits
+        self.max_kicks = max_kicks
+        self._bucket_mask = num_buckets - 1
+        self._fingerprint_mask = (1 << fingerprint_bits) - 1
+        self.fingerprints = np.zeros(num_buckets * bucket_size, dtype=_DTYPE_OF_BITS[fingerprint_bits])
+        self.counts = np.zeros(num_buckets * bucket_size, dtype=np.uint8)
+        self._fingerprints = memoryview(self.fingerprints)
+        self._counts = memoryview(self.counts)
+        self._random = random.Random(seed)
+        # (fingerprint, bucket, count) of the key that found no slot
+        self._victim = None
+        self.size = 0
+
+    def __len__(self):
+        """
+        :return: number of distinct keys held
+        """
+        return self.size
+
+    def __contains__(self, key):
+        return self.count_hash(key_hash(key)) > 0
+
+    @property
+    def nbytes(self):
+        return self.fingerprints.nbytes + self.counts.nbytes
+
+    def _locate(self, h):
+        fingerprint = (h >> 32) & self._fingerprint_mask or 1
+        bucket = h & self._bucket_mask
+        return fingerprint, bucket, (bucket ^ (fingerprint * _FINGERPRINT_MULTIPLIER)) & self._bucket_mask
+
+    def _find(self, fingerprint, bucket1, bucket2):
+        """
+        :return: slot of fingerprint in either bucket, -1 if absent
+        """
+        fingerprints = self._fingerprints
+        bucket_size = self.bucket_size
+        start = bucket1 * bucket_size
+        for slot in range(start, start + bucket_size):
+            if fingerprints[slot] == fingerprint:
+                return slot
+        start = bucket2 * bucket_size
+        for slot in range(start, start + bucket_size):
+            if fingerprints[slot] == fingerprint:
+                return slot
+        return -1
+
+    def _victim_matches(self, fingerprint, bucket1, bucket2):
+        victim = self._victim
+        return victim is not None and victim[0] == fingerprint and victim[1] in (bucket1, bucket2)
+
+    def _place(self, bucket, fingerprint, count):
+        fingerprints = self._fingerprints
+        start = bucket * self.bucket_size
+        for slot in range(start, start + self.bucket_size):
+            if fingerprints[slot] == 0:
+                fingerprints[slot] = fingerprint
+                self._counts[slot] = count
+                return True
+        return False
+
+    def count_hash(self, h):
+        """
+        :return: times the key was added and not removed, 0 if absent; saturates at 255
+        """
+        fingerprint, bucket1, bucket2 = self._locate(h)
+        slot = self._find(fingerprint, bucket1, bucket2)
+        if slot >= 0:
+            return self._counts[slot]
+        if self._victim_matches(fingerprint, bucket1, bucket2):
+            return self._victim[2]
+        return 0
+
+    def add_hash(self, h):
+        """
+        :return: False if the key had to be dropped because the filter is full
+        """
+        fingerprint, bucket1, bucket2 = self._locate(h)
+        slot = self._find(fingerprint, bucket1, bucket2)
+        if slot >= 0:
+            if self._counts[slot] < 255:
+                self._counts[slot] += 1
+            return True
+        if self._victim_matches(fingerprint, bucket1, bucket2):
+            victim = self._victim
+            self._victim = (victim[0], victim[1], min(victim[2] + 1, 255))
+            return True
+        if self._place(bucket1, fingerprint, 1) or self._place(bucket2, fingerprint, 1):
+            self.size += 1
+            return True
+        if self._victim is not None:
+            return False
+        # relocate random residents until one finds a free slot in its other bucket
+        fingerprints = self._fingerprints
+        counts = self._counts
+        bucket = bucket1 if self._random.random() < 0.5 else bucket2
+        count = 1
+        for _ in range(self.max_kicks):
+            slot = bucket * self.bucket_size + self._random.randrange(self.bucket_size)
+            fingerprint, fingerprints[slot] = fingerprints[slot], fingerprint
+            count, counts[slot] = counts[slot], count
+            bucket = (bucket ^ (fingerprint * _FINGERPRINT_MULTIPLIER)) & self._bucket_mask
+            if self._place(bucket, fingerprint, count):
+                self.size += 1
+                return True
+        self._victim = (fingerprint, bucket, count)
+        self.size += 1
+        return True
+
+    def remove_hash(self, h):
+        """
+        Decrements the key's count and frees its slot at 0. A saturated count is no longer exact,
+        so it stays saturated and the key is only dropped by clear().
+        :return: False if the key is absent
+        """
+        fingerprint, bucket1, bucket2 = self._locate(h)
+        slot = self._find(fingerprint, bucket1, bucket2)
+        if slot >= 0:
+            count = self._counts[slot]
+            if count == 255:
+                return True
+            count -= 1
+            self._counts[slot] = count
+            if count == 0:
+                self._fingerprints[slot] = 0
+                self.size -= 1
+                self._reinsert_victim()
+            return True
+        if self._victim_matches(fingerprint, bucket1, bucket2):
+            victim = self._victim
+            if victim[2] == 255:
+                return True
+            if victim[2] == 1:
+                self._victim = None
+                self.size -= 1
+            else:
+                self._victim = (victim[0], victim[1], victim[2] - 1)
+            return True
+        return False
+
+    def _reinsert_victim(self):
+        if self._victim is None:
+            return
+        fingerprint, bucket, count = self._victim
+        other = (bucket ^ (fingerprint * _FINGERPRINT_MULTIPLIER)) & self._bucket_mask
+        if self._place(bucket, fingerprint, count) or self._place(other, fingerprint, count):
+            self._victim = None
+
+    def count(self, key):
+        return self.count_hash(key_hash(key))
+
+    def add(self, key):
+        return self.add_hash(key_hash(key))
+
+    def remove(self, key):
+        return self.remove_hash(key_hash(key))
+
+    def clear(self):
+        self.fingerprints[:] = 0
+        self.counts[:] = 0
+        self._victim = None
+        self.size = 0
@@ -0,0 +1,95 @@
+"""
+Batched hit/miss events of a simulation.
+
+Subscribers (see Simulation.subscribe) implement on_events(indexes, sizes, hits): the request indexes and
+sizes as numpy.ndarray(int64) and whether each request hit as numpy.ndarray(bool), in trace order.
+The arrays are views of the buffer and are overwritten after the call; subscribers copy what they keep.
+"""
+import numpy as np
+
+DEFAULT_BUFFER_EVENTS = 1 << 16
+
+
+class RequestEventBuffer:
+    """
+    Appends the events into preallocated arrays, written through memoryviews, and hands every full buffer
+    to the subscribers.
+    """
+
+    def __init__(self, subscribers=(), buffer_events=DEFAULT_BUFFER_EVENTS):
+        self.subscribers = list(subscribers)
+        self.indexes = np.zeros(buffer_events, dtype=np.int64)
+        self.sizes = np.zeros(buffer_events, dtype=np.int64)
+        self.hits = np.zeros(buffer_events, dtype=np.bool_)
+        self._indexes = memoryview(self.indexes)
+        self._sizes = memoryview(self.sizes)
+        self._hits = memoryview(self.hits)
+        self._buffer_events = buffer_events
+        self._count = 0
+
+    def append(self, index, size, hit):
+        count = self._count
+        self._indexes[count] = index
+        self._sizes[count] = size
+        self._hits[count] = hit
+        self._count = count + 1
+        if self._count == self._buffer_events:
+            self.flush()
+
+    def flush(self):
+        count = self._count
+        if count == 0:
+            return
+        for subscriber in self.subscribers:
+            subscriber.on_events(self.indexes[:count], self.sizes[:count], self.hits[:count])
+        self._count = 0
+
+
+class HitBitmap:
+    """
+    Subscriber packing the hit flags of every request into a bitmap, bit i is the i-th request, and keeping
+    the request sizes.
+    """
+
+    def __init__(self):
+        self._bits = []
+        # flags of the requests past the last full byte
+        self._pending = np.zeros(0, dtype=np.bool_)
+        self._sizes = []
+        self.request_count = 0
+
+    def on_events(self, indexes, sizes, hits):
+        if len(self._pending):
+            hits = np.concatenate([self._pending, hits])
+        full = len(hits) & ~7
+        self._bits.append(np.packbits(hits[:full]))
+        self._pending = hits[full:].copy()
+        self._sizes.append(sizes.copy())
+        self.request_count += len(sizes)
+
+    def bitmap(self):
+        """
+        :return: numpy.ndarray(uint8) of the hits packed 8 requests per byte, see numpy.packbits
+        """
+        return np.concatenate(self._bits + [np.packbits(self._pending)])
+
+    @property
+    def sizes(self):
+        return np.concatenate(self._sizes) if self._sizes else np.zeros(0, dtype=np.int64)
+
+
+def bitmap_of(indexes, request_count):
+    """
+    :return: packed bitmap of request_count requests with the bits at indexes set
+    """
+    flags = np.zeros(request_count, dtype=np.bool_)
+    flags[indexes] = True
+    return np.packbits(flags)
+
+
+def bitmap_count_and_bytes(bitmap, sizes):
+    """
+    :return: (requests set in bitmap, their total size)
+    """
+    flags = np.unpackbits(bitmap, count=len(sizes)).view(np.bool_)
+    return int(flags.sum()), int(sizes[flags].sum())
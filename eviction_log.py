@@ -0,0 +1,137 @@
+"""
+Eviction log in a fixed width binary format, written in bulk from a preallocated buffer.
+
+Binary Format
+| magic | version | record count is implied by file size |
+ {key} {size} {frequency} {admit ts} {age} {admit index} {residency}
+Every field is a little endian int64. Age is in trace timestamp units and
+residency in requests, both measured at eviction time.
+Non integer keys are stored as a stable 64 bit hash.
+"""
+import hashlib
+import queue
+import struct
+import threading
+
+MAGIC = b"EVLOG"
+VERSION = 1
+HEADER_FMT = "<5sB"
+HEADER_FMT_LEN = struct.calcsize(HEADER_FMT)
+RECORD_FMT = "<qqqqqqq"
+RECORD_FMT_LEN = struct.calcsize(RECORD_FMT)
+RECORD_FIELDS = ("key", "size", "frequency", "ts", "age", "index", "residency")
+
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+
+def _key_to_int64(key):
+    if isinstance(key, int) and _INT64_MIN <= key <= _INT64_MAX:
+        return key
+    return int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), "little", signed=True)
+
+
+class EvictionLogWriter:
+    """
+    Appends fixed width eviction records into a preallocated buffer and writes it out in bulk.
+    With threaded=True full buffers are handed to a writer thread so the simulation never waits on disk.
+    """
+
+    def __init__(self, file_path, buffer_records=1 << 16, threaded=False):
+        self.file_path = file_path
+        self._file = open(file_path, "wb")
+        self._file.write(struct.pack(HEADER_FMT, MAGIC, VERSION))
+        self._buffer_records = buffer_records
+        self._buffer = bytearray(buffer_records * RECORD_FMT_LEN)
+        self._pack_into = struct.Struct(RECORD_FMT).pack_into
+        self._offset = 0
+        self._end = len(self._buffer)
+        self.record_count = 0
+        self._queue = None
+        self._thread = None
+        if threaded:
+            self._queue = queue.Queue(maxsize=4)
+            self._thread = threading.Thread(target=self._drain, daemon=True)
+            self._thread.start()
+
+    def write(self, obj, request):
+        self._pack_into(
+            self._buffer, self._offset,
+            _key_to_int64(obj.key), obj.size, obj.frequency, obj.ts,
+            request.ts - obj.ts, obj.index, request.index - obj.index
+        )
+        self._offset += RECORD_FMT_LEN
+        self.record_count += 1
+        if self._offset == self._end:
+            self.flush()
+
+    def flush(self):
+        if self._offset == 0:
+            return
+        if self._queue is None:
+            self._file.write(memoryview(self._buffer)[:self._offset])
+        else:
+            self._queue.put(bytes(memoryview(self._buffer)[:self._offset]))
+        self._offset = 0
+
+    def _drain(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            self._file.write(chunk)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class TextEvictionSink:
+    """
+    Eviction sink writing the text log lines of BaseCache.set_eviction_logger.
+    """
+
+    def __init__(self, logger):
+        self.logger = logger
+
+    def write(self, obj, request):
+        self.logger.info(obj.as_log(request))
+
+
+class TeeEvictionSink:
+    """
+    Hands every eviction to several sinks.
+    """
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    def write(self, obj, request):
+        for sink in self.sinks:
+            sink.write(obj, request)
+
+
+def read_eviction_log(file_path):
+    """
+    Loads an eviction log written by EvictionLogWriter.
+    :return: dict of field name -> numpy.ndarray(int64), see RECORD_FIELDS
+    """
+    import numpy as np
+
+    with open(file_path, "rb") as f:
+        magic, version = struct.unpack(HEADER_FMT, f.read(HEADER_FMT_LEN))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{file_path} is not a version {VERSION} eviction log")
+        records = np.fromfile(f, dtype=np.dtype([(field, "<i8") for field in RECORD_FIELDS]))
+    return {field: records[field] for field in RECORD_FIELDS}
@@ -1,14 +1,20 @@
 import hashlib
 from abc import abstractmethod, ABC
 from typing import NewType, NamedTuple
-from sortedcontainers import SortedList
 from collections import defaultdict, namedtuple, deque, Counter
-import bloom_filter
-import probables
 import math
+import random
+import time
 
+import plugins
 from quickselect import kthSmallest
 
+bloom_filter = plugins.lazy_import("bloom_filter")
+cuckoo_filter = plugins.lazy_import("cuckoo_filter")
+np = plugins.lazy_import("numpy")
+probables = plugins.lazy_import("probables")
+sortedcontainers = plugins.lazy_import("sortedcontainers")
+
 
 class BaseFilter(ABC):
     def __init__(self, args):
@@ -30,6 +36,13 @@ class BaseFilter(ABC):
     def should_filter(self, request):
         pass
 
+    def observe(self, request):
+        """
+        Called by CachingSystem.get with every request, hit or miss, when a filter overrides it.
+        should_filter only sees the misses it may admit.
+        """
+        pass
+
     def __repr__(self):
         return f"{self.__class__.__name__}({self.args})"
 
@@ -91,6 +104,7 @@ class BloomFilter(BaseFilter):
          m: int, size of the filter
         """
         super().__init__(args)
+        self._bloom_filter_cls = bloom_filter.BloomFilter
         self._filters = [bloom_filter.BloomFilter(args.n, error_rate=0.001) for _ in range(2)]
         self._current_filter = 0
         self._n = args.n
@@ -107,7 +121,7 @@ class BloomFilter(BaseFilter):
         if self._i > self._n:
             self._i = 0
             self._current_filter = 1 if self._current_filter == 0 else 0
-            self._filters[self._current_filter] = bloom_filter.BloomFilter(self._n, error_rate=0.001)
+            self._filters[self._current_filter] = self._bloom_filter_cls(self._n, error_rate=0.001)
 
         if key not in self._filters[self._current_filter]:
             self._filters[self._current_filter].add(key)
@@ -160,6 +174,50 @@ class CountingBloomFilter(BaseFilter):
         self._i += 1
 
 
+CountingCuckooFilterArgs = namedtuple("CountingCuckooFilterArgs", ["n", "count"])
+
+
+class CountingCuckooFilter(BaseFilter):
+    """
+    CountingBloomFilter on a rotating pair of cuckoo_filter.CuckooFilter: filters a key seen fewer than
+    `count` times since the previous rotation, removal deletes one occurrence.
+    """
+
+    def __init__(self, args):
+        super().__init__(args)
+        self._filters = [cuckoo_filter.CuckooFilter(args.n), cuckoo_filter.CuckooFilter(args.n)]
+        self._curr_filter = 0
+        self._other_filter = 1
+        self._n = args.n
+        self._i = 0
+        self._req_count = args.count
+
+    def should_filter(self, request) -> bool:
+        h = cuckoo_filter.key_hash(request.key)
+        count = self._filters[self._curr_filter].count_hash(h) + self._filters[self._other_filter].count_hash(h)
+        self._put(h)
+        return count < self._req_count
+
+    def remove(self, key):
+        h = cuckoo_filter.key_hash(key)
+        if not self._filters[self._curr_filter].remove_hash(h):
+            self._filters[self._other_filter].remove_hash(h)
+
+    def _rotate(self):
+        self._i = 0
+        self._other_filter, self._curr_filter = self._curr_filter, self._other_filter
+        self._filters[self._curr_filter].clear()
+
+    def _put(self, h):
+        if self._i > self._n:
+            self._rotate()
+        if not self._filters[self._curr_filter].add_hash(h):
+            # the current filter is full before its n insertions, rotate early rather than drop the key
+            self._rotate()
+            self._filters[self._curr_filter].add_hash(h)
+        self._i += 1
+
+
 PercentileFilterArgs = namedtuple("PercentileFilterArgs", ["size", "percentile"])
 
 
@@ -169,7 +227,7 @@ class PercentileFilter(BaseFilter):
     def __init__(self, args):
         super().__init__(args)
         self.sliding_window = deque(maxlen=args.size)
-        self.sorted_sizes = SortedList()
+        self.sorted_sizes = sortedcontainers.SortedList()
         self.window_size = args.size
         self.percentile = args.percentile
         self.percentile_index = int(args.size * (args.percentile / 100))
@@ -190,6 +248,119 @@ class PercentileFilter(BaseFilter):
         return should_filter
 
 
+def adaptsize_hit_ratios(rates, sizes, cache_size, cs, iterations=32):
+    """
+    Object hit ratios of an LRU cache of cache_size bytes that admits with probability exp(-size / c), for
+    every c in cs, by the Markov model of AdaptSize (Berger et al., NSDI 2017). Object i with request rate
+    rates[i] is cached with probability
+        h_i = a_i (e^(r_i T) - 1) / (1 + a_i (e^(r_i T) - 1)),    a_i = exp(-s_i / c)
+    where the characteristic time T of every c solves sum_i h_i s_i = cache_size, found by a bisection on
+    log T run for all c at once.
+    :return: numpy.ndarray of hit ratios, one per c
+    """
+    rates = np.asarray(rates, dtype=np.float64)
+    sizes = np.asarray(sizes, dtype=np.float64)
+    admission = np.exp(-sizes[None, :] / np.asarray(cs, dtype=np.float64)[:, None])
+    evicted = np.empty_like(admission)
+    h = np.empty_like(admission)
+
+    def in_cache(log_t):
+        # a (1 - e^(-rT)) / (e^(-rT) + a (1 - e^(-rT))), stable for large rT, computed in place
+        np.multiply(rates[None, :], -np.exp(log_t), out=evicted)
+        np.exp(evicted, out=evicted)
+        np.subtract(1, evicted, out=h)
+        np.multiply(h, admission, out=h)
+        np.add(evicted, h, out=evicted)
+        # 0 / 0 only for an object that is never admitted, h stays 0
+        np.divide(h, evicted, out=h, where=evicted > 0)
+        return h
+
+    log_low = np.full((len(cs), 1), -20.0)
+    log_high = np.full((len(cs), 1), 60.0)
+    for _ in range(iterations):
+        log_mid = (log_low + log_high) / 2
+        over = (in_cache(log_mid) @ sizes)[:, None] > cache_size
+        log_high = np.where(over, log_mid, log_high)
+        log_low = np.where(over, log_low, log_mid)
+    return (in_cache(log_low) @ rates) / rates.sum()
+
+
+AdaptSizeFilterArgs = namedtuple(
+    "AdaptSizeFilterArgs", ["cache_size", "window", "model_objects", "candidates", "decay", "seed"],
+    defaults=[250000, 2048, 32, 0.3, 0]
+)
+
+
+class AdaptSizeFilter(BaseFilter):
+    """
+    Admits an object of size s with probability exp(-s / c), everything until c is first tuned.
+    Every `window` requests c is re-tuned to the one of `candidates` log spaced values between the smallest
+    object and cache_size that maximises adaptsize_hit_ratios. Request rates are request counts per window,
+    smoothed over windows with weight `decay` for the latest; the model runs on a sample of model_objects
+    objects against a proportionally scaled cache.
+    """
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.c = None
+        self._random = random.Random(args.seed)
+        self._sample_seed = args.seed
+        self._window_counts = {}
+        # key -> [smoothed request count, size]
+        self._counts = {}
+        self._observed = 0
+        # (request count, c, modelled hit ratio, seconds)
+        self.tuning_history = []
+
+    def observe(self, request):
+        entry = self._window_counts.get(request.key)
+        if entry is None:
+            self._window_counts[request.key] = [1, request.size]
+        else:
+            entry[0] += 1
+            entry[1] = request.size
+        self._observed += 1
+        if self._observed % self.args.window == 0:
+            self._tune()
+
+    def should_filter(self, request) -> bool:
+        if self.c is None:
+            return False
+        return self._random.random() >= math.exp(-request.size / self.c)
+
+    def _tune(self):
+        start = time.perf_counter()
+        decay = self.args.decay
+        counts = self._counts
+        for entry in counts.values():
+            entry[0] *= 1 - decay
+        for key, (count, size) in self._window_counts.items():
+            entry = counts.get(key)
+            if entry is None:
+                counts[key] = [decay * count, size]
+            else:
+                entry[0] += decay * count
+                entry[1] = size
+        self._window_counts = {}
+        # forget objects not requested for several windows
+        self._counts = counts = {key: entry for key, entry in counts.items() if entry[0] >= 0.1}
+
+        stats = np.array(list(counts.values()), dtype=np.float64)
+        cache_size = self.args.cache_size
+        if len(stats) > self.args.model_objects:
+            rng = np.random.default_rng(self._sample_seed + len(self.tuning_history))
+            cache_size = cache_size * self.args.model_objects / len(stats)
+            stats = stats[rng.choice(len(stats), self.args.model_objects, replace=False)]
+        rates = stats[:, 0] / self.args.window
+        sizes = stats[:, 1]
+        cs = np.logspace(math.log2(max(sizes.min(), 1)), math.log2(self.args.cache_size), self.args.candidates,
+                         base=2)
+        hit_ratios = adaptsize_hit_ratios(rates, sizes, cache_size, cs)
+        best = int(np.argmax(hit_ratios))
+        self.c = float(cs[best])
+        self.tuning_history.append((self._observed, self.c, float(hit_ratios[best]), time.perf_counter() - start))
+
+
 PercentileAndBloomFilterArgs = namedtuple("PercentileBloomFilterArgs", ["size", "percentile", "n"])
 
 
@@ -198,7 +369,7 @@ class PercentileAndBloomFilter(BaseFilter):
     def __init__(self, args):
         super().__init__(args)
         self.sliding_window = deque(maxlen=args.size)
-        self.sorted_sizes = SortedList()
+        self.sorted_sizes = sortedcontainers.SortedList()
         self.size_counter = Counter()
         self.window_size = args.size
         self.percentile = args.percentile
@@ -254,6 +425,8 @@ class KPercentileBloomFilter(BaseFilter):
     p_i        0          1           2           3
         bfg0       bfg1       bfg2        bfg3        bfg4
     """
+    counting_filter_cls = CountingBloomFilter
+    counting_filter_args_cls = CountingBloomFilterArgs
 
     def __init__(self, args):
         super().__init__(args)
@@ -262,14 +435,15 @@ class KPercentileBloomFilter(BaseFilter):
         assert len(set(args.percentiles)) == len(args.percentiles)
 
         self.sliding_window = deque(maxlen=args.size)
-        self.sorted_sizes = SortedList()
+        self.sorted_sizes = sortedcontainers.SortedList()
         self.window_size = args.size
         self.percentiles = sorted(args.percentiles)
         self.percentile_indices = [
             int(args.size * (percentile / 100)) for percentile in self.percentiles
         ]
         self.bloom_filter_group = [
-            CountingBloomFilter(CountingBloomFilterArgs(args.n, i)) for i in range(len(self.percentiles) + 1)
+            self.counting_filter_cls(self.counting_filter_args_cls(args.n, i))
+            for i in range(len(self.percentiles) + 1)
         ]
         self.curr_index = 0
 
@@ -295,13 +469,57 @@ class KPercentileBloomFilter(BaseFilter):
         should_filter = self._should_filter(request)
         oldest_req = self.sliding_window.popleft()
         i = self._find_index(oldest_req.size)
-        self.bloom_filter_group[i].remove(str(oldest_req.key))
+        self.bloom_filter_group[i].remove(oldest_req.key)
         self.sorted_sizes.remove(oldest_req.size)
         self.sliding_window.append(request)
         self.sorted_sizes.add(request.size)
         return should_filter
 
 
+class KPercentileCuckooFilter(KPercentileBloomFilter):
+    """
+    KPercentileBloomFilter with CountingCuckooFilter groups.
+    """
+    counting_filter_cls = CountingCuckooFilter
+    counting_filter_args_cls = CountingCuckooFilterArgs
+
+
+CuckooSetFilterArgs = namedtuple("CuckooSetFilterArgs", ["n"])
+
+
+class CuckooSetFilter(BaseFilter):
+    """
+    SetFilter bounded to the n most recently first seen keys: filters a key's first request, remembering
+    keys in a cuckoo_filter.CuckooFilter and their hashes in a ring from which the oldest is deleted.
+    """
+
+    def __init__(self, args):
+        super().__init__(args)
+        self._filter = cuckoo_filter.CuckooFilter(args.n)
+        self._ring_array = np.zeros(args.n, dtype=np.uint64)
+        self._ring = memoryview(self._ring_array)
+        self._head = 0
+        self._count = 0
+
+    def _forget_oldest(self):
+        self._filter.remove_hash(self._ring[self._head])
+        self._head = (self._head + 1) % len(self._ring_array)
+        self._count -= 1
+
+    def should_filter(self, request):
+        h = cuckoo_filter.key_hash(request.key)
+        if self._filter.count_hash(h):
+            return False
+        if self._count == len(self._ring_array):
+            self._forget_oldest()
+        # keys crowding the same buckets can fill them before n keys are held, make room instead of dropping h
+        while not self._filter.add_hash(h) and self._count:
+            self._forget_oldest()
+        self._ring[(self._head + self._count) % len(self._ring_array)] = h
+        self._count += 1
+        return True
+
+
 _name_to_cls = {
     "Bloom": {
         "filter": BloomFilter,
@@ -319,6 +537,10 @@ _name_to_cls = {
         "filter": PercentileFilter,
         "args": PercentileFilterArgs
     },
+    "AdaptSize": {
+        "filter": AdaptSizeFilter,
+        "args": AdaptSizeFilterArgs
+    },
     "PercentileAndBloom": {
         "filter": PercentileAndBloomFilter,
         "args": PercentileAndBloomFilterArgs
@@ -327,20 +549,31 @@ _name_to_cls = {
         "filter": KPercentileBloomFilter,
         "args": KPercentileBloomFilterArgs
     },
+    "KPercentileCuckoo": {
+        "filter": KPercentileCuckooFilter,
+        "args": KPercentileBloomFilterArgs
+    },
     "Set": {
         "filter": SetFilter,
         "args": SetFilterArgs
+    },
+    "CuckooSet": {
+        "filter": CuckooSetFilter,
+        "args": CuckooSetFilterArgs
     }
 }
 
 
 def initialize_filter(filter_name, **kwargs):
+    """
+    Looks the name up in the plugin registry, see plugins.py.
+    """
     try:
-        cls = _name_to_cls[filter_name]["filter"]
+        plugin = plugins.resolve(plugins.FILTER, filter_name)
     except KeyError:
         raise KeyError(f"Filter with {filter_name} is not implemented. Check _name_to_cls in filters.py")
-    args = _name_to_cls[filter_name]["args"](**kwargs)
-    return cls(args)
+    args = plugin["args"](**kwargs)
+    return plugin["filter"](args)
 
 
 Filter = NewType("Filter", BaseFilter)
@@ -0,0 +1,83 @@
+"""
+NumPy only models for learned eviction. Models are stateless: fit returns the parameters and predict
+takes them, so a fit can run on a background thread while the cache keeps scoring with the
+previous parameters.
+"""
+import numpy as np
+
+
+
+class RidgeModel:
+    """
+    Linear least squares with L2 regularisation, solved in closed form.
+    """
+
+    def __init__(self, l2=1.0):
+        self.l2 = l2
+
+    def fit(self, features, labels):
+        gram = features.T @ features
+        gram[np.diag_indices_from(gram)] += self.l2
+        return np.linalg.solve(gram, features.T @ labels)
+
+    @staticmethod
+    def predict(params, features):
+        return features @ params
+
+
+class StumpBoostingModel:
+    """
+    Gradient boosted depth 1 trees on squared error, split points taken from feature quantiles.
+    Every round fits all (feature, threshold) stumps at once through cumulative sums over the
+    quantile bins, so a fit costs O(rounds * features * bins) NumPy work after one binning pass.
+    """
+
+    def __init__(self, rounds=32, learning_rate=0.3, bins=16):
+        self.rounds = rounds
+        self.learning_rate = learning_rate
+        self.bins = bins
+
+    def fit(self, features, labels):
+        sample_count, feature_count = features.shape
+        quantiles = np.linspace(0, 1, self.bins + 1)[1:-1]
+        thresholds = np.quantile(features, quantiles, axis=0).T  # features x (bins - 1)
+        binned = np.empty((sample_count, feature_count), dtype=np.int64)
+        for f in range(feature_count):
+            binned[:, f] = np.searchsorted(thresholds[f], features[:, f], side="right")
+        offsets = (np.arange(feature_count) * self.bins)[None, :]
+        flat_bins = (binned + offsets).ravel()
+        bin_counts = np.bincount(flat_bins, minlength=feature_count * self.bins).reshape(feature_count, self.bins)
+        left_counts = np.cumsum(bin_counts, axis=1)[:, :-1]
+        right_counts = sample_count - left_counts
+
+        base = labels.mean()
+        residual = labels - base
+        stumps = []
+        for _ in range(self.rounds):
+            bin_sums = np.bincount(flat_bins, weights=np.repeat(residual, feature_count),
+                                   minlength=feature_count * self.bins).reshape(feature_count, self.bins)
+            left_sums = np.cumsum(bin_sums, axis=1)[:, :-1]
+            right_sums = residual.sum() - left_sums
+            with np.errstate(divide="ignore", invalid="ignore"):
+                gain = np.where(left_counts > 0, left_sums ** 2 / left_counts, 0) + \
+                       np.where(right_counts > 0, right_sums ** 2 / right_counts, 0)
+            f, split = np.unravel_index(np.argmax(gain), gain.shape)
+            left_value = self.learning_rate * left_sums[f, split] / max(left_counts[f, split], 1)
+            right_value = self.learning_rate * right_sums[f, split] / max(right_counts[f, split], 1)
+            goes_left = binned[:, f] <= split
+            residual -= np.where(goes_left, left_value, right_value)
+            stumps.append((f, thresholds[f, split], left_value, right_value))
+        return base, np.array(stumps)
+
+    @staticmethod
+    def predict(params, features):
+        base, stumps = params
+        feature_index = stumps[:, 0].astype(np.int64)
+        goes_left = features[:, feature_index] < stumps[:, 1]
+        return base + np.where(goes_left, stumps[:, 2], stumps[:, 3]).sum(axis=1)
+
+
+_name_to_model = {
+    "ridge": RidgeModel,
+    "gbdt": StumpBoostingModel,
+}
@@ -0,0 +1,454 @@
+"""
+Miss classification against ghost caches that see the same requests as the real caching stack.
+A miss of the real stack is tagged, in this order,
+    compulsory: first request for the key
+    expired:    the cache dropped the key when its ttl ran out (see BaseCache.enable_expiry)
+    filter:     an unfiltered ghost of the cache's size holds the key, the filter kept it out
+    capacity:   a `ghost_factor` times larger ghost LRU holds the key, more capacity would have hit
+    beyond:     the larger ghost misses too, the reuse is longer than ghost_factor times the cache
+Ghosts keep only 63 bit key fingerprints and sizes in int64 arrays. The unfiltered ghost follows the cache
+policy where ghost_policy has an array version of it (FIFO) and is an LRU otherwise, the larger ghost is
+always an LRU, so "filter" and "capacity" are LRU estimates for the other policies. The first seen set is
+the only structure that grows with the number of unique keys, at 16 to 32 bytes per key.
+
+The callbacks only buffer the fingerprint, size and outcome of each request; the buffer is classified in
+one pass per ordinal window. The pass is compiled with Numba when it is installed and runs as plain Python
+over the same arrays otherwise.
+"""
+from array import array
+
+import numpy as np
+
+from cuckoo_filter import key_hash
+from traces import CacheRequest
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    njit = None
+    NUMBA_AVAILABLE = False
+
+MISS_CLASSES = ("compulsory", "expired", "filter", "capacity", "beyond")
+
+_FINGERPRINT_MASK = (1 << 63) - 1
+_FIBONACCI_MULTIPLIER = 0x9E3779B97F4A7C15
+
+# request outcomes in the buffer
+_HIT = 0
+_MISS = 1
+_EXPIRED_MISS = 2
+
+# FingerprintSet header
+_SET_COUNT = 0
+_SET_BITS = 1
+
+# GhostLRU header
+_CAPACITY = 0
+_CURR_CAPACITY = 1
+_COUNT = 2
+_BITS = 3
+_NODE_COUNT = 4
+_FREE_COUNT = 5
+_PROMOTE = 6
+
+
+def fingerprint(key):
+    """
+    :return: non zero 63 bit fingerprint, stable across processes and one to one on integer keys below 2 ** 63
+    """
+    if type(key) is int and 0 <= key <= _FINGERPRINT_MASK:
+        return (key * _FIBONACCI_MULTIPLIER) & _FINGERPRINT_MASK or 1
+    return key_hash(key) & _FINGERPRINT_MASK or 1
+
+
+def _kernel_arrays(arrays):
+    """
+    :return: the arrays as the kernels take them, memoryviews index much faster than NumPy scalars in Python
+    """
+    if NUMBA_AVAILABLE:
+        return arrays
+    return tuple(memoryview(a) for a in arrays)
+
+
+def _set_add(fingerprint_set, fp):
+    header, slots = fingerprint_set
+    mask = (1 << header[_SET_BITS]) - 1
+    i = fp >> (63 - header[_SET_BITS])
+    while True:
+        value = slots[i]
+        if value == fp:
+            return False
+        if value == 0:
+            break
+        i = (i + 1) & mask
+    slots[i] = fp
+    header[_SET_COUNT] += 1
+    return True
+
+
+def _set_rehash(fingerprint_set, old_slots):
+    for fp in old_slots:
+        if fp:
+            _set_add(fingerprint_set, fp)
+
+
+def _ghost_find(ghost, fp):
+    """
+    :return: table position of fp, or of the empty slot ending its probe run
+    """
+    header, table_fps = ghost[0], ghost[1]
+    mask = (1 << header[_BITS]) - 1
+    i = fp >> (63 - header[_BITS])
+    while True:
+        value = table_fps[i]
+        if value == fp or value == 0:
+            return i
+        i = (i + 1) & mask
+
+
+def _ghost_delete(ghost, i):
+    header, table_fps, table_nodes = ghost[0], ghost[1], ghost[2]
+    mask = (1 << header[_BITS]) - 1
+    shift = 63 - header[_BITS]
+    j = i
+    while True:
+        j = (j + 1) & mask
+        value = table_fps[j]
+        if value == 0:
+            break
+        home = value >> shift
+        # move the entry at j back to i unless its home lies cyclically in (i, j]
+        if (j - home) & mask >= (j - i) & mask:
+            table_fps[i] = value
+            table_nodes[i] = table_nodes[j]
+            i = j
+    table_fps[i] = 0
+
+
+def _ghost_rehash(ghost):
+    table_fps, table_nodes, fps, next_ = ghost[1], ghost[2], ghost[3], ghost[6]
+    node = next_[0]
+    while node:
+        i = _ghost_find(ghost, fps[node])
+        table_fps[i] = fps[node]
+        table_nodes[i] = node
+        node = next_[node]
+
+
+def _ghost_access(ghost, fp, size):
+    """
+    Looks fp up and admits it on a miss, the ghost must have room for one more entry (see GhostLRU.reserve).
+    :return: True on a hit
+    """
+    header, table_fps, table_nodes, fps, sizes, prev, next_, free = ghost
+    i = _ghost_find(ghost, fp)
+    if table_fps[i]:
+        if header[_PROMOTE]:
+            # unlink and relink as the most recent
+            node = table_nodes[i]
+            p = prev[node]
+            n = next_[node]
+            next_[p] = n
+            prev[n] = p
+            last = prev[0]
+            next_[last] = node
+            prev[node] = last
+            next_[node] = 0
+            prev[0] = node
+        return True
+    capacity = header[_CAPACITY]
+    if size > capacity:
+        return False
+    curr_capacity = header[_CURR_CAPACITY] + size
+    if curr_capacity > capacity:
+        while curr_capacity > capacity:
+            victim = next_[0]
+            n = next_[victim]
+            next_[0] = n
+            prev[n] = 0
+            curr_capacity -= sizes[victim]
+            _ghost_delete(ghost, _ghost_find(ghost, fps[victim]))
+            free[header[_FREE_COUNT]] = victim
+            header[_FREE_COUNT] += 1
+            header[_COUNT] -= 1
+        # the deletions may have shifted fp's probe run
+        i = _ghost_find(ghost, fp)
+    header[_CURR_CAPACITY] = curr_capacity
+    if header[_FREE_COUNT]:
+        header[_FREE_COUNT] -= 1
+        node = free[header[_FREE_COUNT]]
+    else:
+        node = header[_NODE_COUNT]
+        header[_NODE_COUNT] += 1
+    fps[node] = fp
+    sizes[node] = size
+    last = prev[0]
+    next_[last] = node
+    prev[node] = last
+    next_[node] = 0
+    prev[0] = node
+    header[_COUNT] += 1
+    table_fps[i] = fp
+    table_nodes[i] = node
+    return False
+
+
+def _classify(fps, sizes, outcomes, seen, larger_ghost, unfiltered_ghost, use_unfiltered, counts, miss_bytes):
+    """
+    Runs a buffer of requests through the ghosts and adds its misses to counts and miss_bytes,
+    indexed like MISS_CLASSES.
+    """
+    for r in range(len(fps)):
+        fp = fps[r]
+        size = sizes[r]
+        first_seen = _set_add(seen, fp)
+        larger_hit = _ghost_access(larger_ghost, fp, size)
+        unfiltered_hit = False
+        if use_unfiltered:
+            unfiltered_hit = _ghost_access(unfiltered_ghost, fp, size)
+        outcome = outcomes[r]
+        if outcome == _HIT:
+            continue
+        if first_seen:
+            miss_class = 0
+        elif outcome == _EXPIRED_MISS:
+            miss_class = 1
+        elif unfiltered_hit:
+            miss_class = 2
+        elif larger_hit:
+            miss_class = 3
+        else:
+            miss_class = 4
+        counts[miss_class] += 1
+        miss_bytes[miss_class] += size
+
+
+if NUMBA_AVAILABLE:
+    _set_add = njit(cache=True, nogil=True)(_set_add)
+    _set_rehash = njit(cache=True, nogil=True)(_set_rehash)
+    _ghost_find = njit(cache=True, nogil=True)(_ghost_find)
+    _ghost_delete = njit(cache=True, nogil=True)(_ghost_delete)
+    _ghost_rehash = njit(cache=True, nogil=True)(_ghost_rehash)
+    _ghost_access = njit(cache=True, nogil=True)(_ghost_access)
+    _classify = njit(cache=True, nogil=True)(_classify)
+
+
+class FingerprintSet:
+    """
+    Open addressing set of fingerprints in an int64 array, 0 marks an empty slot.
+    Slots are picked by the top bits of the fingerprint and probed linearly; the table is kept at most half full.
+    """
+
+    def __init__(self, capacity_bits=16):
+        self._header = np.array([0, capacity_bits], dtype=np.int64)
+        self._slots = np.zeros(1 << capacity_bits, dtype=np.int64)
+        self._arrays = _kernel_arrays((self._header, self._slots))
+
+    @property
+    def count(self):
+        return int(self._header[_SET_COUNT])
+
+    def reserve(self, extra):
+        """
+        Grows the table so that extra more fingerprints keep it at most half full.
+        """
+        bits = int(self._header[_SET_BITS])
+        while (self.count + extra) << 1 > (1 << bits) - 1:
+            bits += 1
+        if bits == self._header[_SET_BITS]:
+            return
+        old_slots = self._arrays[1]
+        self._header[:] = (0, bits)
+        self._slots = np.zeros(1 << bits, dtype=np.int64)
+        self._arrays = _kernel_arrays((self._header, self._slots))
+        _set_rehash(self._arrays, old_slots)
+
+    def add(self, fp):
+        """
+        :return: True if fp was not in the set
+        """
+        self.reserve(1)
+        return _set_add(self._arrays, fp)
+
+
+class GhostLRU:
+    """
+    LRU over fingerprints that tracks sizes only, kept in int64 arrays.
+    Entries are nodes of a doubly linked list in the fps, sizes, prev and next arrays, node 0 being
+    the list head, and freed nodes are stacked in free. They are found through an open addressing table of
+    fingerprints and node numbers, probed linearly from the top bits of the fingerprint and kept at most
+    half full; evicted fingerprints are deleted by shifting the rest of their probe run back, so the table
+    needs no tombstones. An entry takes 40 bytes of nodes and 32 to 64 bytes of table.
+    """
+    promote_on_hit = True
+
+    def __init__(self, capacity, capacity_bits=10):
+        self._header = np.zeros(_PROMOTE + 1, dtype=np.int64)
+        self._header[_CAPACITY] = capacity
+        self._header[_BITS] = capacity_bits
+        self._header[_NODE_COUNT] = 1
+        self._header[_PROMOTE] = self.promote_on_hit
+        self._table_fps = np.zeros(1 << capacity_bits, dtype=np.int64)
+        self._table_nodes = np.zeros(1 << capacity_bits, dtype=np.int64)
+        self._nodes = np.zeros((5, 1 << capacity_bits), dtype=np.int64)
+        self._refresh_arrays()
+
+    def _refresh_arrays(self):
+        fps, sizes, prev, next_, free = self._nodes
+        self._arrays = _kernel_arrays(
+            (self._header, self._table_fps, self._table_nodes, fps, sizes, prev, next_, free)
+        )
+
+    @property
+    def capacity(self):
+        return int(self._header[_CAPACITY])
+
+    @property
+    def curr_capacity(self):
+        return int(self._header[_CURR_CAPACITY])
+
+    @property
+    def count(self):
+        return int(self._header[_COUNT])
+
+    def reserve(self, extra):
+        """
+        Grows the nodes and the table so that extra more accesses fit.
+        """
+        # nodes are only allocated when none is free, so at most count + 1 are ever in use
+        needed = self.count + extra + 1
+        if needed > self._nodes.shape[1]:
+            nodes = np.zeros((5, max(needed, self._nodes.shape[1] << 1)), dtype=np.int64)
+            nodes[:, :self._nodes.shape[1]] = self._nodes
+            self._nodes = nodes
+            self._refresh_arrays()
+        bits = int(self._header[_BITS])
+        while (self.count + extra) << 1 > (1 << bits) - 1:
+            bits += 1
+        if bits != self._header[_BITS]:
+            self._header[_BITS] = bits
+            self._table_fps = np.zeros(1 << bits, dtype=np.int64)
+            self._table_nodes = np.zeros(1 << bits, dtype=np.int64)
+            self._refresh_arrays()
+            _ghost_rehash(self._arrays)
+
+    def access(self, fp, size):
+        """
+        Looks fp up and admits it on a miss.
+        :return: True on a hit
+        """
+        self.reserve(1)
+        return _ghost_access(self._arrays, fp, size)
+
+
+class GhostFIFO(GhostLRU):
+    """
+    GhostLRU that leaves hits in place, so entries are evicted in admission order.
+    """
+    promote_on_hit = False
+
+
+_ghost_policies = {
+    "FIFO": GhostFIFO,
+}
+
+
+def ghost_policy(cache_type):
+    """
+    :return: the ghost class closest to the cache_type policy
+    """
+    return _ghost_policies.get(cache_type, GhostLRU)
+
+
+class MissClassifier:
+    """
+    Hit/miss callbacks for a Simulation that classify its misses, see MISS_CLASSES.
+    Counts and bytes are kept per ordinal window, segmented the same way as Simulation.run.
+    unfiltered_ghost is a ghost (see ghost_policy) of the cache's capacity, None when the stack has no filter,
+    no miss is filter induced then.
+    """
+
+    def __init__(self, cache_instance, ordinal_window, unfiltered_ghost=None, ghost_factor=4):
+        self.ordinal_window = ordinal_window
+        self.ghost_factor = ghost_factor
+        self._cache_instance = cache_instance
+        self._seen = FingerprintSet()
+        self._larger_ghost = GhostLRU(cache_instance.capacity * ghost_factor)
+        self._unfiltered_ghost = unfiltered_ghost
+        self._curr_trace_index = 0
+        self._fps = array('q')
+        self._sizes = array('q')
+        self._outcomes = array('b')
+        self._segment_count = np.zeros(len(MISS_CLASSES), dtype=np.int64)
+        self._segment_bytes = np.zeros(len(MISS_CLASSES), dtype=np.int64)
+        self.segment_count_lists = {miss_class: [] for miss_class in MISS_CLASSES}
+        self.segment_bytes_lists = {miss_class: [] for miss_class in MISS_CLASSES}
+
+    def _next(self):
+        index = self._curr_trace_index
+        if index != 0 and index % self.ordinal_window == 0:
+            self.record_segment()
+        self._curr_trace_index = index + 1
+
+    def _classify_buffered(self):
+        count = len(self._fps)
+        if count == 0:
+            return
+        ghosts = [self._larger_ghost] + ([self._unfiltered_ghost] if self._unfiltered_ghost is not None else [])
+        for ghost in ghosts:
+            ghost.reserve(count)
+        self._seen.reserve(count)
+        if NUMBA_AVAILABLE:
+            buffers = (np.frombuffer(self._fps, dtype=np.int64), np.frombuffer(self._sizes, dtype=np.int64),
+                       np.frombuffer(self._outcomes, dtype=np.int8))
+        else:
+            buffers = (self._fps, self._sizes, self._outcomes)
+        _classify(*buffers, self._seen._arrays, ghosts[0]._arrays, ghosts[-1]._arrays, len(ghosts) == 2,
+                  *_kernel_arrays((self._segment_count, self._segment_bytes)))
+        # the NumPy views must be gone before the buffers can shrink
+        del buffers
+        del self._fps[:]
+        del self._sizes[:]
+        del self._outcomes[:]
+
+    def record_segment(self):
+        self._classify_buffered()
+        for i, miss_class in enumerate(MISS_CLASSES):
+            self.segment_count_lists[miss_class].append(int(self._segment_count[i]))
+            self.segment_bytes_lists[miss_class].append(int(self._segment_bytes[i]))
+        self._segment_count[:] = 0
+        self._segment_bytes[:] = 0
+
+    def finish(self):
+        """
+        Records the last partial segment, call once after Simulation.run.
+        """
+        if (self._curr_trace_index - 1) % self.ordinal_window != 0:
+            self.record_segment()
+
+    def on_hit_callback(self, request: CacheRequest):
+        self._fps.append(fingerprint(request.key))
+        self._sizes.append(request.size)
+        self._outcomes.append(_HIT)
+        self._next()
+
+    def on_miss_callback(self, request: CacheRequest):
+        self._fps.append(fingerprint(request.key))
+        self._sizes.append(request.size)
+        self._outcomes.append(_EXPIRED_MISS if self._cache_instance.last_get_expired else _MISS)
+        self._next()
+
+    def as_dict(self):
+        return {
+            "ghost_factor": self.ghost_factor,
+            "unique_keys": self._seen.count,
+            "miss_count": {miss_class: sum(counts) for miss_class, counts in self.segment_count_lists.items()},
+            "miss_bytes": {miss_class: sum(sizes) for miss_class, sizes in self.segment_bytes_lists.items()},
+            "segment_stats": {
+                **{f"segment_{miss_class}_miss_count": counts
+                   for miss_class, counts in self.segment_count_lists.items()},
+                **{f"segment_{miss_class}_miss_bytes": sizes
+                   for miss_class, sizes in self.segment_bytes_lists.items()},
+            }
+        }
@@ -0,0 +1,190 @@
+import argparse
+import hashlib
+import json
+import os
+from collections import defaultdict
+from datetime import datetime
+from json import JSONDecodeError
+from multiprocessing import Pool
+from urllib import parse
+
+from caches import initialize_cache
+from caching_system import CachingSystem
+from filters import initialize_filter
+from simulation import ordinal_window_index
+from trace_to_block import BlockTraceReader
+from traces import initialize_iterator
+
+_SEGMENT_FIELDS = ("segment_total_count", "segment_total_bytes", "segment_miss_count", "segment_miss_bytes")
+REPORT_CACHE_TYPES = ("LRU", "SLRU", "GDSF")
+
+
+def _slice_bounds(total_count, slices, ordinal_window):
+    """
+    Splits [0, total_count) into contiguous slices that start on segment boundaries,
+    so no segment is shared between two slices.
+    :return: list of (start index, end index)
+    """
+    window_count = ordinal_window_index(total_count - 1, ordinal_window) + 1
+    slices = max(min(slices, window_count), 1)
+    window_starts = [window_count * i // slices for i in range(slices)] + [window_count]
+    bounds = []
+    for first_window, end_window in zip(window_starts, window_starts[1:]):
+        start = 0 if first_window == 0 else first_window * ordinal_window + 1
+        end = total_count if end_window == window_count else end_window * ordinal_window + 1
+        bounds.append((start, end))
+    return bounds
+
+
+def _replay_slice(task):
+    """
+    Replays [start - warmup, end) of a block trace and counts only [start, end),
+    aggregated per global segment.
+    """
+    file_path, start, end, warmup, cache_type, cache_size, filter_type, filter_args, ordinal_window = task
+    caching_system = CachingSystem(
+        initialize_filter(filter_type, **filter_args), initialize_cache(cache_type, cache_size)
+    )
+    stats = {field: defaultdict(int) for field in _SEGMENT_FIELDS}
+    total_count, total_bytes = stats["segment_total_count"], stats["segment_total_bytes"]
+    miss_count, miss_bytes = stats["segment_miss_count"], stats["segment_miss_bytes"]
+    trace_iterator = initialize_iterator("block", file_path, start_index=max(start - warmup, 0), end_index=end)
+    for request in trace_iterator:
+        is_miss = caching_system.get(request) is None
+        if is_miss:
+            caching_system.put(request)
+        if request.index < start:
+            continue
+        window = ordinal_window_index(request.index, ordinal_window)
+        total_count[window] += 1
+        total_bytes[window] += request.size
+        if is_miss:
+            miss_count[window] += 1
+            miss_bytes[window] += request.size
+    return {field: dict(values) for field, values in stats.items()}
+
+
+def _ratio(segment_stats, miss_field, total_field, warmup=0):
+    assert 0 <= warmup < 100
+    start_index = int(len(segment_stats[total_field]) * warmup / 100)
+    return sum(segment_stats[miss_field][start_index:]) / sum(segment_stats[total_field][start_index:])
+
+
+def simulate_sliced(cache_type, cache_size, file_path, filter_type="Null", filter_args=None,
+                    slices=os.cpu_count(), warmup=1000000, ordinal_window=1000000, processes=None):
+    """
+    Splits a block trace into `slices` contiguous slices replayed in parallel. Each slice first
+    replays `warmup` requests of the preceding slice without counting them, then the per segment
+    statistics of every slice are stitched into one result.
+    """
+    filter_args = filter_args or {}
+    start_time = datetime.now()
+    with open(file_path, "rb") as f:
+        total_count = BlockTraceReader(f).total_count
+    tasks = [
+        (file_path, start, end, warmup, cache_type, cache_size, filter_type, filter_args, ordinal_window)
+        for start, end in _slice_bounds(total_count, slices, ordinal_window)
+    ]
+    if processes == 1 or len(tasks) == 1:
+        slice_results = [_replay_slice(task) for task in tasks]
+    else:
+        with Pool(processes) as pool:
+            slice_results = pool.map(_replay_slice, tasks)
+
+    window_count = ordinal_window_index(total_count - 1, ordinal_window) + 1
+    segment_stats = {field: [0] * window_count for field in _SEGMENT_FIELDS}
+    for slice_result in slice_results:
+        for field in _SEGMENT_FIELDS:
+            for window, value in slice_result[field].items():
+                segment_stats[field][window] += value
+    end_time = datetime.now()
+    return {
+        "cache_type": cache_type,
+        "cache_size": cache_size,
+        "filter_type": filter_type,
+        "filter_args": filter_args,
+        "trace_file": initialize_iterator("block", file_path).trace_filename,
+        "slices": len(tasks),
+        "slice_warmup": warmup,
+        "no_warmup_byte_miss_ratio": _ratio(segment_stats, "segment_miss_bytes", "segment_total_bytes"),
+        "segment_stats": segment_stats,
+        "20p_warmup_bmr": _ratio(segment_stats, "segment_miss_bytes", "segment_total_bytes", 20),
+        "20p_warmup_omr": _ratio(segment_stats, "segment_miss_count", "segment_total_count", 20),
+        "simulation_time": (end_time - start_time).total_seconds(),
+        "simulation_timestamp": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def approximation_report(cache_size, file_path, filter_type="Null", filter_args=None, slices=os.cpu_count(),
+                         warmup=1000000, ordinal_window=1000000, processes=None, cache_types=REPORT_CACHE_TYPES):
+    """
+    Quantifies the error of the sliced replay against a serial replay for every cache type.
+    """
+    report = {}
+    for cache_type in cache_types:
+        serial = simulate_sliced(cache_type, cache_size, file_path, filter_type, filter_args,
+                                 1, 0, ordinal_window, processes)
+        sliced = simulate_sliced(cache_type, cache_size, file_path, filter_type, filter_args,
+                                 slices, warmup, ordinal_window, processes)
+        window_bmr_errors = [
+            abs(s_miss / s_total - p_miss / p_total)
+            for s_miss, s_total, p_miss, p_total in zip(
+                serial["segment_stats"]["segment_miss_bytes"], serial["segment_stats"]["segment_total_bytes"],
+                sliced["segment_stats"]["segment_miss_bytes"], sliced["segment_stats"]["segment_total_bytes"]
+            ) if s_total and p_total
+        ]
+        report[cache_type] = {
+            "serial_20p_warmup_bmr": serial["20p_warmup_bmr"],
+            "sliced_20p_warmup_bmr": sliced["20p_warmup_bmr"],
+            "abs_error_20p_warmup_bmr": abs(serial["20p_warmup_bmr"] - sliced["20p_warmup_bmr"]),
+            "abs_error_20p_warmup_omr": abs(serial["20p_warmup_omr"] - sliced["20p_warmup_omr"]),
+            "abs_error_no_warmup_bmr": abs(
+                serial["no_warmup_byte_miss_ratio"] - sliced["no_warmup_byte_miss_ratio"]
+            ),
+            "max_abs_error_segment_bmr": max(window_bmr_errors, default=0),
+            "serial_simulation_time": serial["simulation_time"],
+            "sliced_simulation_time": sliced["simulation_time"],
+        }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('cacheType', help="ignored with --report, which covers LRU, SLRU and GDSF")
+    parser.add_argument('cacheSize', type=int)
+    parser.add_argument('traceFile', help="block trace, see trace_to_block.py")
+    parser.add_argument('--slices', default=os.cpu_count(), type=int)
+    parser.add_argument('--warmup', default=1000000, type=int, help="overlap in requests")
+    parser.add_argument('--ordinalWindowSize', default=1000000, type=int)
+    parser.add_argument('--filterType', default="Null", dest='filterType')
+    parser.add_argument('--filterArgs', default="{}")
+    parser.add_argument('--processes', default=None, type=int)
+    parser.add_argument('--report', action='store_true')
+    parser.add_argument('--resultIdentifier', default="regular", dest='resultIdentifier')
+    args = parser.parse_args()
+
+    trace_dir = os.environ["TRACE_DIRECTORY"]
+    simulation_res_dir = os.environ["SIMULATION_RESULT_DIRECTORY"]
+    if not os.path.exists(simulation_res_dir):
+        os.makedirs(simulation_res_dir)
+
+    try:
+        filter_args = json.loads(args.filterArgs)
+    except JSONDecodeError:
+        filter_args = json.loads(parse.unquote(args.filterArgs))
+    file_path = f"{trace_dir}/{args.traceFile}"
+    if args.report:
+        res = approximation_report(args.cacheSize, file_path, args.filterType, filter_args, args.slices,
+                                   args.warmup, args.ordinalWindowSize, args.processes)
+        prefix = "sliced_report"
+    else:
+        res = simulate_sliced(args.cacheType, args.cacheSize, file_path, args.filterType, filter_args,
+                              args.slices, args.warmup, args.ordinalWindowSize, args.processes)
+        prefix = f"sliced_{args.cacheType}"
+
+    h = hashlib.blake2s(digest_size=16)
+    h.update(f"{prefix}_{args.cacheSize}_{args.filterType}_{filter_args}_{args.traceFile}_"
+             f"{args.slices}_{args.warmup}_{args.resultIdentifier}".encode())
+    with open(f"{simulation_res_dir}/{h.hexdigest()}.json", "w") as f:
+        json.dump(res, f, sort_keys=True, indent=4)
+    print(res)
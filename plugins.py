@@ -0,0 +1,194 @@
+"""
+Plugins are caches, filters and trace iterators selected by name.
+
+Built in plugins live in the `_name_to_cls` dict of their provider module (caches.py, filters.py,
+traces.py); a provider module is imported only when one of its names is selected, and provider
+modules bind their heavy third party dependencies at module level through lazy_import, so a
+dependency is only loaded once a class that uses it runs.
+
+External packages add plugins through entry points in the ENTRY_POINT_GROUPS groups. An entry point
+loads to the same value a `_name_to_cls` entry holds: {"cache": cls, "args": args_cls} for caches,
+{"filter": cls, "args": args_cls} for filters and the iterator class for traces, e.g.
+
+    [options.entry_points]
+    caching_simulator.caches =
+        ARC = my_package.arc:ARC_PLUGIN
+
+Plugins can also be declared lazily at runtime with register(kind, name, "module:attribute").
+initialize_cache, initialize_filter and initialize_iterator look every name up through resolve, so a
+declared plugin takes precedence over a built in one of the same name.
+"""
+import importlib
+import importlib.util
+import sys
+import time
+
+CACHE = "cache"
+FILTER = "filter"
+TRACE = "trace"
+
+_provider_modules = {
+    CACHE: "caches",
+    FILTER: "filters",
+    TRACE: "traces",
+}
+ENTRY_POINT_GROUPS = {
+    CACHE: "caching_simulator.caches",
+    FILTER: "caching_simulator.filters",
+    TRACE: "caching_simulator.traces",
+}
+
+# kind -> name -> "module:attribute"
+_declared = {kind: {} for kind in _provider_modules}
+_entry_points = None
+
+
+class _MissingModule:
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attribute):
+        raise ModuleNotFoundError(f"No module named '{self._name}'", name=self._name)
+
+
+def lazy_import(name):
+    """
+    :return: the module, executed on its first attribute access; one that is not installed raises
+             ModuleNotFoundError on first use instead
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return _MissingModule(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+def register(kind, name, target):
+    """
+    Declares a plugin without importing it.
+    :param target: "module:attribute" resolving to a `_name_to_cls` style value
+    """
+    _declared[kind][name] = target
+
+
+def _load_target(target):
+    module_name, _, attribute = target.partition(":")
+    value = importlib.import_module(module_name)
+    for part in attribute.split("."):
+        value = getattr(value, part)
+    return value
+
+
+def _iter_entry_points(group):
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        import pkg_resources
+        return list(pkg_resources.iter_entry_points(group))
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        return list(eps.select(group=group))
+    return list(eps.get(group, []))
+
+
+def _get_entry_points():
+    global _entry_points
+    if _entry_points is None:
+        _entry_points = {
+            kind: {entry_point.name: entry_point for entry_point in _iter_entry_points(group)}
+            for kind, group in ENTRY_POINT_GROUPS.items()
+        }
+    return _entry_points
+
+
+def _builtin(kind):
+    return importlib.import_module(_provider_modules[kind])._name_to_cls
+
+
+def resolve(kind, name):
+    """
+    :return: the `_name_to_cls` style value of the plugin, importing only the module that provides it
+    """
+    if name in _declared[kind]:
+        return _load_target(_declared[kind][name])
+    builtin = _builtin(kind)
+    if name in builtin:
+        return builtin[name]
+    entry_point = _get_entry_points()[kind].get(name)
+    if entry_point is not None:
+        return entry_point.load()
+    raise KeyError(f"{kind} plugin {name} is not registered. Check --listPlugins")
+
+
+def list_plugins():
+    """
+    :return: kind -> name -> provider
+    """
+    plugins = {}
+    for kind in _provider_modules:
+        plugins[kind] = {name: _provider_modules[kind] for name in _builtin(kind)}
+        for name, entry_point in _get_entry_points()[kind].items():
+            plugins[kind].setdefault(name, entry_point.value)
+        plugins[kind].update(_declared[kind])
+    return plugins
+
+
+def print_plugins():
+    for kind, plugins in list_plugins().items():
+        print(f"{kind}:")
+        for name, provider in sorted(plugins.items()):
+            print(f"    {name} ({provider})")
+
+
+def _time_subprocess(code, repeat):
+    import subprocess
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def benchmark_import_time(repeat=10):
+    """
+    Interpreter startup plus imports, best of `repeat` fresh processes.
+    :return: seconds per scenario
+    """
+    return {
+        "interpreter": _time_subprocess("pass", repeat),
+        "import_run": _time_subprocess("import run", repeat),
+        "select_LRU_Null_string": _time_subprocess(
+            "import plugins; plugins.resolve('cache', 'LRU'); plugins.resolve('filter', 'Null'); "
+            "plugins.resolve('trace', 'string')", repeat
+        ),
+        "select_GDSF_Bloom_block": _time_subprocess(
+            "import plugins; plugins.resolve('cache', 'GDSF')['cache'](1, None); "
+            "plugins.resolve('filter', 'Bloom')['filter'](plugins.resolve('filter', 'Bloom')['args'](10)); "
+            "import trace_to_block", repeat
+        ),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--benchmark', action='store_true', help="measure import time of typical selections")
+    parser.add_argument('--repeat', default=10, type=int)
+    args = parser.parse_args()
+    if args.benchmark:
+        for scenario, seconds in benchmark_import_time(args.repeat).items():
+            print(f"{scenario}: {seconds * 1000:.1f} ms")
+    else:
+        print_plugins()
@@ -0,0 +1,324 @@
+"""
+Replays a trace against a server speaking the memcached text protocol, e.g. memcached itself or
+cache_server.CacheServer, with get-then-set on miss.
+speedup None sends as fast as the connections allow, otherwise requests are paced at
+trace ts / speedup (ts in temporal_format units).
+"""
+import asyncio
+import contextlib
+import time
+from collections import namedtuple, deque
+from datetime import datetime
+
+from cache_server import zero_payload
+from simulation import SegmentStatistics, ordinal_window_index
+from timing_simulation import LatencyHistogram, _TEMPORAL_DIVISOR
+
+ReplayArgs = namedtuple(
+    "ReplayArgs", ["connections", "pipeline_depth", "speedup", "temporal_format"],
+    defaults=[8, 32, None, "s"]
+)
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class _Connection:
+    """
+    One persistent connection. Commands are written as they are issued and replies are matched to
+    them in order by a reader task, so up to pipeline_depth commands per connection are in flight.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = deque()
+        # set once the connection is unusable, the exception every later command fails with
+        self.error = None
+        self.reader_task = asyncio.ensure_future(self._read_replies())
+
+    async def _read_replies(self):
+        reader = self.reader
+        pending = self.pending
+        error = ConnectionResetError()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.startswith(b"VALUE"):
+                    size = int(line.split()[3])
+                    await reader.readexactly(size + 2)
+                    if await reader.readline() != b"END\r\n":
+                        raise ProtocolError("expected END after a single VALUE")
+                    pending.popleft().set_result(True)
+                elif line == b"END\r\n" or line == b"NOT_STORED\r\n":
+                    pending.popleft().set_result(False)
+                elif line == b"STORED\r\n":
+                    pending.popleft().set_result(True)
+                else:
+                    pending.popleft().set_exception(ProtocolError(line.decode().strip()))
+        except Exception as e:
+            # replies can no longer be matched to commands
+            error = e
+            self.writer.close()
+        self.error = error
+        while pending:
+            future = pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+    def _command(self):
+        future = asyncio.get_running_loop().create_future()
+        if self.error is not None:
+            future.set_exception(self.error)
+        else:
+            self.pending.append(future)
+        return future
+
+    def get(self, key):
+        """
+        :return: future, True on a hit
+        """
+        future = self._command()
+        if self.error is None:
+            self.writer.write(b"get %s\r\n" % key)
+        return future
+
+    def set(self, key, size):
+        """
+        :return: future, True if stored
+        """
+        future = self._command()
+        if self.error is not None:
+            return future
+        self.writer.write(b"set %s 0 0 %d\r\n" % (key, size))
+        self.writer.write(zero_payload(size))
+        self.writer.write(b"\r\n")
+        return future
+
+    async def close(self):
+        if self.error is None:
+            self.writer.write(b"quit\r\n")
+            self.writer.close()
+        await self.reader_task
+
+
+class ReplayClient:
+    """
+    Keys are spread over the connections by hash, so requests for one key share a connection.
+    A request waits for the previous request of its key, including its set on a miss, so a key
+    sees the same get/set order as in Simulation.run; requests for different keys overlap.
+    A get or set failing with an error reply or a broken connection counts as a miss and in error_count.
+    """
+
+    def __init__(self, host, port, args=ReplayArgs(), ordinal_window=100000):
+        assert args.temporal_format in _TEMPORAL_DIVISOR
+        self.host = host
+        self.port = port
+        self.args = args
+        self.ordinal_window = ordinal_window
+        self._connections = []
+        self._key_tail = {}
+        self._segment_statistics = SegmentStatistics()
+        self._segment_counts = []
+        self.get_latency = LatencyHistogram()
+        self.hit_latency = LatencyHistogram()
+        self.miss_latency = LatencyHistogram()
+        self.set_latency = LatencyHistogram()
+        self.not_stored_count = 0
+        self.error_count = 0
+        # encoded key -> trace ts of its request in flight, at most one per key
+        self.in_flight_ts = {}
+
+    async def _request(self, request, trace_index, previous):
+        if previous is not None:
+            # the previous request counted its own failure
+            with contextlib.suppress(Exception):
+                await previous
+        key = str(request.key).encode()
+        connection = self._connections[hash(key) % len(self._connections)]
+        counts = self._segment_counts[ordinal_window_index(trace_index, self.ordinal_window)]
+        counts[0] += 1
+        counts[1] += request.size
+        self.in_flight_ts[key] = request.ts
+        try:
+            start = time.perf_counter()
+            try:
+                hit = await connection.get(key)
+            except Exception:
+                self.error_count += 1
+                counts[2] += 1
+                counts[3] += request.size
+                return
+            end = time.perf_counter()
+            self.get_latency.record(end - start)
+            if hit:
+                self.hit_latency.record(end - start)
+                return
+            self.miss_latency.record(end - start)
+            counts[2] += 1
+            counts[3] += request.size
+            try:
+                if not await connection.set(key, request.size):
+                    self.not_stored_count += 1
+            except Exception:
+                self.error_count += 1
+                return
+            self.set_latency.record(time.perf_counter() - end)
+        finally:
+            del self.in_flight_ts[key]
+
+    def _done(self, task, key, semaphore):
+        semaphore.release()
+        if self._key_tail.get(key) is task:
+            del self._key_tail[key]
+
+    async def replay(self, trace_iterator, server_state=None):
+        """
+        :param server_state: cache and filter fields of the result, e.g. CacheServer.describe()
+        :return: dict in the schema of Simulation.get_state plus "replay_stats"
+        """
+        loop = asyncio.get_running_loop()
+        for _ in range(self.args.connections):
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            self._connections.append(_Connection(reader, writer))
+        semaphore = asyncio.Semaphore(self.args.connections * self.args.pipeline_depth)
+        divisor = _TEMPORAL_DIVISOR[self.args.temporal_format]
+        speedup = self.args.speedup
+        first_ts = None
+        start_time = datetime.now()
+        replay_start = loop.time()
+        trace_index = 0
+        for request in trace_iterator:
+            if speedup is not None:
+                if first_ts is None:
+                    first_ts = request.ts
+                delay = replay_start + (request.ts - first_ts) / divisor / speedup - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await semaphore.acquire()
+            if ordinal_window_index(trace_index, self.ordinal_window) == len(self._segment_counts):
+                self._segment_counts.append([0, 0, 0, 0])
+            previous = self._key_tail.get(request.key)
+            task = asyncio.ensure_future(self._request(request, trace_index, previous))
+            task.add_done_callback(lambda t, key=request.key: self._done(t, key, semaphore))
+            self._key_tail[request.key] = task
+            trace_index += 1
+        for _ in range(self.args.connections * self.args.pipeline_depth):
+            await semaphore.acquire()
+        replay_time = loop.time() - replay_start
+        for connection in self._connections:
+            await connection.close()
+
+        segment_statistics = self._segment_statistics
+        for total_count, total_bytes, miss_count, miss_bytes in self._segment_counts:
+            segment_statistics.segment_total_count_list.append(total_count)
+            segment_statistics.segment_total_bytes_list.append(total_bytes)
+            segment_statistics.segment_miss_count_list.append(miss_count)
+            segment_statistics.segment_miss_bytes_list.append(miss_bytes)
+            segment_statistics.segment_expired_miss_count_list.append(0)
+            segment_statistics.segment_expired_miss_bytes_list.append(0)
+        res = dict(server_state or {
+            "cache_type": "remote", "cache_args": {}, "cache_id": f"{self.host}:{self.port}", "cache_size": None,
+            "filter_type": "remote", "filter_args": {}, "filter_id": f"{self.host}:{self.port}",
+        })
+        res.update({
+            "trace_file": trace_iterator.trace_filename,
+            "no_warmup_byte_miss_ratio": segment_statistics.bmr(),
+            "segment_stats": {
+                "segment_total_count": segment_statistics.segment_total_count_list,
+                "segment_total_bytes": segment_statistics.segment_total_bytes_list,
+                "segment_miss_count": segment_statistics.segment_miss_count_list,
+                "segment_miss_bytes": segment_statistics.segment_miss_bytes_list,
+                "segment_expired_miss_count": segment_statistics.segment_expired_miss_count_list,
+                "segment_expired_miss_bytes": segment_statistics.segment_expired_miss_bytes_list,
+            },
+            "expired_count": 0,
+            "20p_warmup_bmr": segment_statistics.bmr(20),
+            "20p_warmup_omr": segment_statistics.omr(20),
+            "replay_stats": {
+                "replay_args": dict(self.args._asdict()),
+                "request_count": trace_index,
+                "requests_per_second": trace_index / replay_time if replay_time else None,
+                "not_stored_count": self.not_stored_count,
+                "error_count": self.error_count,
+                **{
+                    f"{name}_p{label}": histogram.percentile(p)
+                    for name, histogram in (("get_latency", self.get_latency), ("hit_latency", self.hit_latency),
+                                            ("miss_latency", self.miss_latency), ("set_latency", self.set_latency))
+                    for label, p in (("50", 50), ("99", 99), ("999", 99.9))
+                },
+            },
+            "simulation_time": (datetime.now() - start_time).total_seconds(),
+            "simulation_timestamp": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+        })
+        return res
+
+
+async def replay_against_stand_in(caching_system, trace_iterator, args=ReplayArgs(), ordinal_window=100000):
+    """
+    Starts a cache_server.CacheServer for caching_system on a free local port and replays against it.
+    The server stamps requests with the trace ts of the client's request for the key.
+    """
+    from cache_server import CacheServer
+    client = None
+    server = CacheServer(caching_system, ts_of=lambda raw_key: client.in_flight_ts.get(raw_key, 0))
+    host, port = await server.start()
+    try:
+        client = ReplayClient(host, port, args, ordinal_window)
+        return await client.replay(trace_iterator, server.describe())
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import hashlib
+    import json
+    import os
+
+    from traces import initialize_iterator, DEFAULT_TRACE_TYPE
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('traceFile')
+    parser.add_argument('--traceType', default=DEFAULT_TRACE_TYPE, dest='traceType')
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', default=11211, type=int)
+    parser.add_argument('--connections', default=8, type=int)
+    parser.add_argument('--pipelineDepth', default=32, type=int, dest='pipelineDepth')
+    parser.add_argument('--speedup', default=None, type=float,
+                        help="pace requests at trace ts / speedup, as fast as possible when omitted")
+    parser.add_argument('--temporalFormat', default="s", dest='temporalFormat')
+    parser.add_argument('--ordinalWindowSize', default=1000000, type=int)
+    parser.add_argument('--standIn', default=None, dest='standIn',
+                        help="cacheType:cacheSize, replay against an in-process CacheServer instead of host:port")
+    parser.add_argument('--filterType', default="Null", dest='filterType')
+    parser.add_argument('--filterArgs', default="{}")
+    args = parser.parse_args()
+
+    trace_dir = os.environ["TRACE_DIRECTORY"]
+    simulation_res_dir = os.environ["SIMULATION_RESULT_DIRECTORY"]
+    if not os.path.exists(simulation_res_dir):
+        os.makedirs(simulation_res_dir)
+    replay_args = ReplayArgs(args.connections, args.pipelineDepth, args.speedup, args.temporalFormat)
+    trace_iterator = initialize_iterator(args.traceType, f"{trace_dir}/{args.traceFile}")
+    if args.standIn is not None:
+        from caches import initialize_cache
+        from caching_system import CachingSystem
+        from filters import initialize_filter
+        cache_type, cache_size = args.standIn.split(":")
+        caching_system = CachingSystem(initialize_filter(args.filterType, **json.loads(args.filterArgs)),
+                                       initialize_cache(cache_type, int(cache_size)))
+        res = asyncio.run(replay_against_stand_in(caching_system, trace_iterator, replay_args,
+                                                  args.ordinalWindowSize))
+    else:
+        client = ReplayClient(args.host, args.port, replay_args, args.ordinalWindowSize)
+        res = asyncio.run(client.replay(trace_iterator))
+
+    h = hashlib.blake2s(digest_size=16)
+    h.update(f"{res['cache_id']}_{res['filter_id']}_{res['trace_file']}_replay".encode())
+    with open(f"{simulation_res_dir}/{h.hexdigest()}.json", "w") as f:
+        json.dump(res, f, sort_keys=True, indent=4)
+    print(res)
@@ -0,0 +1,87 @@
+"""
+Allocation and throughput of the request path: trace iterator, caching stack and Simulation.run.
+Throughput runs without tracemalloc, which slows allocation down several times; the memory run repeats the
+replay under tracemalloc for the peak of traced memory.
+"""
+import gc
+import time
+import tracemalloc
+
+from caches import initialize_cache
+from caching_system import CachingSystem
+from filters import initialize_filter
+from simulation import Simulation
+from traces import initialize_iterator
+
+
+
+class _GCTimer:
+    def __init__(self):
+        self.collections = 0
+        self.seconds = 0.0
+        self._start = None
+
+    def __call__(self, phase, info):
+        if phase == "start":
+            self._start = time.perf_counter()
+        else:
+            self.seconds += time.perf_counter() - self._start
+            self.collections += 1
+
+
+def _replay(trace_type, file_path, cache_type, cache_size):
+    trace_iterator = initialize_iterator(trace_type, file_path)
+    simulation = Simulation(CachingSystem(initialize_filter("Null"), initialize_cache(cache_type, cache_size)),
+                            trace_iterator, ordinal_window=1 << 62)
+    simulation.run()
+    return trace_iterator.total_count
+
+
+def replay_benchmark(trace_type, file_path, cache_type, cache_size, trace_memory=True):
+    """
+    :return: dict of requests, seconds, requests_per_second, gc_collections, gc_seconds and, with
+             trace_memory, peak_traced_bytes
+    """
+    gc_timer = _GCTimer()
+    gc.collect()
+    gc.callbacks.append(gc_timer)
+    try:
+        start = time.perf_counter()
+        requests = _replay(trace_type, file_path, cache_type, cache_size)
+        seconds = time.perf_counter() - start
+    finally:
+        gc.callbacks.remove(gc_timer)
+    res = {
+        "requests": requests,
+        "seconds": seconds,
+        "requests_per_second": requests / seconds,
+        "gc_collections": gc_timer.collections,
+        "gc_seconds": gc_timer.seconds,
+    }
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            _replay(trace_type, file_path, cache_type, cache_size)
+            res["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return res
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from traces import DEFAULT_TRACE_TYPE
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('cacheType')
+    parser.add_argument('cacheSize', type=int)
+    parser.add_argument('traceFile')
+    parser.add_argument('--traceType', default=DEFAULT_TRACE_TYPE, dest='traceType')
+    parser.add_argument('--noMemory', action='store_true', dest='noMemory', help="skip the tracemalloc run")
+    args = parser.parse_args()
+
+    print(json.dumps(replay_benchmark(args.traceType, args.traceFile, args.cacheType, args.cacheSize,
+                                      not args.noMemory), indent=4))
@@ -0,0 +1,107 @@
+"""
+Residency analytics computed during the simulation instead of from an eviction log.
+
+ResidencyAnalytics is an eviction sink (see BaseCache.set_eviction_sink). At every eviction it buckets the
+object's age (trace ts units since admission), residency (requests since admission) and hits before
+eviction from CacheObject.ts, index and frequency. At every ordinal window it counts the cached objects
+and bytes per size class.
+Histograms are log2 bucketed: bucket 0 counts 0, bucket b > 0 counts values in [2 ** (b - 1), 2 ** b).
+"""
+_BUCKETS = 65
+
+
+def log2_bucket_bounds(bucket):
+    """
+    :return: [low, high) of the values counted in bucket
+    """
+    return (0, 1) if bucket == 0 else (1 << (bucket - 1), 1 << bucket)
+
+
+def _trimmed(counts):
+    end = len(counts)
+    while end and not counts[end - 1]:
+        end -= 1
+    return counts[:end]
+
+
+class ResidencyAnalytics:
+    def __init__(self):
+        self.age_counts = [0] * _BUCKETS
+        self.residency_counts = [0] * _BUCKETS
+        self.hit_counts = [0] * _BUCKETS
+        # bytes evicted per residency bucket
+        self.residency_bytes = [0] * _BUCKETS
+        self.eviction_count = 0
+        self.eviction_bytes = 0
+        self.zero_hit_eviction_count = 0
+        self.zero_hit_eviction_bytes = 0
+        self._window_eviction = [0, 0, 0, 0]
+        self.window_eviction_count = []
+        self.window_eviction_bytes = []
+        self.window_zero_hit_eviction_count = []
+        self.window_zero_hit_eviction_bytes = []
+        # per window, objects and bytes cached per size class; None when the cache cannot list its objects
+        self.window_occupancy_count = []
+        self.window_occupancy_bytes = []
+
+    def write(self, obj, request):
+        size = obj.size
+        hits = obj.frequency - 1
+        residency_bucket = max(request.index - obj.index, 0).bit_length()
+        self.age_counts[max(request.ts - obj.ts, 0).bit_length()] += 1
+        self.residency_counts[residency_bucket] += 1
+        self.residency_bytes[residency_bucket] += size
+        self.hit_counts[hits.bit_length()] += 1
+        window = self._window_eviction
+        window[0] += 1
+        window[1] += size
+        if hits == 0:
+            window[2] += 1
+            window[3] += size
+
+    def record_window(self, cache):
+        """
+        Closes the window's eviction counts and snapshots the occupancy of cache.
+        """
+        eviction_count, eviction_bytes, zero_hit_count, zero_hit_bytes = self._window_eviction
+        self.window_eviction_count.append(eviction_count)
+        self.window_eviction_bytes.append(eviction_bytes)
+        self.window_zero_hit_eviction_count.append(zero_hit_count)
+        self.window_zero_hit_eviction_bytes.append(zero_hit_bytes)
+        self.eviction_count += eviction_count
+        self.eviction_bytes += eviction_bytes
+        self.zero_hit_eviction_count += zero_hit_count
+        self.zero_hit_eviction_bytes += zero_hit_bytes
+        self._window_eviction = [0, 0, 0, 0]
+        try:
+            objects = cache.cached_objects()
+        except NotImplementedError:
+            self.window_occupancy_count.append(None)
+            self.window_occupancy_bytes.append(None)
+            return
+        counts = [0] * _BUCKETS
+        sizes = [0] * _BUCKETS
+        for obj in objects:
+            size_class = obj.size.bit_length()
+            counts[size_class] += 1
+            sizes[size_class] += obj.size
+        self.window_occupancy_count.append(_trimmed(counts))
+        self.window_occupancy_bytes.append(_trimmed(sizes))
+
+    def as_dict(self):
+        return {
+            "age_histogram": _trimmed(self.age_counts),
+            "residency_histogram": _trimmed(self.residency_counts),
+            "residency_bytes_histogram": _trimmed(self.residency_bytes),
+            "hits_before_eviction_histogram": _trimmed(self.hit_counts),
+            "eviction_count": self.eviction_count,
+            "eviction_bytes": self.eviction_bytes,
+            "zero_hit_eviction_count": self.zero_hit_eviction_count,
+            "zero_hit_eviction_bytes": self.zero_hit_eviction_bytes,
+            "window_eviction_count": self.window_eviction_count,
+            "window_eviction_bytes": self.window_eviction_bytes,
+            "window_zero_hit_eviction_count": self.window_zero_hit_eviction_count,
+            "window_zero_hit_eviction_bytes": self.window_zero_hit_eviction_bytes,
+            "window_occupancy_count": self.window_occupancy_count,
+            "window_occupancy_bytes": self.window_occupancy_bytes,
+        }
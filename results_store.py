@@ -0,0 +1,251 @@
+"""
+SQLite store of simulation results, queried and pivoted by config fields and metrics.
+
+Layout
+runs:        one row per simulation result, scalar metrics and config fields as indexed columns
+run_config:  (run_id, key, value) for every cache_args / filter_args / timing_args field,
+             e.g. key "filter_args.n"
+run_metrics: (run_id, key, value) for every other numeric scalar in the result
+segments:    (run_id, name, data) segment series as zlib compressed int64 arrays
+"""
+import argparse
+import array
+import json
+import os
+import sqlite3
+import zlib
+from collections import OrderedDict
+
+
+# (result JSON key, column name, SQL type)
+_RUN_COLUMNS = [
+    ("cache_type", "cache_type", "TEXT"),
+    ("cache_size", "cache_size", "INTEGER"),
+    ("cache_id", "cache_id", "TEXT"),
+    ("filter_type", "filter_type", "TEXT"),
+    ("filter_id", "filter_id", "TEXT"),
+    ("trace_file", "trace_file", "TEXT"),
+    ("no_warmup_byte_miss_ratio", "no_warmup_bmr", "REAL"),
+    ("20p_warmup_bmr", "warmup_20p_bmr", "REAL"),
+    ("20p_warmup_omr", "warmup_20p_omr", "REAL"),
+    ("simulation_time", "simulation_time", "REAL"),
+    ("simulation_timestamp", "simulation_timestamp", "TEXT"),
+    ("eviction_logging", "eviction_logging", "INTEGER"),
+]
+_RUN_COLUMN_NAMES = {column for _, column, _ in _RUN_COLUMNS}
+_RESULT_KEY_TO_COLUMN = {key: column for key, column, _ in _RUN_COLUMNS}
+_CONFIG_KEYS = ("cache_args", "filter_args", "timing_args", "cluster_args")
+_INDEXED_COLUMNS = ("cache_type", "cache_size", "filter_type", "trace_file")
+_AGGREGATES = {"avg", "min", "max", "count", "sum"}
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, " +
+    ", ".join(f"{column} {sql_type}" for _, column, sql_type in _RUN_COLUMNS) + ")",
+    "CREATE TABLE IF NOT EXISTS run_config (run_id TEXT, key TEXT, value, PRIMARY KEY (run_id, key))",
+    "CREATE TABLE IF NOT EXISTS run_metrics (run_id TEXT, key TEXT, value REAL, PRIMARY KEY (run_id, key))",
+    "CREATE TABLE IF NOT EXISTS segments (run_id TEXT, name TEXT, data BLOB, PRIMARY KEY (run_id, name))",
+    "CREATE INDEX IF NOT EXISTS run_config_key_value ON run_config (key, value)",
+    "CREATE INDEX IF NOT EXISTS run_metrics_key_value ON run_metrics (key, value)",
+] + [
+    f"CREATE INDEX IF NOT EXISTS runs_{column} ON runs ({column})" for column in _INDEXED_COLUMNS
+]
+
+
+def _encode_series(values):
+    return zlib.compress(array.array("q", values).tobytes())
+
+
+def _decode_series(data):
+    values = array.array("q")
+    values.frombytes(zlib.decompress(data))
+    return values.tolist()
+
+
+def _config_value(value):
+    if isinstance(value, (list, tuple, dict)):
+        return json.dumps(value, sort_keys=True)
+    return value
+
+
+def _parse_value(value):
+    try:
+        return _config_value(json.loads(value))
+    except json.JSONDecodeError:
+        return value
+
+
+class ResultsStore:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path, timeout=60)
+        for statement in _SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def add_result(self, run_id, res, commit=True):
+        """
+        :param run_id: the result filename without extension
+        :param res: dict returned by Simulation.run
+        """
+        cursor = self.connection.cursor()
+        for table in ("runs", "run_config", "run_metrics", "segments"):
+            cursor.execute(f"DELETE FROM {table} WHERE run_id = ?", (run_id,))
+        columns = ["run_id"] + [column for _, column, _ in _RUN_COLUMNS]
+        values = [run_id] + [res.get(key) for key, _, _ in _RUN_COLUMNS]
+        cursor.execute(
+            f"INSERT INTO runs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", values
+        )
+        cursor.executemany(
+            "INSERT INTO run_config (run_id, key, value) VALUES (?, ?, ?)",
+            [
+                (run_id, f"{config_key}.{key}", _config_value(value))
+                for config_key in _CONFIG_KEYS
+                for key, value in (res.get(config_key) or {}).items()
+            ]
+        )
+        stored_keys = {key for key, _, _ in _RUN_COLUMNS}
+        cursor.executemany(
+            "INSERT INTO run_metrics (run_id, key, value) VALUES (?, ?, ?)",
+            [
+                (run_id, key, value) for key, value in res.items()
+                if key not in stored_keys and isinstance(value, (int, float)) and not isinstance(value, bool)
+            ]
+        )
+        cursor.executemany(
+            "INSERT INTO segments (run_id, name, data) VALUES (?, ?, ?)",
+            [(run_id, name, _encode_series(series)) for name, series in res.get("segment_stats", {}).items()]
+        )
+        if commit:
+            self.connection.commit()
+
+    def import_directory(self, result_dir):
+        """
+        Imports every {blake2s}.json result written by run.py.
+        :return: number of imported results
+        """
+        count = 0
+        for filename in sorted(os.listdir(result_dir)):
+            if not filename.endswith(".json"):
+                continue
+            with open(f"{result_dir}/{filename}", "r") as f:
+                try:
+                    res = json.load(f)
+                except json.JSONDecodeError:
+                    print(f"skipping {filename}: invalid JSON")
+                    continue
+            self.add_result(filename[:-len(".json")], res, commit=False)
+            count += 1
+        self.connection.commit()
+        return count
+
+    def load_segment_stats(self, run_id):
+        rows = self.connection.execute("SELECT name, data FROM segments WHERE run_id = ?", (run_id,))
+        return {name: _decode_series(data) for name, data in rows}
+
+    def _field_expr(self, field, joins):
+        """
+        Resolves a runs column or the result key stored in it ("no_warmup_byte_miss_ratio"), a config key
+        ("filter_args.n") or a metric key to a SQL expression, adding the LEFT JOIN it needs to `joins`.
+        """
+        field = _RESULT_KEY_TO_COLUMN.get(field, field)
+        if field in _RUN_COLUMN_NAMES or field == "run_id":
+            return f"runs.{field}"
+        if field not in joins:
+            alias = f"j{len(joins)}"
+            table = "run_config" if field.split(".")[0] in _CONFIG_KEYS else "run_metrics"
+            if self.connection.execute(f"SELECT 1 FROM {table} WHERE key = ? LIMIT 1", (field,)).fetchone() is None:
+                raise KeyError(f"{field} is neither a runs column nor a key of {table}")
+            joins[field] = (
+                alias,
+                f"LEFT JOIN {table} {alias} ON {alias}.run_id = runs.run_id AND {alias}.key = ?"
+            )
+        return f"{joins[field][0]}.value"
+
+    def _build(self, select_fields, where, group_by=()):
+        joins = OrderedDict()
+        select_exprs = [self._field_expr(field, joins) for field in select_fields]
+        where_exprs = []
+        where_values = []
+        for field, value in where.items():
+            where_exprs.append(f"{self._field_expr(field, joins)} = ?")
+            where_values.append(value)
+        group_exprs = [self._field_expr(field, joins) for field in group_by]
+        join_sql = " ".join(join for _, join in joins.values())
+        join_values = list(joins.keys())
+        return select_exprs, where_exprs, group_exprs, join_sql, join_values + where_values
+
+    def query(self, columns, where=None):
+        """
+        :return: list of tuples with one value per requested column
+        """
+        select_exprs, where_exprs, _, join_sql, values = self._build(columns, where or {})
+        sql = f"SELECT {', '.join(select_exprs)} FROM runs {join_sql}"
+        if where_exprs:
+            sql += f" WHERE {' AND '.join(where_exprs)}"
+        return self.connection.execute(sql, values).fetchall()
+
+    def pivot(self, row, column, value, where=None, aggregate="avg"):
+        """
+        :return: (sorted row labels, sorted column labels, {(row label, column label): aggregated value})
+        """
+        assert aggregate in _AGGREGATES
+        select_exprs, where_exprs, group_exprs, join_sql, values = self._build(
+            [row, column, value], where or {}, [row, column]
+        )
+        sql = f"SELECT {select_exprs[0]}, {select_exprs[1]}, {aggregate}({select_exprs[2]}) " \
+              f"FROM runs {join_sql}"
+        if where_exprs:
+            sql += f" WHERE {' AND '.join(where_exprs)}"
+        sql += f" GROUP BY {', '.join(group_exprs)}"
+        cells = {(r, c): v for r, c, v in self.connection.execute(sql, values)}
+        rows = sorted({r for r, _ in cells}, key=lambda x: (x is None, x))
+        columns = sorted({c for _, c in cells}, key=lambda x: (x is None, x))
+        return rows, columns, cells
+
+
+def _parse_where(where_args):
+    where = {}
+    for where_arg in where_args:
+        field, value = where_arg.split("=", 1)
+        where[field] = _parse_value(value)
+    return where
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('db')
+    subparsers = parser.add_subparsers(dest='command')
+    import_parser = subparsers.add_parser('import')
+    import_parser.add_argument('resultDirectory')
+    query_parser = subparsers.add_parser('query')
+    query_parser.add_argument('--columns', default="run_id,cache_type,cache_size,filter_type,warmup_20p_bmr")
+    query_parser.add_argument('--where', action='append', default=[], help="field=value, may be repeated")
+    pivot_parser = subparsers.add_parser('pivot')
+    pivot_parser.add_argument('--row', default="cache_size")
+    pivot_parser.add_argument('--column', default="filter_type")
+    pivot_parser.add_argument('--value', default="warmup_20p_bmr")
+    pivot_parser.add_argument('--aggregate', default="avg", choices=sorted(_AGGREGATES))
+    pivot_parser.add_argument('--where', action='append', default=[], help="field=value, may be repeated")
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db)
+    if args.command == 'import':
+        print(f"imported {store.import_directory(args.resultDirectory)} results")
+    elif args.command == 'query':
+        columns = args.columns.split(",")
+        print("\t".join(columns))
+        for result_row in store.query(columns, _parse_where(args.where)):
+            print("\t".join(str(v) for v in result_row))
+    elif args.command == 'pivot':
+        row_labels, column_labels, cells = store.pivot(
+            args.row, args.column, args.value, _parse_where(args.where), args.aggregate
+        )
+        print("\t".join([f"{args.row}\\{args.column}"] + [str(c) for c in column_labels]))
+        for r in row_labels:
+            print("\t".join([str(r)] + [str(cells.get((r, c), "")) for c in column_labels]))
+    else:
+        parser.print_help()
+    store.close()
@@ -9,38 +9,116 @@ from urllib import parse
 
 from caching_system import CachingSystem
 from caches import initialize_cache
+from eviction_log import EvictionLogWriter
 from filters import initialize_filter
 
 from logger import log_window, setup_logger
 from simulation import Simulation
-from traces import initialize_iterator, DEFAULT_TRACE_TYPE
+from timing_simulation import TimingSimulation, TimingArgs
+from traces import initialize_iterator, initialize_merged_iterator, DEFAULT_TRACE_TYPE
 
 
-def run(cache_type, cache_size, file_path, trace_type, filter_type, filter_args, result_identifier,
-        log_eviction, ordinal_window, temporal_window,
-        trace_dir, eviction_log_dir, execution_log_dir, simulation_res_dir):
-    file_path = f"{trace_dir}/{file_path}"
+def build_simulation(cache_type, cache_size, file_path, trace_type, filter_type, filter_args,
+                     ordinal_window, temporal_window, timing_args=None, accelerated=False, expiry=False,
+                     default_ttl=None, expiry_tick=1, chunk_size=None, classify_misses=False, ghost_factor=4,
+                     tenant_quotas=None):
+    """
+    :param file_path: path of the trace file, or list of the paths of the traces of several tenants, which
+                      are merged by ts with per tenant statistics
+    :param tenant_quotas: tenant -> fraction of the cache partitioned off for it, see caches.TenantPartitionedCache
+    :return: (simulation, cache instance, miss classifier or None)
+    """
     filter_instance = initialize_filter(filter_type, **filter_args)
-    cache_instance = initialize_cache(cache_type, cache_size)
+
+    if tenant_quotas is None:
+        cache_instance = initialize_cache(cache_type, cache_size)
+    else:
+        cache_instance = initialize_cache("TenantPartitioned", cache_size, cache_type=cache_type,
+                                          quotas=tenant_quotas)
+    if expiry:
+        cache_instance.enable_expiry(expiry_tick, default_ttl)
     caching_stack = CachingSystem(filter_instance, cache_instance)
-    trace_iterator = initialize_iterator(trace_type, file_path)
-    simulation = Simulation(caching_stack, trace_iterator, ordinal_window, temporal_window)
+    if isinstance(file_path, list):
+        trace_iterator = initialize_merged_iterator(trace_type, file_path)
+    else:
+        trace_iterator = initialize_iterator(trace_type, file_path)
+    callbacks = {}
+    classifier = None
+    if classify_misses:
+        if chunk_size is not None:
+            raise ValueError("miss classification is not supported with chunking")
+        from miss_classification import MissClassifier, ghost_policy
+        from filters import NullFilter
+        unfiltered_ghost = None
+        if not isinstance(filter_instance, NullFilter):
+            unfiltered_ghost = ghost_policy(cache_type)(cache_instance.capacity)
+        classifier = MissClassifier(cache_instance, ordinal_window, unfiltered_ghost, ghost_factor)
+        callbacks = dict(on_miss_callback=classifier.on_miss_callback, on_hit_callback=classifier.on_hit_callback)
+    if accelerated:
+        from accelerated import AcceleratedSimulation
+        simulation = AcceleratedSimulation(caching_stack, trace_iterator, ordinal_window, temporal_window,
+                                           **callbacks)
+    elif chunk_size is not None:
+        from chunking import ChunkedSimulation, ChunkingArgs
+        simulation = ChunkedSimulation(caching_stack, trace_iterator, ordinal_window, temporal_window,
+                                       chunking_args=ChunkingArgs(chunk_size))
+    elif timing_args is None:
+        simulation = Simulation(caching_stack, trace_iterator, ordinal_window, temporal_window, **callbacks)
+    else:
+        simulation = TimingSimulation(caching_stack, trace_iterator, ordinal_window, temporal_window,
+                                      timing_args=TimingArgs(**timing_args), **callbacks)
+    return simulation, cache_instance, classifier
 
+
+def result_filename(simulation, result_identifier):
+    """
+    Deterministic name of the result, eviction log and execution log files of a simulation.
+    """
     h = hashlib.blake2s(digest_size=16)
     h.update(f"{simulation.id}_{result_identifier}".encode())
-    filename = h.hexdigest()
-    if log_eviction:
+    return h.hexdigest()
+
+
+def run(cache_type, cache_size, file_path, trace_type, filter_type, filter_args, result_identifier,
+        log_eviction, ordinal_window, temporal_window,
+        trace_dir, eviction_log_dir, execution_log_dir, simulation_res_dir, timing_args=None,
+        eviction_log_format="text", result_db=None, accelerated=False, expiry=False, default_ttl=None,
+        expiry_tick=1, chunk_size=None, classify_misses=False, ghost_factor=4, tenant_quotas=None,
+        residency_analytics=False):
+    if isinstance(file_path, list):
+        trace_path = [f"{trace_dir}/{path}" for path in file_path]
+    else:
+        trace_path = f"{trace_dir}/{file_path}"
+    simulation, cache_instance, classifier = build_simulation(
+        cache_type, cache_size, trace_path, trace_type, filter_type, filter_args,
+        ordinal_window, temporal_window, timing_args, accelerated, expiry, default_ttl, expiry_tick,
+        chunk_size, classify_misses, ghost_factor, tenant_quotas
+    )
+    filename = result_filename(simulation, result_identifier)
+    eviction_sink = None
+    if log_eviction and eviction_log_format == "binary":
+        eviction_sink = EvictionLogWriter(f"{eviction_log_dir}/{filename}.evlog", threaded=True)
+        cache_instance.set_eviction_sink(eviction_sink)
+    elif log_eviction:
         eviction_logger = setup_logger(
             "eviction_logger",
             f"{eviction_log_dir}/{filename}.log"
         )
         cache_instance.set_eviction_logger(eviction_logger)
+    if residency_analytics:
+        from residency import ResidencyAnalytics
+        simulation.set_residency_analytics(ResidencyAnalytics())
     execution_logger = setup_logger(
         "execution_logger",
         f"{execution_log_dir}/{filename}.log"
     )
     simulation.set_execution_logger(execution_logger)
     res = simulation.run()
+    if eviction_sink is not None:
+        eviction_sink.close()
+    if classifier is not None:
+        classifier.finish()
+        res['miss_classification'] = classifier.as_dict()
     if log_eviction:
         res['eviction_logging'] = True
     else:
@@ -48,14 +126,27 @@ def run(cache_type, cache_size, file_path, trace_type, filter_type, filter_args,
     
     with open(f"{simulation_res_dir}/{filename}.json", "w") as f:
         json.dump(res, f, sort_keys=True, indent=4)
+    if result_db is not None:
+        from results_store import ResultsStore
+        store = ResultsStore(result_db)
+        store.add_result(filename, res)
+        store.close()
     print(res)
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
+    list_parser = argparse.ArgumentParser(add_help=False)
+    list_parser.add_argument('--listPlugins', action='store_true',
+                             help="list the available caches, filters and trace types and exit")
+    if list_parser.parse_known_args()[0].listPlugins:
+        import plugins
+        plugins.print_plugins()
+        raise SystemExit(0)
+
+    parser = argparse.ArgumentParser(parents=[list_parser])
     parser.add_argument('cacheType')
     parser.add_argument('cacheSize', type=int)
-    parser.add_argument('traceFile')
+    parser.add_argument('traceFile', nargs='+', help="several trace files are merged by ts as one tenant each")
     parser.add_argument('--logEviction', default=False, type=bool)
     parser.add_argument('--temporalWindowSize', default=600, type=int)
     parser.add_argument('--ordinalWindowSize', default=1000000, type=int)
@@ -63,6 +154,28 @@ if __name__ == "__main__":
     parser.add_argument('--filterType', default="Null", dest='filterType')
     parser.add_argument('--filterArgs', default="{}")
     parser.add_argument('--resultIdentifier', default="regular", dest='resultIdentifier')
+    parser.add_argument('--evictionLogFormat', default="text", choices=["text", "binary"],
+                        dest='evictionLogFormat',
+                        help="text keeps the --logEviction log lines, binary writes an eviction_log.py .evlog")
+    parser.add_argument('--accelerated', action='store_true',
+                        help="Numba kernels for LRU/FIFO/CLOCK with Null/Bloom filters when available")
+    parser.add_argument('--enableExpiry', action='store_true', dest='enableExpiry',
+                        help="expire objects after the trace's ttl column or --defaultTTL")
+    parser.add_argument('--defaultTTL', default=None, type=int, dest='defaultTTL')
+    parser.add_argument('--expiryTick', default=1, type=int, dest='expiryTick',
+                        help="timing wheel tick in trace timestamp units")
+    parser.add_argument('--chunkSize', default=None, type=int, dest='chunkSize',
+                        help="cache objects as chunks of this many bytes, honouring the trace's range columns")
+    parser.add_argument('--classifyMisses', action='store_true', dest='classifyMisses',
+                        help="tag misses compulsory/filter/capacity/beyond against ghost caches")
+    parser.add_argument('--ghostFactor', default=4, type=int, dest='ghostFactor')
+    parser.add_argument('--timingArgs', default=None, dest='timingArgs')
+    parser.add_argument('--residencyAnalytics', action='store_true', dest='residencyAnalytics',
+                        help="histograms of eviction age, residency, hits before eviction and occupancy by size "
+                             "class in the result, without an eviction log")
+    parser.add_argument('--tenantQuotas', default=None, dest='tenantQuotas',
+                        help='JSON of the fraction of the cache partitioned off per tenant (trace name), '
+                             'e.g. {"a": 0.5}; the other tenants share the rest')
 
     args = parser.parse_args()
 
@@ -70,6 +183,7 @@ if __name__ == "__main__":
     eviction_log_dir = os.environ["EVICTION_LOGGING_RESULT_DIRECTORY"]
     execution_log_dir = os.environ["EXECUTION_LOGGING_RESULT_DIRECTORY"]
     simulation_res_dir = os.environ["SIMULATION_RESULT_DIRECTORY"]
+    result_db = os.environ.get("SIMULATION_RESULT_DB")
     if not os.path.exists(eviction_log_dir):
         os.makedirs(eviction_log_dir)
     if not os.path.exists(execution_log_dir):
@@ -83,10 +197,22 @@ if __name__ == "__main__":
         filter_args = json.loads(parse.unquote(args.filterArgs))
     except:
         raise
+    timing_args = None
+    if args.timingArgs is not None:
+        try:
+            timing_args = json.loads(args.timingArgs)
+        except JSONDecodeError:
+            timing_args = json.loads(parse.unquote(args.timingArgs))
+    tenant_quotas = None
+    if args.tenantQuotas is not None:
+        try:
+            tenant_quotas = json.loads(args.tenantQuotas)
+        except JSONDecodeError:
+            tenant_quotas = json.loads(parse.unquote(args.tenantQuotas))
     run(
         args.cacheType,
         args.cacheSize,
-        args.traceFile,
+        args.traceFile[0] if len(args.traceFile) == 1 else args.traceFile,
         args.traceType,
         args.filterType,
         filter_args,
@@ -94,5 +220,17 @@ if __name__ == "__main__":
         args.logEviction,
         args.ordinalWindowSize,
         args.temporalWindowSize,
-        trace_dir, eviction_log_dir, execution_log_dir, simulation_res_dir
+        trace_dir, eviction_log_dir, execution_log_dir, simulation_res_dir,
+        timing_args,
+        args.evictionLogFormat,
+        result_db,
+        args.accelerated,
+        args.enableExpiry,
+        args.defaultTTL,
+        args.expiryTick,
+        args.chunkSize,
+        args.classifyMisses,
+        args.ghostFactor,
+        tenant_quotas,
+        args.residencyAnalytics
     )
@@ -1,4 +1,5 @@
 import logging
+from collections import defaultdict
 from datetime import datetime
 
 from logger import log_window
@@ -15,25 +16,37 @@ class SegmentStatistics:
         self.segment_total_bytes_list = []
         self.segment_miss_count_list = []
         self.segment_miss_bytes_list = []
+        self.segment_expired_miss_count_list = []
+        self.segment_expired_miss_bytes_list = []
         self.segment_total_count = 0
         self.segment_miss_count = 0
         self.segment_total_bytes = 0
         self.segment_miss_bytes = 0
+        self.segment_expired_miss_count = 0
+        self.segment_expired_miss_bytes = 0
 
     def record_segment(self):
         self.segment_total_count_list.append(self.segment_total_count)
         self.segment_total_bytes_list.append(self.segment_total_bytes)
         self.segment_miss_count_list.append(self.segment_miss_count)
         self.segment_miss_bytes_list.append(self.segment_miss_bytes)
+        self.segment_expired_miss_count_list.append(self.segment_expired_miss_count)
+        self.segment_expired_miss_bytes_list.append(self.segment_expired_miss_bytes)
         self.segment_total_count = 0
         self.segment_miss_count = 0
         self.segment_total_bytes = 0
         self.segment_miss_bytes = 0
+        self.segment_expired_miss_count = 0
+        self.segment_expired_miss_bytes = 0
 
     def update_miss(self, request):
         self.segment_miss_count += 1
         self.segment_miss_bytes += request.size
 
+    def update_expired_miss(self, request):
+        self.segment_expired_miss_count += 1
+        self.segment_expired_miss_bytes += request.size
+
     def update_stat(self, request):
         self.segment_total_count += 1
         self.segment_total_bytes += request.size
@@ -55,6 +68,47 @@ class SegmentStatistics:
         return sum(self.segment_miss_count_list[start_index:]) / sum(self.segment_total_count_list[start_index:])
 
 
+class TenantStatistics:
+    """
+    Request and miss totals of every CacheRequest.tenant.
+    """
+
+    def __init__(self):
+        # tenant -> [total count, total bytes, miss count, miss bytes]
+        self.stats = defaultdict(lambda: [0, 0, 0, 0])
+
+    def update_miss(self, tenant, miss_bytes):
+        stats = self.stats[tenant]
+        stats[2] += 1
+        stats[3] += miss_bytes
+
+    def update_stat(self, tenant, total_bytes):
+        stats = self.stats[tenant]
+        stats[0] += 1
+        stats[1] += total_bytes
+
+    def as_dict(self):
+        return {
+            str(tenant): {
+                "total_count": total_count,
+                "total_bytes": total_bytes,
+                "miss_count": miss_count,
+                "miss_bytes": miss_bytes,
+                "omr": miss_count / total_count if total_count else None,
+                "bmr": miss_bytes / total_bytes if total_bytes else None,
+            }
+            for tenant, (total_count, total_bytes, miss_count, miss_bytes) in self.stats.items()
+        }
+
+
+def ordinal_window_index(trace_index, ordinal_window):
+    """
+    Segment that Simulation.run records the request at trace_index in.
+    The first segment holds indexes 0..ordinal_window, every later one the following ordinal_window.
+    """
+    return max(trace_index - 1, 0) // ordinal_window
+
+
 def do_nothing(request: CacheRequest):
     pass
 
@@ -72,6 +126,11 @@ class Simulation:
         self.on_miss_callback = on_miss_callback
         self.on_hit_callback = on_hit_callback
         self._segment_statistics = SegmentStatistics()
+        # broken down per tenant for traces.MergedCacheTraceIterator
+        self._tenant_statistics = TenantStatistics() if getattr(trace_iterator, "tenants", None) else None
+        self._residency_analytics = None
+        # event_sink.RequestEventBuffer once there is a subscriber
+        self._events = None
         self._curr_trace_index = 0
         assert self._temporal_format in TEMPORAL_FORMATS
 
@@ -82,8 +141,46 @@ class Simulation:
     def set_execution_logger(self, logger):
         self._execution_logger = logger
 
+    def set_residency_analytics(self, analytics):
+        """
+        Installs residency.ResidencyAnalytics as the cache's eviction sink, next to an eviction log set before.
+        """
+        from eviction_log import TeeEvictionSink, TextEvictionSink
+        cache_instance = self._simulator.cache_instance
+        if cache_instance.eviction_fn == cache_instance._evict_with_sink:
+            sink = TeeEvictionSink([cache_instance.eviction_sink, analytics])
+        elif cache_instance.eviction_fn == cache_instance._evict_with_logging:
+            sink = TeeEvictionSink([TextEvictionSink(cache_instance.eviction_logger), analytics])
+        else:
+            sink = analytics
+        cache_instance.set_eviction_sink(sink)
+        self._residency_analytics = analytics
+
+    def subscribe(self, subscriber, buffer_events=None):
+        """
+        Hands the hit/miss events of the run to subscriber in batches, see event_sink.
+        """
+        from event_sink import RequestEventBuffer, DEFAULT_BUFFER_EVENTS
+        if self._events is None:
+            self._events = RequestEventBuffer(buffer_events=buffer_events or DEFAULT_BUFFER_EVENTS)
+        self._events.subscribers.append(subscriber)
+
+    def _hooks(self):
+        """
+        :return: (miss callback, hit callback, event buffer), None for the ones not in use
+        """
+        return (
+            None if self.on_miss_callback is do_nothing else self.on_miss_callback,
+            None if self.on_hit_callback is do_nothing else self.on_hit_callback,
+            self._events,
+        )
+
+    def _record_residency_window(self):
+        if self._residency_analytics is not None:
+            self._residency_analytics.record_window(self._simulator.cache_instance)
+
     def get_state(self):
-        return {
+        state = {
             "cache_type": str(self._simulator.cache_instance),
             "cache_args": dict(self._simulator.cache_instance.args._asdict()),
             "cache_id": self._simulator.cache_instance.id,
@@ -98,30 +195,58 @@ class Simulation:
                 "segment_total_bytes": self._segment_statistics.segment_total_bytes_list,
                 "segment_miss_count": self._segment_statistics.segment_miss_count_list,
                 "segment_miss_bytes": self._segment_statistics.segment_miss_bytes_list,
+                "segment_expired_miss_count": self._segment_statistics.segment_expired_miss_count_list,
+                "segment_expired_miss_bytes": self._segment_statistics.segment_expired_miss_bytes_list,
             },
+            "expired_count": self._simulator.cache_instance.expired_count,
             "20p_warmup_bmr": self._segment_statistics.bmr(20),
             "20p_warmup_omr": self._segment_statistics.omr(20),
         }
+        if self._tenant_statistics is not None:
+            state["tenant_stats"] = self._tenant_statistics.as_dict()
+        if self._residency_analytics is not None:
+            state["residency_stats"] = self._residency_analytics.as_dict()
+        return state
 
     def run(self):
         start_time = datetime.now()
+        cache_instance = self._simulator.cache_instance
+        track_expiry = cache_instance.expiry is not None
+        tenant_statistics = self._tenant_statistics
+        on_miss, on_hit, events = self._hooks()
         for request in self._trace_iterator:
             if self._simulator.get(request) is None:
                 self._segment_statistics.update_miss(request)
+                if track_expiry and cache_instance.last_get_expired:
+                    self._segment_statistics.update_expired_miss(request)
+                if tenant_statistics is not None:
+                    tenant_statistics.update_miss(request.tenant, request.size)
                 self._simulator.put(request)
-                self.on_miss_callback(request)
+                if on_miss is not None:
+                    on_miss(request)
+                if events is not None:
+                    events.append(request.index, request.size, False)
             else:
-                self.on_hit_callback(request)
+                if on_hit is not None:
+                    on_hit(request)
+                if events is not None:
+                    events.append(request.index, request.size, True)
             self._segment_statistics.update_stat(request)
+            if tenant_statistics is not None:
+                tenant_statistics.update_stat(request.tenant, request.size)
             if self._curr_trace_index != 0 and self._curr_trace_index % self._ordinal_window == 0:
                 log_window(self._execution_logger, self._curr_trace_index,
                            self._trace_iterator, self._segment_statistics.curr_bmr(),
                            self._segment_statistics.curr_omr())
                 self._segment_statistics.record_segment()
+                self._record_residency_window()
             self._curr_trace_index += 1
 
         if (self._curr_trace_index - 1) % self._ordinal_window != 0:
             self._segment_statistics.record_segment()
+            self._record_residency_window()
+        if events is not None:
+            events.flush()
         end_time = datetime.now()
         res = self.get_state()
         res["simulation_time"] = (end_time - start_time).total_seconds()
@@ -0,0 +1,304 @@
+"""
+Sweeps coordinated through a shared directory (e.g. an NFS mount), no queue service needed.
+
+Layout
+    spec.json               the sweep spec
+    pending/{task}.json     tasks waiting for a worker
+    claimed/{task}.json     tasks being run, the file mtime is the worker's heartbeat
+    done/{task}.json        tasks whose result file exists
+    failed/{task}.json      tasks that failed max_attempts times
+    clock/                  files workers touch to read the file server's clock
+
+A task moves between states only by os.rename, which is atomic on a single (NFS) filesystem, so exactly
+one worker wins a claim. The task name is the run.result_filename of its configuration, so a task is
+complete once "{SIMULATION_RESULT_DIRECTORY}/{task}.json" exists, whoever produced it.
+
+A spec maps run.run parameters to values, a list of values is a sweep dimension, e.g.
+    {"cache_type": ["LRU", "GDSF"], "cache_size": [1000000, 10000000], "file_path": "trace.tr",
+     "filter_type": "Bloom", "filter_args": [{"n": 100000}, {"n": 1000000}]}
+expands to 8 tasks.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import socket
+import time
+
+STATES = ("pending", "claimed", "done", "failed")
+
+_RUN_DEFAULTS = {
+    "trace_type": "string",
+    "filter_type": "Null",
+    "filter_args": {},
+    "result_identifier": "regular",
+    "log_eviction": False,
+    "ordinal_window": 1000000,
+    "temporal_window": 600,
+}
+_REQUIRED = ("cache_type", "cache_size", "file_path")
+
+
+def expand_spec(spec):
+    """
+    :return: list of run.run keyword arguments, one per point of the sweep
+    """
+    missing = [name for name in _REQUIRED if name not in spec]
+    if missing:
+        raise ValueError(f"sweep spec is missing {missing}")
+    spec = {**_RUN_DEFAULTS, **spec}
+    names = sorted(spec.keys())
+    dimensions = [spec[name] if isinstance(spec[name], list) else [spec[name]] for name in names]
+    return [dict(zip(names, values)) for values in itertools.product(*dimensions)]
+
+
+def task_name(task_args, trace_dir):
+    """
+    :return: run.result_filename of the task
+    """
+    import inspect
+    import run
+    build_parameters = inspect.signature(run.build_simulation).parameters
+    build_args = {name: value for name, value in task_args.items() if name in build_parameters}
+    build_args["file_path"] = f"{trace_dir}/{task_args['file_path']}"
+    simulation, _, _ = run.build_simulation(**build_args)
+    return run.result_filename(simulation, task_args["result_identifier"])
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{os.path.dirname(path)}/.{os.path.basename(path)}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, sort_keys=True, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp_path, path)
+
+
+class SweepCoordinator:
+    def __init__(self, sweep_dir, trace_dir, simulation_res_dir, stale_after=300, max_attempts=3):
+        self.sweep_dir = sweep_dir
+        self.trace_dir = trace_dir
+        self.simulation_res_dir = simulation_res_dir
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        for state in STATES + ("clock",):
+            os.makedirs(f"{sweep_dir}/{state}", exist_ok=True)
+
+    def _path(self, state, name):
+        return f"{self.sweep_dir}/{state}/{name}.json"
+
+    def _names(self, state):
+        return [filename[:-5] for filename in os.listdir(f"{self.sweep_dir}/{state}")
+                if filename.endswith(".json") and not filename.startswith(".")]
+
+    def is_complete(self, name):
+        return os.path.exists(f"{self.simulation_res_dir}/{name}.json")
+
+    def init(self, spec):
+        """
+        Writes a task for every sweep point that is not already known to the sweep directory.
+        Safe to repeat with an extended spec.
+        :return: number of new tasks
+        """
+        _write_atomic(f"{self.sweep_dir}/spec.json", spec)
+        known = set()
+        for state in STATES:
+            known.update(self._names(state))
+        count = 0
+        for task_args in expand_spec(spec):
+            name = task_name(task_args, self.trace_dir)
+            if name in known:
+                continue
+            known.add(name)
+            state = "done" if self.is_complete(name) else "pending"
+            _write_atomic(self._path(state, name), {"name": name, "args": task_args, "attempts": 0})
+            count += 1
+        return count
+
+    def status(self):
+        return {state: len(self._names(state)) for state in STATES}
+
+    def fs_now(self):
+        """
+        :return: the file server's current time, so heartbeats compare across hosts with skewed clocks
+        """
+        clock_path = f"{self.sweep_dir}/clock/{self.worker_id.replace(':', '_')}"
+        with open(clock_path, "a"):
+            pass
+        os.utime(clock_path, None)
+        return os.stat(clock_path).st_mtime
+
+    def requeue_stale(self):
+        """
+        Moves claims whose heartbeat is older than stale_after back to pending, counting an attempt, or to
+        failed once they used up max_attempts, e.g. a task that keeps crashing its worker.
+        The claim is first renamed to a file private to this worker, so only one worker re-queues it.
+        :return: names of re-queued tasks
+        """
+        now = self.fs_now()
+        requeued = []
+        for name in self._names("claimed"):
+            stale_path = f"{self.sweep_dir}/claimed/.{name}.{self.worker_id.replace(':', '_')}.stale"
+            try:
+                if now - os.stat(self._path("claimed", name)).st_mtime <= self.stale_after:
+                    continue
+                os.rename(self._path("claimed", name), stale_path)
+            except FileNotFoundError:
+                # finished or re-queued by another worker meanwhile
+                continue
+            with open(stale_path) as f:
+                task = json.load(f)
+            task = dict(task, attempts=task["attempts"] + 1, error=f"stale claim of {task.get('owner')}")
+            state = "failed" if task["attempts"] >= self.max_attempts else "pending"
+            _write_atomic(self._path(state, name), task)
+            os.remove(stale_path)
+            if state == "pending":
+                requeued.append(name)
+        return requeued
+
+    def claim(self):
+        """
+        :return: the claimed task, None if nothing is pending
+        """
+        names = self._names("pending")
+        random.shuffle(names)
+        for name in names:
+            try:
+                os.rename(self._path("pending", name), self._path("claimed", name))
+                # the rename keeps the pending file's mtime, which requeue_stale would take for a stale heartbeat
+                os.utime(self._path("claimed", name), None)
+            except FileNotFoundError:
+                continue
+            try:
+                with open(self._path("claimed", name)) as f:
+                    task = json.load(f)
+                task["owner"] = self.worker_id
+                _write_atomic(self._path("claimed", name), task)
+            except FileNotFoundError:
+                continue
+            return task
+        return None
+
+    def heartbeat(self, name):
+        """
+        :return: False if the claim was lost, e.g. re-queued as stale
+        """
+        try:
+            os.utime(self._path("claimed", name), None)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def complete(self, task):
+        try:
+            os.rename(self._path("claimed", task["name"]), self._path("done", task["name"]))
+        except FileNotFoundError:
+            pass
+
+    def fail(self, task, error):
+        task = dict(task, attempts=task["attempts"] + 1, error=error)
+        state = "failed" if task["attempts"] >= self.max_attempts else "pending"
+        try:
+            _write_atomic(self._path("claimed", task["name"]), task)
+            os.rename(self._path("claimed", task["name"]), self._path(state, task["name"]))
+        except FileNotFoundError:
+            pass
+
+
+def _run_task(task_args, dirs):
+    import run
+    run.run(**task_args, **dirs)
+
+
+def work(coordinator, dirs, heartbeat_interval=30, poll_interval=10):
+    """
+    Claims and runs tasks until no task is pending or claimed by anyone.
+    Every task runs run.run in a child process while this process heartbeats its claim.
+    """
+    while True:
+        coordinator.requeue_stale()
+        task = coordinator.claim()
+        if task is None:
+            if not coordinator._names("claimed"):
+                return
+            time.sleep(poll_interval)
+            continue
+        name = task["name"]
+        if coordinator.is_complete(name):
+            coordinator.complete(task)
+            continue
+        process = multiprocessing.Process(target=_run_task, args=(task["args"], dirs))
+        process.start()
+        while True:
+            process.join(heartbeat_interval)
+            if process.exitcode is not None:
+                break
+            if not coordinator.heartbeat(name):
+                print(f"[sweep] lost claim on {name}, finishing it anyway")
+        if process.exitcode == 0 and coordinator.is_complete(name):
+            coordinator.complete(task)
+        else:
+            coordinator.fail(task, f"exit code {process.exitcode} on {coordinator.worker_id}")
+
+
+def _environment_dirs():
+    return {
+        "trace_dir": os.environ["TRACE_DIRECTORY"],
+        "eviction_log_dir": os.environ["EVICTION_LOGGING_RESULT_DIRECTORY"],
+        "execution_log_dir": os.environ["EXECUTION_LOGGING_RESULT_DIRECTORY"],
+        "simulation_res_dir": os.environ["SIMULATION_RESULT_DIRECTORY"],
+    }
+
+
+def _work_process(args, dirs):
+    coordinator = SweepCoordinator(args.sweepDir, dirs["trace_dir"], dirs["simulation_res_dir"],
+                                   args.staleAfter, args.maxAttempts)
+    work(coordinator, dirs, args.heartbeatInterval, args.pollInterval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    init_parser = subparsers.add_parser("init", help="expand a sweep spec into task files")
+    init_parser.add_argument('sweepDir')
+    init_parser.add_argument('spec', help="path of the sweep spec JSON")
+    work_parser = subparsers.add_parser("work", help="claim and run tasks until the sweep is finished")
+    work_parser.add_argument('sweepDir')
+    work_parser.add_argument('--processes', default=1, type=int)
+    work_parser.add_argument('--heartbeatInterval', default=30, type=float, dest='heartbeatInterval')
+    work_parser.add_argument('--pollInterval', default=10, type=float, dest='pollInterval')
+    work_parser.add_argument('--staleAfter', default=300, type=float, dest='staleAfter',
+                             help="seconds without heartbeat after which a claim is re-queued")
+    work_parser.add_argument('--maxAttempts', default=3, type=int, dest='maxAttempts')
+    status_parser = subparsers.add_parser("status")
+    status_parser.add_argument('sweepDir')
+    requeue_parser = subparsers.add_parser("requeue", help="re-queue stale claims now")
+    requeue_parser.add_argument('sweepDir')
+    requeue_parser.add_argument('--staleAfter', default=300, type=float, dest='staleAfter')
+    args = parser.parse_args()
+
+    dirs = _environment_dirs()
+    for directory in ("eviction_log_dir", "execution_log_dir", "simulation_res_dir"):
+        os.makedirs(dirs[directory], exist_ok=True)
+    if args.command == "init":
+        with open(args.spec) as f:
+            spec = json.load(f)
+        coordinator = SweepCoordinator(args.sweepDir, dirs["trace_dir"], dirs["simulation_res_dir"])
+        print(f"{coordinator.init(spec)} new tasks, {coordinator.status()}")
+    elif args.command == "work":
+        processes = [multiprocessing.Process(target=_work_process, args=(args, dirs))
+                     for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    elif args.command == "status":
+        coordinator = SweepCoordinator(args.sweepDir, dirs["trace_dir"], dirs["simulation_res_dir"])
+        print(coordinator.status())
+    else:
+        coordinator = SweepCoordinator(args.sweepDir, dirs["trace_dir"], dirs["simulation_res_dir"],
+                                       args.staleAfter)
+        print(f"re-queued {coordinator.requeue_stale()}")
@@ -0,0 +1,73 @@
+import random
+
+import numpy as np
+import pytest
+
+from accelerated import AcceleratedSimulation, load_trace_arrays
+from caches import initialize_cache
+from caching_system import CachingSystem
+from filters import initialize_filter
+from simulation import Simulation
+from trace_to_block import write_block_trace
+from traces import CacheRequest, initialize_iterator
+
+
+def _requests(request_count=20000, key_count=3000, large_sizes=False, seed=0):
+    rng = random.Random(seed)
+    requests = []
+    for i in range(request_count):
+        key = int(rng.paretovariate(0.7)) % key_count
+        size = (1 << 50) + key if large_sizes else key % 200 + 1
+        requests.append(CacheRequest(key, size, i // 10, i))
+    return requests
+
+
+def _write_trace(path, requests):
+    with open(path, "w") as f:
+        f.writelines(f"{request.ts} {request.key} {request.size}\n" for request in requests)
+
+
+def _run(simulation_cls, cache_type, capacity, filter_type, filter_args, trace_type, trace_path):
+    caching_stack = CachingSystem(initialize_filter(filter_type, **filter_args),
+                                  initialize_cache(cache_type, capacity))
+    simulation = simulation_cls(caching_stack, initialize_iterator(trace_type, trace_path), 1000, 60)
+    res = simulation.run()
+    if simulation_cls is AcceleratedSimulation:
+        assert simulation.is_accelerated
+    for key in ("simulation_time", "simulation_timestamp"):
+        del res[key]
+    return res
+
+
+@pytest.mark.parametrize("cache_type", ["LRU", "FIFO", "CLOCK"])
+@pytest.mark.parametrize("filter_type, filter_args", [("Null", {}), ("Bloom", {"n": 2000})])
+def test_identical_to_simulation(tmp_path, cache_type, filter_type, filter_args):
+    pytest.importorskip("numba")
+    trace_path = str(tmp_path / "trace.tr")
+    _write_trace(trace_path, _requests())
+    args = cache_type, 40000, filter_type, filter_args, "string", trace_path
+    assert _run(AcceleratedSimulation, *args) == _run(Simulation, *args)
+
+
+def test_byte_sums_past_float_precision(tmp_path):
+    pytest.importorskip("numba")
+    trace_path = str(tmp_path / "large.tr")
+    _write_trace(trace_path, _requests(5000, 500, large_sizes=True))
+    args = "LRU", 100 << 50, "Null", {}, "string", trace_path
+    accelerated_res = _run(AcceleratedSimulation, *args)
+    assert max(accelerated_res["segment_stats"]["segment_total_bytes"]) > 1 << 53
+    assert accelerated_res == _run(Simulation, *args)
+
+
+def test_load_trace_arrays_block_fast_path(tmp_path):
+    requests = _requests(3000, 400)
+    requests[5] = CacheRequest((1 << 64) - 1, 7, 0, 5)
+    block_path = str(tmp_path / "trace.blk")
+    write_block_trace(requests, block_path, 256)
+    trace_iterator = initialize_iterator("block", block_path)
+    sizes, key_ids, keys = load_trace_arrays(trace_iterator)
+    assert sizes.dtype == np.int64 and key_ids.dtype == np.int64
+    assert sizes.tolist() == [request.size for request in requests]
+    assert [keys[key_id] for key_id in key_ids] == [request.key for request in requests]
+    assert trace_iterator.total_count == len(requests)
+    assert trace_iterator.total_size == sum(request.size for request in requests)
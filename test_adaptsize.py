@@ -0,0 +1,83 @@
+import math
+import random
+
+import pytest
+
+from filters import adaptsize_hit_ratios, initialize_filter
+from traces import CacheRequest
+
+
+def _bisect_hit_ratio(rates, sizes, cache_size, c):
+    """
+    Scalar reference of the AdaptSize model: bisection on T, then the rate weighted h_i.
+    """
+    def in_cache(t):
+        hs = []
+        for rate, size in zip(rates, sizes):
+            a = math.exp(-size / c)
+            x = math.exp(-rate * t)
+            hs.append(a * (1 - x) / (x + a * (1 - x)))
+        return hs
+
+    low, high = 1e-9, 1e9
+    for _ in range(200):
+        mid = math.sqrt(low * high)
+        if sum(h * size for h, size in zip(in_cache(mid), sizes)) > cache_size:
+            high = mid
+        else:
+            low = mid
+    return sum(h * rate for h, rate in zip(in_cache(low), rates)) / sum(rates)
+
+
+def test_hit_ratio_of_equal_admission():
+    # with every object admitted, h_i = 1 - e^(-T) for equal rates, sizes 1 + 3 and 2 bytes of cache
+    # give h = 1/2
+    assert adaptsize_hit_ratios([1, 1], [1, 3], 2, [1e12])[0] == pytest.approx(0.5)
+    # everything fits
+    assert adaptsize_hit_ratios([1, 2], [1, 3], 10, [1e12])[0] == pytest.approx(1)
+
+
+def test_hit_ratios_match_scalar_model():
+    rates, sizes, cache_size = [0.5, 0.2, 0.05, 0.01], [10, 40, 200, 1000], 150
+    cs = [5, 50, 500, 5000]
+    expected = [_bisect_hit_ratio(rates, sizes, cache_size, c) for c in cs]
+    assert adaptsize_hit_ratios(rates, sizes, cache_size, cs) == pytest.approx(expected, rel=1e-6)
+    # the small popular objects gain from keeping the large ones out
+    assert expected[1] > expected[-1]
+
+
+def _skewed_requests(request_count, seed=0):
+    rng = random.Random(seed)
+    for i in range(request_count):
+        if rng.random() < 0.8:
+            yield CacheRequest(rng.randrange(50), 10, i, i)
+        else:
+            yield CacheRequest(1000 + rng.randrange(5000), 4000, i, i)
+
+
+def _tuned_filter(request_count=20000):
+    adaptsize = initialize_filter("AdaptSize", cache_size=20000, window=2000)
+    for request in _skewed_requests(request_count):
+        adaptsize.observe(request)
+    return adaptsize
+
+
+def test_retunes_on_skewed_trace():
+    adaptsize = _tuned_filter()
+    assert [observed for observed, *_ in adaptsize.tuning_history] == list(range(2000, 20001, 2000))
+    # admitting the large one-off objects would push out the popular small ones
+    assert adaptsize.c < 400
+    assert math.exp(-4000 / adaptsize.c) < 1e-4
+    assert [c for _, c, *_ in _tuned_filter().tuning_history] == [c for _, c, *_ in adaptsize.tuning_history]
+
+
+def test_admission_probability_falls_with_size():
+    adaptsize = initialize_filter("AdaptSize", cache_size=20000)
+    assert not any(adaptsize.should_filter(CacheRequest(0, 10 ** 6, 0, 0)) for _ in range(100))
+    adaptsize.c = 100
+    admitted = []
+    for size in (10, 50, 100, 200, 400):
+        draws = 20000
+        admitted.append(sum(not adaptsize.should_filter(CacheRequest(0, size, 0, 0)) for _ in range(draws)) / draws)
+        assert admitted[-1] == pytest.approx(math.exp(-size / 100), abs=0.02)
+    assert admitted == sorted(admitted, reverse=True)
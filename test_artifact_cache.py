@@ -0,0 +1,50 @@
+import pytest
+
+import artifact_cache
+from traces import initialize_iterator
+
+
+def _write_trace(path, columns=""):
+    with open(path, "w") as f:
+        for i in range(100):
+            f.write(f"{i} {i % 13} {i % 5 + 1}{columns}\n")
+
+
+def _requests(iterator):
+    return [(request.ts, request.key, request.size) for request in iterator]
+
+
+@pytest.mark.parametrize("trace_type", ["binary", "bin_arr", "block", "pickle"])
+def test_cached_conversion_matches_string_trace(tmp_path, monkeypatch, trace_type):
+    monkeypatch.setenv(artifact_cache.ARTIFACT_CACHE_DIRECTORY, str(tmp_path / "artifacts"))
+    trace_path = str(tmp_path / "plain.tr")
+    _write_trace(trace_path, " -")
+    iterator = initialize_iterator(f"cached:{trace_type}", trace_path)
+    assert iterator.trace_filename == "plain"
+    requests = _requests(iterator)
+    expected = _requests(initialize_iterator("string", trace_path))
+    if trace_type == "bin_arr":
+        # bin_arr stores hashes of the keys
+        requests = [(ts, key_ids.setdefault(key, len(key_ids)), size)
+                    for key_ids in [{}] for ts, key, size in requests]
+        expected = [(ts, key_ids.setdefault(key, len(key_ids)), size)
+                    for key_ids in [{}] for ts, key, size in expected]
+    assert requests == expected
+
+
+@pytest.mark.parametrize("trace_type", ["binary", "bin_arr", "block"])
+@pytest.mark.parametrize("columns", [" 30", " - 0 10"])
+def test_lossy_cached_conversion_is_refused(tmp_path, monkeypatch, trace_type, columns):
+    monkeypatch.setenv(artifact_cache.ARTIFACT_CACHE_DIRECTORY, str(tmp_path / "artifacts"))
+    trace_path = str(tmp_path / "ttl.tr")
+    _write_trace(trace_path, columns)
+    with pytest.raises(ValueError, match="ttl or range"):
+        initialize_iterator(f"cached:{trace_type}", trace_path)
+    assert [entry for entry in artifact_cache.default_cache().entries()] == []
+
+
+def test_pickle_keeps_ttl(tmp_path, monkeypatch):
+    monkeypatch.setenv(artifact_cache.ARTIFACT_CACHE_DIRECTORY, str(tmp_path / "artifacts"))
+    trace_path = str(tmp_path / "ttl.tr")
+    _write_trace(trace_path, " 30")
+    assert {request.ttl for request in initialize_iterator("cached:pickle", trace_path)} == {30}
@@ -0,0 +1,47 @@
+import random
+
+import bloom_filter
+import pytest
+
+from accelerated import BLOOM_ERROR_RATE, _check_probes, bloom_probe_table
+from bloom_fp_sweep import run_sweep
+from filters import initialize_filter
+from traces import initialize_iterator
+
+
+def _write_trace(path, request_count=3000, key_count=800, seed=0):
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for i in range(request_count):
+            f.write(f"{i} {int(rng.paretovariate(0.7)) % key_count} 100\n")
+
+
+def test_sweep_matches_the_bloom_filter(tmp_path):
+    trace_path = str(tmp_path / "sweep.tr")
+    _write_trace(trace_path)
+    ns = [50, 400]
+    rows = run_sweep(initialize_iterator("string", trace_path), ns)
+    for n, row in zip(ns, rows):
+        bloom = initialize_filter("Bloom", n=n)
+        seen = set()
+        false_positive_count = refiltered_count = 0
+        for request in initialize_iterator("string", trace_path):
+            filtered = bloom.should_filter(request)
+            if request.key not in seen:
+                false_positive_count += not filtered
+            else:
+                refiltered_count += filtered
+            seen.add(request.key)
+        assert row["n"] == n
+        assert row["total_object_count"] == len(seen)
+        assert row["false_positive_request_count"] == false_positive_count
+        assert row["refiltered_request_count"] == refiltered_count
+
+
+def test_probe_derivation_is_checked():
+    keys = list(range(20))
+    probes, _ = bloom_probe_table(keys, 100)
+    template = bloom_filter.BloomFilter(100, error_rate=BLOOM_ERROR_RATE)
+    probes[3, 0] += 1
+    with pytest.raises(RuntimeError):
+        _check_probes(template, keys, probes)
@@ -0,0 +1,80 @@
+import pytest
+
+from caches import initialize_cache
+from caching_system import CachingSystem
+from chunking import ChunkedSimulation, ChunkingArgs, chunk_span, missing_range_bytes
+from filters import initialize_filter
+from traces import CacheRequest, initialize_iterator
+
+
+@pytest.mark.parametrize("range_start, range_end, expected", [
+    (None, None, (0, 4, 0, 100)),
+    (25, 65, (0, 3, 25, 65)),
+    (30, 60, (1, 2, 30, 60)),
+    (29, 31, (0, 2, 29, 31)),
+    (95, 500, (3, 4, 95, 100)),
+    (40, 40, (0, 0, 40, 40)),
+])
+def test_chunk_span(range_start, range_end, expected):
+    assert chunk_span(CacheRequest(1, 100, 0, 0, range_start=range_start, range_end=range_end), 30) == expected
+
+
+@pytest.mark.parametrize("missing, range_start, range_end, expected", [
+    ([], 25, 65, 0),
+    ([0, 1, 2], 25, 65, 40),
+    ([0, 2], 25, 65, 10),
+    ([1], 25, 65, 30),
+    ([1, 2], 25, 65, 35),
+    ([3], 0, 100, 10),
+])
+def test_missing_range_bytes(missing, range_start, range_end, expected):
+    assert missing_range_bytes(missing, 30, range_start, range_end) == expected
+
+
+def _run(tmp_path, lines, cache_type, cache_size, chunk_size):
+    trace_path = str(tmp_path / "chunks.tr")
+    with open(trace_path, "w") as f:
+        f.writelines(f"{line}\n" for line in lines)
+    caching_stack = CachingSystem(initialize_filter("Null"), initialize_cache(cache_type, cache_size))
+    simulation = ChunkedSimulation(caching_stack, initialize_iterator("string", trace_path), 1000, 60,
+                                   chunking_args=ChunkingArgs(chunk_size))
+    return simulation.run(), caching_stack.cache_instance
+
+
+@pytest.mark.parametrize("cache_type", ["LRU", "FIFO", "GDSF"])
+def test_partial_chunk_hits(tmp_path, cache_type):
+    lines = [
+        "0 1 100 - 0 30",  # chunk 0 misses
+        "1 1 100 - 25 65",  # chunk 0 hits, 1 and 2 miss: bytes 30..65 miss
+        "2 1 100 - 0 90",  # chunks 0 to 2 hit
+        "3 1 100",  # the 10 byte chunk 3 misses
+    ]
+    res, _ = _run(tmp_path, lines, cache_type, 1000, 30)
+    segment_stats = res["segment_stats"]
+    assert segment_stats["segment_total_count"] == [4]
+    assert segment_stats["segment_total_bytes"] == [30 + 40 + 90 + 100]
+    assert segment_stats["segment_miss_count"] == [3]
+    assert segment_stats["segment_miss_bytes"] == [30 + 35 + 10]
+    assert res["chunk_stats"]["segment_stats"] == {
+        "segment_chunk_total_count": [1 + 3 + 3 + 4],
+        "segment_chunk_miss_count": [1 + 2 + 0 + 1],
+        "segment_chunk_fetch_bytes": [30 + 60 + 0 + 10],
+    }
+
+
+@pytest.mark.parametrize("cache_type", ["LRU", "FIFO"])
+def test_object_larger_than_the_cache(tmp_path, cache_type):
+    # chunks of 30, 30, 30 and 10 bytes through a 50 byte cache keep only the trailing two, the second
+    # request hits those and its admissions leave only chunk 1, so the last range misses and brings them back
+    res, cache = _run(tmp_path, ["0 1 100", "1 1 100", "2 1 100 - 70 100"], cache_type, 50, 30)
+    assert res["segment_stats"]["segment_miss_bytes"] == [100 + 60 + 30]
+    assert res["segment_stats"]["segment_miss_count"] == [3]
+    assert sorted(obj.key for obj in cache.cached_objects()) == [(1, 2), (1, 3)]
+    assert cache.curr_capacity <= 50
+
+
+def test_chunks_larger_than_the_cache_are_never_admitted(tmp_path):
+    res, cache = _run(tmp_path, ["0 1 100", "1 1 100 - 0 10", "2 1 100 - 0 10"], "LRU", 50, 80)
+    assert res["segment_stats"]["segment_miss_count"] == [3]
+    assert res["chunk_stats"]["segment_stats"]["segment_chunk_fetch_bytes"] == [100 + 80 + 80]
+    assert cache.curr_capacity == 20
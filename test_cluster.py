@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+from caches import initialize_cache
+from caching_system import CachingSystem
+from cluster import ClusterArgs, ConsistentHashRing, RendezvousHash, simulate_cluster
+from filters import initialize_filter
+from simulation import Simulation
+from traces import initialize_iterator
+
+
+def _write_trace(path, request_count=3000, key_count=400, seed=0):
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for i in range(request_count):
+            key = int(rng.paretovariate(0.8)) % key_count
+            f.write(f"{i} {key} {(key % 5 + 1) * 100}\n")
+
+
+def test_single_node_cluster_matches_simulation(tmp_path):
+    trace_path = str(tmp_path / "cluster.tr")
+    _write_trace(trace_path)
+    expected = Simulation(
+        CachingSystem(initialize_filter("Null"), initialize_cache("LRU", 20000)),
+        initialize_iterator("string", trace_path), 1000
+    ).run()
+    res = simulate_cluster("LRU", 20000, initialize_iterator("string", trace_path), "Null", {},
+                           ClusterArgs(nodes=1), 1000, processes=1, shard_dir=str(tmp_path))
+    assert res["segment_stats"]["segment_miss_count"] == expected["segment_stats"]["segment_miss_count"]
+    assert res["segment_stats"]["segment_total_bytes"] == expected["segment_stats"]["segment_total_bytes"]
+
+
+def test_removed_node_comes_back_cold(tmp_path):
+    trace_path = str(tmp_path / "cluster.tr")
+    with open(trace_path, "w") as f:
+        for i in range(20):
+            f.write(f"{i} 0 100\n")
+    cluster_args = ClusterArgs(nodes=1, membership_events=((10, "remove", "node-0"), (10, "add", "node-0")))
+    res = simulate_cluster("LRU", 1000, initialize_iterator("string", trace_path), "Null", {},
+                           cluster_args, 100, processes=1)
+    assert res["segment_stats"]["segment_miss_count"] == [2]
+    assert res["node_stats"]["node-0"]["total_count"] == 20
+
+
+def test_adding_a_present_node_is_a_no_op():
+    for router in (ConsistentHashRing(["a", "b"], 10), RendezvousHash(["a", "b"])):
+        routes = [router.route(key) for key in range(200)]
+        router.add_node("a")
+        assert [router.route(key) for key in range(200)] == routes
+        router.remove_node("a")
+        assert {router.route(key) for key in range(200)} == {"b"}
+
+
+def test_removing_a_node_only_moves_its_keys():
+    for router in (ConsistentHashRing(["a", "b", "c"], 50), RendezvousHash(["a", "b", "c"])):
+        routes = [router.route(key) for key in range(1000)]
+        router.remove_node("c")
+        for key, node in enumerate(routes):
+            if node != "c":
+                assert router.route(key) == node
+
+
+@pytest.mark.parametrize("cluster_args, message", [
+    (ClusterArgs(nodes=2, membership_events=((5, "remove", "node-7"),)), "not in the cluster"),
+    (ClusterArgs(nodes=2, membership_events=((5, "remove", "node-1"), (9, "remove", "node-1"))),
+     "not in the cluster"),
+    (ClusterArgs(nodes=2, membership_events=((5, "remove", "node-0"), (8, "remove", "node-1"))),
+     "remove every node"),
+    (ClusterArgs(nodes=1, membership_events=((5, "drain", "node-0"),)), "not supported"),
+    (ClusterArgs(nodes=0), "at least one node"),
+])
+def test_invalid_membership_events_fail_before_routing(tmp_path, cluster_args, message):
+    trace_path = str(tmp_path / "cluster.tr")
+    _write_trace(trace_path, request_count=20)
+    with pytest.raises(ValueError, match=message):
+        simulate_cluster("LRU", 1000, initialize_iterator("string", trace_path), "Null", {},
+                         cluster_args, 100, processes=1, shard_dir=str(tmp_path))
+    assert not list(tmp_path.glob("*.pickle"))
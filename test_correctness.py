@@ -2,11 +2,27 @@ import caches
 from test_utils import cache_info_map, TraceInfo, execute_traces, assert_expected_responses
 
 
-def test_lru():
-    cache_info = cache_info_map["lru"]
-    cache_cls, trace_infos = cache_info["cache_cls"], cache_info["trace_infos"]
+def _test_cache(cache_name):
+    cache_info = cache_info_map[cache_name]
+    cache_cls, args_cls = cache_info["cache_cls"], cache_info["args_cls"]
     for trace_info in cache_info["trace_infos"]:
-        cache_snapshot = execute_traces(cache_cls, trace_info)
+        cache_snapshot = execute_traces(cache_cls, trace_info, args_cls)
         assert_expected_responses(cache_snapshot, trace_info)
 
-test_lru()
\ No newline at end of file
+
+def test_lru():
+    _test_cache("lru")
+
+
+def test_lfu():
+    _test_cache("lfu")
+
+
+def test_lfuda():
+    _test_cache("lfuda")
+
+
+def test_wlfu():
+    _test_cache("wlfu")
+
+test_lru()
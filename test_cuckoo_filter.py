@@ -0,0 +1,72 @@
+from cuckoo_filter import CuckooFilter, key_hash
+from filters import CountingCuckooFilter, CountingCuckooFilterArgs, CuckooSetFilter, CuckooSetFilterArgs
+from traces import CacheRequest
+
+
+def _request(key):
+    return CacheRequest(key, 1, 0, 0)
+
+
+def test_counts_and_removal():
+    cuckoo_filter = CuckooFilter(1000)
+    for key in range(800):
+        for _ in range(key % 3 + 1):
+            assert cuckoo_filter.add(key)
+    assert len(cuckoo_filter) == 800
+    assert all(cuckoo_filter.count(key) >= key % 3 + 1 for key in range(800))
+    for key in range(800):
+        assert cuckoo_filter.remove(key)
+    assert all(cuckoo_filter.count(key) >= key % 3 for key in range(800))
+    assert sum(cuckoo_filter.count(key) for key in range(800)) < 800 * 2
+
+
+def test_saturated_count_survives_removal():
+    cuckoo_filter = CuckooFilter(100)
+    for _ in range(300):
+        cuckoo_filter.add("hot")
+    assert cuckoo_filter.count("hot") == 255
+    for _ in range(300):
+        cuckoo_filter.remove("hot")
+    assert cuckoo_filter.count("hot") == 255
+    cuckoo_filter.clear()
+    assert "hot" not in cuckoo_filter
+
+
+def _crowded_keys(cuckoo_filter, count):
+    """
+    :return: keys that all hash to buckets 0 and 1
+    """
+    keys = []
+    key = 0
+    while len(keys) < count:
+        _, bucket1, bucket2 = cuckoo_filter._locate(key_hash(key))
+        if {bucket1, bucket2} == {0, 1}:
+            keys.append(key)
+        key += 1
+    return keys
+
+
+def test_add_fails_when_full():
+    cuckoo_filter = CuckooFilter(16)
+    results = [cuckoo_filter.add(key) for key in _crowded_keys(cuckoo_filter, 12)]
+    # two buckets of 4 slots plus the victim stash
+    assert results == [True] * 9 + [False] * 3
+
+
+def test_counting_filter_rotates_instead_of_dropping():
+    counting_filter = CountingCuckooFilter(CountingCuckooFilterArgs(1000, 1))
+    current = counting_filter._filters[counting_filter._curr_filter]
+    keys = _crowded_keys(current, 10)
+    for key in keys[:9]:
+        counting_filter.should_filter(_request(key))
+    assert counting_filter.should_filter(_request(keys[9]))
+    assert not counting_filter.should_filter(_request(keys[9]))
+
+
+def test_set_filter_makes_room_instead_of_dropping():
+    set_filter = CuckooSetFilter(CuckooSetFilterArgs(16))
+    keys = _crowded_keys(set_filter._filter, 10)
+    for key in keys:
+        assert set_filter.should_filter(_request(key))
+    assert not set_filter.should_filter(_request(keys[-1]))
+    assert set_filter.should_filter(_request(keys[0]))
@@ -0,0 +1,91 @@
+import logging
+import os
+
+import pytest
+
+from caches import initialize_cache
+from eviction_log import (EvictionLogWriter, RECORD_FIELDS, TeeEvictionSink, TextEvictionSink, _key_to_int64,
+                          read_eviction_log)
+from run import run
+from traces import CacheRequest
+
+
+class _Recorder:
+    def __init__(self):
+        self.records = []
+
+    def write(self, obj, request):
+        self.records.append((_key_to_int64(obj.key), obj.size, obj.frequency, obj.ts,
+                             request.ts - obj.ts, obj.index, request.index - obj.index))
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(record.getMessage())
+
+
+def _replay(cache, request_count=103):
+    for i in range(request_count):
+        key = i % 17 if i % 3 else f"key{i % 11}"
+        request = CacheRequest(key, i % 9 + 1, i // 2, i)
+        if cache.get(request) is None:
+            cache.admit(request)
+
+
+def _evict(sink):
+    cache = initialize_cache("LRU", 50)
+    cache.set_eviction_sink(sink)
+    _replay(cache)
+
+
+@pytest.mark.parametrize("threaded", [False, True])
+def test_write_read_round_trip(tmp_path, threaded):
+    path = str(tmp_path / "evictions.evlog")
+    recorder = _Recorder()
+    # 7 records per buffer, so the final buffer is only partially filled
+    with EvictionLogWriter(path, buffer_records=7, threaded=threaded) as writer:
+        _evict(TeeEvictionSink([writer, recorder]))
+    assert writer.record_count == len(recorder.records)
+    assert len(recorder.records) % 7 != 0
+    log = read_eviction_log(path)
+    assert list(zip(*(log[field].tolist() for field in RECORD_FIELDS))) == recorder.records
+
+
+def test_empty_log_and_bad_header(tmp_path):
+    path = str(tmp_path / "empty.evlog")
+    EvictionLogWriter(path).close()
+    assert all(len(values) == 0 for values in read_eviction_log(path).values())
+    bad_path = str(tmp_path / "bad.evlog")
+    with open(bad_path, "wb") as f:
+        f.write(b"NOTALOG")
+    with pytest.raises(ValueError):
+        read_eviction_log(bad_path)
+
+
+def test_text_sink_matches_eviction_logger():
+    sink_handler, logger_handler = _ListHandler(), _ListHandler()
+    for name, handler in (("test_text_sink", sink_handler), ("test_eviction_logger", logger_handler)):
+        logging.getLogger(name).setLevel(logging.INFO)
+        logging.getLogger(name).addHandler(handler)
+    _evict(TextEvictionSink(logging.getLogger("test_text_sink")))
+    cache = initialize_cache("LRU", 50)
+    cache.set_eviction_logger(logging.getLogger("test_eviction_logger"))
+    _replay(cache)
+    assert sink_handler.lines and sink_handler.lines == logger_handler.lines
+
+
+def test_run_logs_text_evictions_by_default(tmp_path):
+    directories = [tmp_path / name for name in ("traces", "evictions", "execution", "results")]
+    for directory in directories:
+        directory.mkdir()
+    with open(directories[0] / "trace.tr", "w") as f:
+        f.writelines(f"{i} {i % 13} 10\n" for i in range(200))
+    run("LRU", 50, "trace.tr", "string", "Null", {}, "regular", True, 100, 60, *map(str, directories))
+    eviction_files = os.listdir(directories[1])
+    assert len(eviction_files) == 1 and eviction_files[0].endswith(".log")
+    with open(directories[1] / eviction_files[0]) as f:
+        assert len(f.readline().split()) == 7
@@ -0,0 +1,72 @@
+import random
+
+from caches import LRUCache, LRUArgs, initialize_cache
+from traces import CacheRequest
+
+
+class _ObjectFIFO(LRUCache):
+    """
+    FIFO over CacheObjects: LRUCache without reordering on hits.
+    """
+
+    def _get(self, request):
+        return self.map.get(request.key)
+
+
+class _Sink:
+    def __init__(self):
+        self.records = []
+
+    def write(self, obj, request):
+        self.records.append((obj.key, obj.size, obj.frequency, obj.ts, obj.index, request.index))
+
+
+def test_slots_match_objects():
+    rng = random.Random(0)
+    for capacity in (500, 5000):
+        fifo, reference = initialize_cache("FIFO", capacity), _ObjectFIFO(capacity, LRUArgs())
+        sinks = _Sink(), _Sink()
+        fifo.set_eviction_sink(sinks[0])
+        reference.set_eviction_sink(sinks[1])
+        for i in range(20000):
+            key = int(rng.paretovariate(0.7)) % 300
+            request = CacheRequest(key, key % 50 + 1, i // 3, i)
+            if rng.random() < 0.05:
+                removed = fifo._remove(key), reference._remove(key)
+                assert (removed[0] is None) == (removed[1] is None)
+                continue
+            hit = fifo.get(request)
+            expected = reference.get(request)
+            assert (hit is None) == (expected is None)
+            if hit is None:
+                assert fifo.admit(request) == reference.admit(request)
+            else:
+                assert (hit.key, hit.frequency, hit.ts) == (expected.key, expected.frequency, expected.ts)
+            assert fifo.curr_capacity == reference.curr_capacity
+        assert sinks[0].records == sinks[1].records
+        assert sorted((obj.key, obj.frequency) for obj in fifo.cached_objects()) == \
+            sorted((obj.key, obj.frequency) for obj in reference.cached_objects())
+
+
+def test_readmission_moves_to_the_back():
+    fifo = initialize_cache("FIFO", 3)
+    for key in (1, 2, 3):
+        fifo.admit(CacheRequest(key, 1, 0, key))
+    fifo.admit(CacheRequest(1, 1, 0, 4))
+    fifo.admit(CacheRequest(4, 1, 0, 5))
+    assert sorted(obj.key for obj in fifo.cached_objects()) == [1, 3, 4]
+
+
+def test_returned_objects_stay_valid():
+    fifo = initialize_cache("FIFO", 4)
+    for key in range(4):
+        fifo.admit(CacheRequest(key, 1, key, key))
+    kept = [fifo.get(CacheRequest(key, 1, 10, 10 + key)) for key in range(4)]
+    second = fifo.get(CacheRequest(1, 1, 20, 20))
+    # evict 0 and 1 and compact the slots away, then reuse them for other keys
+    for key in range(4, 8):
+        fifo.admit(CacheRequest(key, 1, key, key))
+    assert [(obj.key, obj.ts, obj.index, obj.frequency) for obj in kept] == \
+        [(0, 0, 0, 2), (1, 1, 1, 2), (2, 2, 2, 2), (3, 3, 3, 2)]
+    assert (second.key, second.frequency) == (1, 3)
+    assert fifo.get(CacheRequest(0, 1, 30, 30)) is None
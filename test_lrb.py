@@ -0,0 +1,62 @@
+import random
+
+import numpy as np
+
+from caches import initialize_cache
+from caching_system import CachingSystem
+from filters import initialize_filter
+from learned_model import RidgeModel, StumpBoostingModel
+from simulation import Simulation
+from traces import initialize_iterator
+
+
+def _write_trace(path, request_count=20000, key_count=2000, seed=0):
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for i in range(request_count):
+            key = int(rng.paretovariate(0.7)) % key_count
+            f.write(f"{i} {key} {(key % 9 + 1) * 100}\n")
+
+
+def _lrb_run(trace_path, **kwargs):
+    cache = initialize_cache("LRB", 100000, retrain_interval=500, training_window=2000, **kwargs)
+    res = Simulation(CachingSystem(initialize_filter("Null"), cache), initialize_iterator("string", trace_path),
+                     5000).run()
+    return cache, res
+
+
+def test_ridge_recovers_a_linear_relation():
+    rng = np.random.default_rng(0)
+    features = rng.normal(size=(500, 3))
+    labels = features @ np.array([1.0, -2.0, 0.5])
+    params = RidgeModel(l2=1e-6).fit(features, labels)
+    assert np.allclose(params, [1.0, -2.0, 0.5], atol=1e-4)
+
+
+def test_stump_boosting_reduces_the_error():
+    rng = np.random.default_rng(0)
+    features = rng.uniform(size=(1000, 2))
+    labels = np.where(features[:, 1] > 0.5, 3.0, -1.0)
+    model = StumpBoostingModel(rounds=16)
+    predictions = model.predict(model.fit(features, labels), features)
+    assert np.mean((predictions - labels) ** 2) < 0.1 * np.var(labels)
+
+
+def test_lrb_is_reproducible_and_within_capacity(tmp_path):
+    trace_path = str(tmp_path / "lrb.tr")
+    _write_trace(trace_path)
+    cache, res = _lrb_run(trace_path)
+    _, again = _lrb_run(trace_path)
+    assert cache._params is not None
+    assert res["segment_stats"] == again["segment_stats"]
+    assert cache.curr_capacity <= cache.capacity
+    assert cache.curr_capacity == sum(obj.size for obj in cache.cached_objects())
+    assert 0 < sum(res["segment_stats"]["segment_miss_count"]) < 20000
+
+
+def test_lrb_ridge_model(tmp_path):
+    trace_path = str(tmp_path / "lrb.tr")
+    _write_trace(trace_path)
+    cache, res = _lrb_run(trace_path, model="ridge")
+    assert cache._params is not None
+    assert cache.curr_capacity <= cache.capacity
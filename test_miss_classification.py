@@ -0,0 +1,99 @@
+import os
+import random
+import subprocess
+import sys
+from collections import OrderedDict
+
+from miss_classification import GhostLRU, fingerprint
+from run import build_simulation
+
+
+class _ReferenceLRU:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.curr_capacity = 0
+        self.map = OrderedDict()
+
+    def access(self, fp, size):
+        if fp in self.map:
+            self.map.move_to_end(fp)
+            return True
+        if size > self.capacity:
+            return False
+        self.curr_capacity += size
+        while self.curr_capacity > self.capacity:
+            self.curr_capacity -= self.map.popitem(last=False)[1]
+        self.map[fp] = size
+        return False
+
+
+def test_ghost_lru_matches_reference():
+    rng = random.Random(0)
+    for capacity in (50, 1000, 30000):
+        ghost, reference = GhostLRU(capacity, capacity_bits=2), _ReferenceLRU(capacity)
+        for _ in range(50000):
+            key = int(rng.paretovariate(0.6)) % 5000
+            # fingerprints sharing their top bits exercise long probe runs
+            fp = fingerprint(key) if rng.random() < 0.9 else (rng.randrange(1, 64) << 57) | 1
+            size = rng.randrange(1, 60)
+            assert ghost.access(fp, size) == reference.access(fp, size)
+        assert ghost.curr_capacity == reference.curr_capacity
+        assert ghost.count == len(reference.map)
+
+
+def _classify(tmp_path, lines, **kwargs):
+    trace_path = str(tmp_path / "classify.tr")
+    with open(trace_path, "w") as f:
+        f.writelines(f"{line}\n" for line in lines)
+    simulation, _, classifier = build_simulation(
+        kwargs.pop("cache_type", "LRU"), kwargs.pop("cache_size", 1000), trace_path, "string",
+        kwargs.pop("filter_type", "Null"), kwargs.pop("filter_args", {}), 100, 60, classify_misses=True, **kwargs
+    )
+    res = simulation.run()
+    classifier.finish()
+    classification = classifier.as_dict()
+    assert sum(classification["miss_count"].values()) == sum(res["segment_stats"]["segment_miss_count"])
+    return classification["miss_count"]
+
+
+def test_filter_induced_miss(tmp_path):
+    miss_count = _classify(tmp_path, ["0 1 10", "1 1 10", "2 1 10"], filter_type="Bloom", filter_args={"n": 100})
+    assert miss_count == {"compulsory": 1, "expired": 0, "filter": 1, "capacity": 0, "beyond": 0}
+
+
+def test_filter_ghost_follows_the_cache_policy(tmp_path):
+    # FIFO evicts 1 before 2 although 1 was hit last, so the last request is a capacity miss,
+    # an unfiltered LRU ghost would still hold 1 and call it filter induced
+    lines = ["0 1 10", "1 1 10", "2 2 10", "3 2 10", "4 1 10", "5 3 10", "6 3 10", "7 1 10"]
+    miss_count = _classify(tmp_path, lines, cache_type="FIFO", cache_size=20,
+                           filter_type="Bloom", filter_args={"n": 100})
+    assert miss_count == {"compulsory": 3, "expired": 0, "filter": 3, "capacity": 1, "beyond": 0}
+
+
+def test_expired_miss(tmp_path):
+    miss_count = _classify(tmp_path, ["0 1 10", "10 1 10", "11 1 10"], expiry=True, default_ttl=5)
+    assert miss_count == {"compulsory": 1, "expired": 1, "filter": 0, "capacity": 0, "beyond": 0}
+
+
+def test_every_class_on_one_trace(tmp_path):
+    # two objects fit the cache, eight the larger ghost, every key needs two misses to pass the Bloom filter
+    lines = [
+        "0 1 10",  # compulsory
+        "1 1 10",  # filter: the unfiltered ghost admitted 1 at its first miss
+        "2 1 10",  # hit
+        "3 2 10", "4 2 10", "5 3 10", "6 3 10",  # compulsory, filter, compulsory, filter; 1 is evicted
+        "7 1 10",  # capacity: evicted from the cache and the unfiltered ghost, the larger ghost holds it
+        *(f"{8 + i} {4 + i} 10" for i in range(8)),  # compulsory, pushing 1, 2 and 3 out of the larger ghost
+        "16 2 10",  # beyond, admitted again
+        "100 2 10",  # expired: its ttl ran out at 66
+    ]
+    miss_count = _classify(tmp_path, lines, cache_size=20, filter_type="Bloom", filter_args={"n": 100},
+                           expiry=True, default_ttl=50)
+    assert miss_count == {"compulsory": 11, "expired": 1, "filter": 3, "capacity": 1, "beyond": 1}
+
+
+def test_fingerprints_are_stable_across_processes():
+    code = "from miss_classification import fingerprint; print(fingerprint('key'), fingerprint(2 ** 70))"
+    outputs = {subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                              env={**os.environ, "PYTHONHASHSEED": seed}).stdout for seed in ("1", "2")}
+    assert len(outputs) == 1
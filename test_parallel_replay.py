@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from caches import initialize_cache
+from caching_system import CachingSystem
+from filters import initialize_filter
+from parallel_replay import _SEGMENT_FIELDS, _slice_bounds, _replay_slice, approximation_report, simulate_sliced
+from simulation import Simulation, ordinal_window_index
+from trace_to_block import write_block_trace
+from traces import CacheRequest, initialize_iterator
+
+_REQUEST_COUNT = 5003
+_ORDINAL_WINDOW = 500
+
+
+@pytest.fixture
+def block_trace(tmp_path):
+    rng = random.Random(0)
+    requests = [CacheRequest(int(rng.paretovariate(0.7)) % 800, rng.randrange(1, 100), i // 10, i)
+                for i in range(_REQUEST_COUNT)]
+    path = str(tmp_path / "trace.blk")
+    write_block_trace(requests, path, 256)
+    return path
+
+
+def _serial_segment_stats(path, cache_type, filter_type, filter_args):
+    caching_stack = CachingSystem(initialize_filter(filter_type, **filter_args), initialize_cache(cache_type, 5000))
+    res = Simulation(caching_stack, initialize_iterator("block", path), _ORDINAL_WINDOW, 60).run()
+    return {field: res["segment_stats"][field] for field in _SEGMENT_FIELDS}
+
+
+@pytest.mark.parametrize("total_count, slices, ordinal_window", [
+    (1, 4, 10), (10, 4, 10), (11, 4, 10), (12, 4, 10), (1003, 3, 100), (1003, 50, 100), (5000, 7, 1000),
+])
+def test_slice_bounds(total_count, slices, ordinal_window):
+    bounds = _slice_bounds(total_count, slices, ordinal_window)
+    window_count = ordinal_window_index(total_count - 1, ordinal_window) + 1
+    assert len(bounds) == min(slices, window_count)
+    assert bounds[0][0] == 0 and bounds[-1][1] == total_count
+    for (_, end), (start, _) in zip(bounds, bounds[1:]):
+        assert end == start
+        # no segment spans two slices
+        assert ordinal_window_index(start - 1, ordinal_window) != ordinal_window_index(start, ordinal_window)
+    assert all(start < end for start, end in bounds)
+
+
+def test_replay_slice_counts_only_its_range(block_trace):
+    start, end = 1001, 2001
+    stats = _replay_slice((block_trace, start, end, 300, "LRU", 5000, "Null", {}, _ORDINAL_WINDOW))
+    assert sorted(stats["segment_total_count"]) == [2, 3]
+    assert sum(stats["segment_total_count"].values()) == end - start
+
+
+@pytest.mark.parametrize("cache_type, filter_type, filter_args", [
+    ("LRU", "Null", {}), ("SLRU", "Null", {}), ("GDSF", "Bloom", {"n": 300}),
+])
+def test_exact_when_nothing_is_approximated(block_trace, cache_type, filter_type, filter_args):
+    serial = _serial_segment_stats(block_trace, cache_type, filter_type, filter_args)
+    one_slice = simulate_sliced(cache_type, 5000, block_trace, filter_type, filter_args, slices=1, warmup=0,
+                                ordinal_window=_ORDINAL_WINDOW)
+    assert one_slice["segment_stats"] == serial
+    # a warmup covering the whole trace replays every slice from the start
+    full_warmup = simulate_sliced(cache_type, 5000, block_trace, filter_type, filter_args, slices=4,
+                                  warmup=_REQUEST_COUNT, ordinal_window=_ORDINAL_WINDOW, processes=2)
+    assert full_warmup["slices"] == 4
+    assert full_warmup["segment_stats"] == serial
+
+
+def test_approximation_report(block_trace):
+    report = approximation_report(5000, block_trace, slices=4, warmup=_REQUEST_COUNT,
+                                  ordinal_window=_ORDINAL_WINDOW, processes=1, cache_types=("LRU",))
+    assert report["LRU"]["abs_error_20p_warmup_bmr"] == 0
+    assert report["LRU"]["max_abs_error_segment_bmr"] == 0
+    cold = approximation_report(5000, block_trace, slices=4, warmup=0, ordinal_window=_ORDINAL_WINDOW,
+                                processes=1, cache_types=("LRU",))
+    # slices starting with an empty cache miss more than the serial replay
+    assert cold["LRU"]["sliced_20p_warmup_bmr"] > cold["LRU"]["serial_20p_warmup_bmr"]
@@ -0,0 +1,68 @@
+import subprocess
+import sys
+
+import pytest
+
+import caches
+import filters
+import plugins
+import traces
+
+
+def test_heavy_dependencies_load_on_first_use():
+    code = (
+        "import sys, run, caches, filters\n"
+        "heavy = ('numpy', 'sortedcontainers', 'probables', 'bloom_filter', 'learned_model')\n"
+        "assert not [m for m in heavy if type(sys.modules.get(m)).__name__ == 'module'], heavy\n"
+        "filters.initialize_filter('Percentile', size=10, percentile=50)\n"
+        "assert type(sys.modules['sortedcontainers']).__name__ == 'module'\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_missing_module_raises_on_use():
+    module = plugins.lazy_import("no_such_module_for_the_plugin_test")
+    with pytest.raises(ModuleNotFoundError):
+        module.anything
+
+
+def test_builtin_names_resolve_through_the_registry():
+    assert plugins.resolve(plugins.CACHE, "LRU") is caches._name_to_cls["LRU"]
+    assert isinstance(caches.initialize_cache("LRU", 10), caches.LRUCache)
+    with pytest.raises(KeyError):
+        caches.initialize_cache("NoSuchCache", 10)
+
+
+_FIFO_PLUGIN = {"cache": caches.FIFOCache, "args": caches.FIFOArgs}
+_BLOOM_PLUGIN = {"filter": filters.BloomFilter, "args": filters.BloomFilterArgs}
+
+
+class _OverridingIterator:
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+
+@pytest.fixture
+def declare():
+    declared = []
+
+    def register(kind, name, target):
+        plugins.register(kind, name, target)
+        declared.append((kind, name))
+
+    yield register
+    for kind, name in declared:
+        del plugins._declared[kind][name]
+
+
+def test_declared_plugins_override_builtins_of_every_kind(declare):
+    declare(plugins.CACHE, "LRU", "test_plugins:_FIFO_PLUGIN")
+    declare(plugins.FILTER, "Null", "test_plugins:_BLOOM_PLUGIN")
+    declare(plugins.TRACE, "string", "test_plugins:_OverridingIterator")
+    assert type(caches.initialize_cache("LRU", 10)) is caches.FIFOCache
+    assert isinstance(filters.initialize_filter("Null", n=10), filters.BloomFilter)
+    assert isinstance(traces.initialize_iterator("string", "x.tr"), _OverridingIterator)
+
+
+def test_module_docstring():
+    assert plugins.__doc__.startswith("\nPlugins are caches")
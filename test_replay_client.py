@@ -0,0 +1,106 @@
+import asyncio
+import random
+
+from cache_server import CacheServer
+from caches import initialize_cache
+from caching_system import CachingSystem
+from filters import initialize_filter
+from replay_client import ReplayClient, ReplayArgs, replay_against_stand_in
+from simulation import Simulation
+from traces import initialize_iterator
+
+
+def _write_trace(path, request_count=2000, key_count=200, seed=0):
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for i in range(request_count):
+            key = int(rng.paretovariate(0.8)) % key_count
+            f.write(f"{i // 10} {key} {(key % 5 + 1) * 100}\n")
+
+
+def _stack():
+    return CachingSystem(initialize_filter("Null"), initialize_cache("LRU", 5000))
+
+
+def test_sequential_replay_matches_simulation(tmp_path):
+    trace_path = str(tmp_path / "replay.tr")
+    _write_trace(trace_path)
+    # expiry after 20 ts units only matches when the server sees the trace ts
+    expected_stack = _stack()
+    expected_stack.cache_instance.enable_expiry(default_ttl=20)
+    expected = Simulation(expected_stack, initialize_iterator("string", trace_path), 500).run()
+    stack = _stack()
+    stack.cache_instance.enable_expiry(default_ttl=20)
+    res = asyncio.run(replay_against_stand_in(
+        stack, initialize_iterator("string", trace_path), ReplayArgs(1, 1), 500
+    ))
+    assert res["segment_stats"]["segment_miss_count"] == expected["segment_stats"]["segment_miss_count"]
+    assert res["replay_stats"]["error_count"] == 0
+    assert stack.cache_instance.expired_count == expected_stack.cache_instance.expired_count > 0
+
+
+async def _replay_against(handle, trace_path):
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    host, port = server.sockets[0].getsockname()[:2]
+    try:
+        client = ReplayClient(host, port, ReplayArgs(2, 4), 100)
+        return await asyncio.wait_for(client.replay(initialize_iterator("string", trace_path)), 10)
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def test_error_replies_count_as_misses(tmp_path):
+    trace_path = str(tmp_path / "replay.tr")
+    with open(trace_path, "w") as f:
+        for i in range(10):
+            f.write(f"{i} {i % 2} {2000 if i % 2 else 10}\n")
+
+    async def handle(reader, writer):
+        while line := await reader.readline():
+            parts = line.split()
+            if parts[0] == b"get":
+                writer.write(b"END\r\n")
+            elif parts[0] == b"set":
+                await reader.readexactly(int(parts[4]) + 2)
+                writer.write(b"SERVER_ERROR object too large\r\n" if int(parts[4]) > 1000 else b"STORED\r\n")
+            await writer.drain()
+        writer.close()
+
+    res = asyncio.run(_replay_against(handle, trace_path))
+    assert res["replay_stats"]["request_count"] == 10
+    assert sum(res["segment_stats"]["segment_total_count"]) == 10
+    assert sum(res["segment_stats"]["segment_miss_count"]) == 10
+    assert res["replay_stats"]["error_count"] == 5
+
+
+def test_broken_connection_fails_pending_requests(tmp_path):
+    trace_path = str(tmp_path / "replay.tr")
+    _write_trace(trace_path, request_count=100)
+
+    async def handle(reader, writer):
+        await reader.readline()
+        writer.write(b"VALUE 1 0 1\r\nx\r\nGARBAGE\r\n")
+        await writer.drain()
+        await reader.read()
+        writer.close()
+
+    res = asyncio.run(_replay_against(handle, trace_path))
+    assert sum(res["segment_stats"]["segment_total_count"]) == 100
+    assert res["replay_stats"]["error_count"] == 100
+
+
+def test_delete_removes_from_cache():
+    async def run():
+        stack = _stack()
+        server = CacheServer(stack)
+        host, port = await server.start()
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(b"set 7 0 0 3\r\nabc\r\ndelete 7\r\nget 7\r\nquit\r\n")
+        replies = await reader.read()
+        await server.close()
+        return stack, replies
+
+    stack, replies = asyncio.run(run())
+    assert replies == b"STORED\r\nDELETED\r\nEND\r\n"
+    assert stack.cache_instance.curr_capacity == 0
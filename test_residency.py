@@ -0,0 +1,51 @@
+import random
+
+import pytest
+
+from caches import initialize_cache
+from caching_system import CachingSystem
+from filters import initialize_filter
+from residency import ResidencyAnalytics
+from simulation import Simulation
+from traces import CacheRequest, initialize_iterator
+
+
+def _write_trace(path, request_count=20000, key_count=3000, seed=0):
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for i in range(request_count):
+            key = int(rng.paretovariate(0.7)) % key_count
+            f.write(f"{i} {key} {(key % 9 + 1) * 100}\n")
+
+
+class _RecordingSink:
+    def __init__(self):
+        self.evicted = []
+
+    def write(self, obj, request):
+        self.evicted.append((obj.frequency - 1, request.index - obj.index))
+
+
+@pytest.mark.parametrize("cache_type", ["LRU", "SLRU", "GDSF", "LFU"])
+def test_histograms_match_evictions(tmp_path, cache_type):
+    trace_path = str(tmp_path / "residency.tr")
+    _write_trace(trace_path)
+    cache_instance = initialize_cache(cache_type, 30000)
+    recording = _RecordingSink()
+    cache_instance.set_eviction_sink(recording)
+    simulation = Simulation(CachingSystem(initialize_filter("Null"), cache_instance),
+                            initialize_iterator("string", trace_path), 5000)
+    simulation.set_residency_analytics(ResidencyAnalytics())
+    stats = simulation.run()["residency_stats"]
+
+    hit_counts = [0] * len(stats["hits_before_eviction_histogram"])
+    for hits, _ in recording.evicted:
+        hit_counts[hits.bit_length()] += 1
+    assert stats["eviction_count"] == len(recording.evicted) > 0
+    assert stats["hits_before_eviction_histogram"] == hit_counts
+    assert 0 < stats["zero_hit_eviction_count"] <= stats["eviction_count"]
+    if cache_type != "LFU":
+        # LFU only ever evicts objects of the lowest count
+        assert stats["zero_hit_eviction_count"] < stats["eviction_count"]
+    assert sum(stats["window_eviction_count"]) == stats["eviction_count"]
+
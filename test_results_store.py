@@ -0,0 +1,61 @@
+import json
+import random
+
+import pytest
+
+from results_store import ResultsStore
+from run import build_simulation
+
+
+def _write_results(tmp_path):
+    trace_path = str(tmp_path / "store.tr")
+    rng = random.Random(0)
+    with open(trace_path, "w") as f:
+        for i in range(2000):
+            f.write(f"{i} {int(rng.paretovariate(0.8)) % 300} {rng.randrange(1, 100)}\n")
+    result_dir = tmp_path / "results"
+    result_dir.mkdir()
+    results = {}
+    for cache_type in ("LRU", "FIFO"):
+        for cache_size in (1000, 4000):
+            simulation, _, _ = build_simulation(cache_type, cache_size, trace_path, "string", "Bloom", {"n": 100},
+                                                200, 60)
+            res = simulation.run()
+            run_id = f"{cache_type}-{cache_size}"
+            with open(result_dir / f"{run_id}.json", "w") as f:
+                json.dump(res, f)
+            results[run_id] = res
+    return str(result_dir), results
+
+
+def test_import_query_pivot_and_segments(tmp_path):
+    result_dir, results = _write_results(tmp_path)
+    store = ResultsStore(str(tmp_path / "results.db"))
+    assert store.import_directory(result_dir) == 4
+
+    rows, columns, cells = store.pivot("cache_size", "cache_type", "no_warmup_byte_miss_ratio")
+    assert rows == [1000, 4000] and columns == ["FIFOCache", "LRUCache"]
+    for (cache_size, cache_type), value in cells.items():
+        res = results[f"{cache_type[:-len('Cache')]}-{cache_size}"]
+        assert value == pytest.approx(res["no_warmup_byte_miss_ratio"])
+    _, _, warmup_cells = store.pivot("cache_size", "cache_type", "20p_warmup_omr")
+    assert warmup_cells[(4000, "LRUCache")] == pytest.approx(results["LRU-4000"]["20p_warmup_omr"])
+
+    rows = store.query(["run_id", "20p_warmup_bmr", "expired_count"],
+                       where={"cache_type": "LRUCache", "filter_args.n": 100})
+    assert sorted(rows) == sorted((run_id, res["20p_warmup_bmr"], res["expired_count"])
+                                  for run_id, res in results.items() if run_id.startswith("LRU"))
+
+    assert store.load_segment_stats("FIFO-1000") == results["FIFO-1000"]["segment_stats"]
+    store.close()
+
+
+def test_unknown_fields_raise(tmp_path):
+    result_dir, _ = _write_results(tmp_path)
+    store = ResultsStore(str(tmp_path / "results.db"))
+    store.import_directory(result_dir)
+    with pytest.raises(KeyError):
+        store.query(["run_id", "no_such_metric"])
+    with pytest.raises(KeyError):
+        store.pivot("cache_size", "cache_type", "bmr", where={"filter_args.no_such_arg": 1})
+    store.close()
@@ -0,0 +1,52 @@
+import os
+
+from sweep_coordinator import SweepCoordinator, _write_atomic
+
+
+def _coordinator(tmp_path, max_attempts=3):
+    coordinator = SweepCoordinator(str(tmp_path / "sweep"), str(tmp_path), str(tmp_path / "results"),
+                                   stale_after=60, max_attempts=max_attempts)
+    os.makedirs(coordinator.simulation_res_dir, exist_ok=True)
+    return coordinator
+
+
+def _add_pending(coordinator, name):
+    path = coordinator._path("pending", name)
+    _write_atomic(path, {"name": name, "args": {}, "attempts": 0})
+    # written long before the claim
+    os.utime(path, (0, 0))
+
+
+def _age_claim(coordinator, name):
+    os.utime(coordinator._path("claimed", name), (0, 0))
+
+
+def test_fresh_claim_is_not_stale(tmp_path):
+    coordinator = _coordinator(tmp_path)
+    _add_pending(coordinator, "task")
+    assert coordinator.claim()["name"] == "task"
+    assert coordinator.requeue_stale() == []
+    assert coordinator.status() == {"pending": 0, "claimed": 1, "done": 0, "failed": 0}
+
+
+def test_requeue_counts_attempts_until_failed(tmp_path):
+    coordinator = _coordinator(tmp_path, max_attempts=2)
+    _add_pending(coordinator, "task")
+    coordinator.claim()
+    _age_claim(coordinator, "task")
+    assert coordinator.requeue_stale() == ["task"]
+    task = coordinator.claim()
+    assert task["attempts"] == 1
+    _age_claim(coordinator, "task")
+    assert coordinator.requeue_stale() == []
+    assert coordinator.status() == {"pending": 0, "claimed": 0, "done": 0, "failed": 1}
+    assert sorted(os.listdir(f"{coordinator.sweep_dir}/claimed")) == []
+
+
+def test_claim_is_exclusive(tmp_path):
+    coordinator = _coordinator(tmp_path)
+    other = _coordinator(tmp_path)
+    other.worker_id = "other:1"
+    _add_pending(coordinator, "task")
+    assert coordinator.claim()["name"] == "task"
+    assert other.claim() is None
@@ -0,0 +1,93 @@
+import random
+
+from caches import initialize_cache
+from caching_system import CachingSystem
+from event_sink import HitBitmap
+from filters import initialize_filter
+from simulation import Simulation
+from timing_simulation import TimingSimulation, TimingArgs, OriginModel, TimingStatistics
+from traces import initialize_iterator
+
+
+def _write_trace(path, request_count=5000, key_count=300, seed=0):
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for i in range(request_count):
+            key = int(rng.paretovariate(0.8)) % key_count
+            f.write(f"{i // 10} {key} {(key % 7 + 1) * 1000}\n")
+
+
+def _stack():
+    return CachingSystem(initialize_filter("Null"), initialize_cache("LRU", 50000))
+
+
+def _run(simulation_cls, trace_path, **kwargs):
+    simulation = simulation_cls(_stack(), initialize_iterator("string", trace_path), 1000, 60, **kwargs)
+    bitmap = HitBitmap()
+    simulation.subscribe(bitmap)
+    return simulation.run(), bitmap
+
+
+def test_timing_simulation_matches_simulation(tmp_path):
+    trace_path = str(tmp_path / "timing.tr")
+    _write_trace(trace_path)
+    expected, expected_bitmap = _run(Simulation, trace_path)
+    result, bitmap = _run(TimingSimulation, trace_path, timing_args=TimingArgs())
+    assert result["segment_stats"] == expected["segment_stats"]
+    assert (bitmap.bitmap() == expected_bitmap.bitmap()).all()
+    timing_stats = result["timing_stats"]
+    assert timing_stats["origin_fetch_count"] + timing_stats["coalesced_count"] >= \
+        sum(result["segment_stats"]["segment_miss_count"])
+    assert timing_stats["p50_latency"] <= timing_stats["p99_latency"] <= timing_stats["p999_latency"]
+
+
+def test_timing_simulation_without_subscribers(tmp_path):
+    trace_path = str(tmp_path / "timing.tr")
+    _write_trace(trace_path)
+    simulation = TimingSimulation(_stack(), initialize_iterator("string", trace_path), 1000, 60,
+                                  timing_args=TimingArgs(latency_distribution="constant"))
+    result = simulation.run()
+    assert sum(result["segment_stats"]["segment_total_count"]) == 5000
+
+
+def test_slow_round_trip_does_not_hold_the_origin_link():
+    model = OriginModel(TimingArgs(latency_distribution="constant", origin_bandwidth=1000))
+    latencies = iter([10.0, 0.05])
+    model.sample_latency = lambda: next(latencies)
+    assert model.fetch(0.0, 100) == (0.0, 0.1, 10.1)
+    start, end, completion = model.fetch(0.05, 100)
+    assert (start, end) == (0.1, 0.2)
+    assert abs(completion - 0.25) < 1e-9
+
+
+def test_origin_bytes_spread_over_the_transfer():
+    statistics = TimingStatistics(bandwidth_resolution=1)
+    statistics.record_origin_fetch(0.5, 2.5, 400)
+    statistics.record_window(0)
+    assert statistics.window_origin_bytes_list == [400]
+    assert statistics.window_peak_origin_bandwidth_list == [200]
+
+
+def test_peak_origin_bandwidth_within_the_link(tmp_path):
+    trace_path = str(tmp_path / "timing.tr")
+    with open(trace_path, "w") as f:
+        for i in range(2000):
+            f.write(f"{i} {i} 5000\n")
+    timing_args = TimingArgs(latency_distribution="constant", origin_bandwidth=1e6, bandwidth_resolution=1)
+    simulation = TimingSimulation(_stack(), initialize_iterator("string", trace_path), 1000, 60,
+                                  temporal_format="milli", timing_args=timing_args)
+    timing_stats = simulation.run()["timing_stats"]
+    assert timing_stats["peak_origin_bandwidth"] <= 1e6 * (1 + 1e-9)
+    assert sum(timing_stats["window_stats"]["origin_bytes"]) == 2000 * 5000
+
+
+def test_temporal_windows_in_seconds(tmp_path):
+    trace_path = str(tmp_path / "timing.tr")
+    with open(trace_path, "w") as f:
+        for i in range(300):
+            # one request per second, in milliseconds
+            f.write(f"{i * 1000} {i % 20} 100\n")
+    simulation = TimingSimulation(_stack(), initialize_iterator("string", trace_path), 1000, 60,
+                                  temporal_format="milli", timing_args=TimingArgs())
+    window_stats = simulation.run()["timing_stats"]["window_stats"]
+    assert window_stats["window_start_ts"] == [0, 60000, 120000, 180000, 240000]
@@ -0,0 +1,60 @@
+import random
+import time
+
+from caches import initialize_cache
+from timing_wheel import HierarchicalTimingWheel
+from traces import CacheRequest
+
+
+def test_advance_matches_sorted_timers():
+    rng = random.Random(0)
+    wheel = HierarchicalTimingWheel(slots=8, levels=3)
+    pending = []
+    now = 0
+    for _ in range(2000):
+        for _ in range(rng.randrange(3)):
+            expire_tick = now + int(rng.paretovariate(0.5))
+            wheel.schedule(len(pending), expire_tick)
+            pending.append((expire_tick, len(pending)))
+        now += int(rng.paretovariate(1.0)) - 1
+        expected = sorted(timer for timer in pending if timer[0] <= now)
+        pending = [timer for timer in pending if timer[0] > now]
+        assert sorted(wheel.advance(now)) == expected
+        assert wheel.count == len(pending)
+
+
+def test_advance_jumps_over_idle_ticks():
+    wheel = HierarchicalTimingWheel()
+    wheel.schedule("far", 10 ** 12)
+    wheel.schedule("near", 10 ** 7 + 5)
+    start = time.perf_counter()
+    assert wheel.advance(10 ** 7 + 5) == [(10 ** 7 + 5, "near")]
+    for now in range(10 ** 8, 10 ** 12, 10 ** 8):
+        assert wheel.advance(now) == []
+    assert time.perf_counter() - start < 5
+    assert wheel.advance(10 ** 12) == [(10 ** 12, "far")]
+
+
+def test_rejected_admission_schedules_no_timer():
+    cache = initialize_cache("LRU", 100)
+    cache.enable_expiry(default_ttl=10)
+    cache.admit(CacheRequest(1, 1000, 0, 0))
+    assert cache.expiry.count == 0
+    cache.admit(CacheRequest(2, 10, 0, 1))
+    assert cache.expiry.count == 1
+    assert cache.get(CacheRequest(2, 10, 20, 2)) is None
+    assert cache.last_get_expired
+
+
+def test_expired_keys_are_bounded():
+    cache = initialize_cache("LRU", 10 ** 6)
+    cache.enable_expiry(default_ttl=1, expired_keys_limit=100)
+    for i in range(1000):
+        cache.admit(CacheRequest(i, 1, i, i))
+        cache.get(CacheRequest(-1, 1, i, i))
+    assert cache.expired_count == 999
+    assert len(cache._expired_keys) == 100
+    assert cache.get(CacheRequest(997, 1, 1000, 1000)) is None
+    assert cache.last_get_expired
+    assert cache.get(CacheRequest(0, 1, 1000, 1001)) is None
+    assert not cache.last_get_expired
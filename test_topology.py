@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+from topology import TierArgs, TierWorkerError, simulate_topology
+from traces import initialize_iterator
+
+
+def _write_trace(path, request_count=20000, key_count=2000, seed=0):
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for i in range(request_count):
+            key = int(rng.paretovariate(0.6)) % key_count
+            f.write(f"{i} {key} {(key % 9 + 1) * 100}\n")
+
+
+_TIERS = [
+    TierArgs("edge", 4, "LRU", 20000),
+    TierArgs("regional", 2, "FIFO", 50000),
+    TierArgs("shield", 1, "LRU", 100000),
+]
+
+
+def _without_timing(res):
+    return {key: value for key, value in res.items()
+            if key not in ("pipeline", "simulation_time", "simulation_timestamp")}
+
+
+@pytest.mark.parametrize("edge_routing", ["random", "key"])
+def test_pipelined_matches_serial(tmp_path, edge_routing):
+    trace_path = str(tmp_path / "topology.tr")
+    _write_trace(trace_path)
+    serial = simulate_topology(_TIERS, initialize_iterator("string", trace_path), 5000, edge_routing,
+                               pipeline=False, batch_size=1000)
+    pipelined = simulate_topology(_TIERS, initialize_iterator("string", trace_path), 5000, edge_routing,
+                                  pipeline=True, batch_size=1000, queue_batches=2)
+    assert _without_timing(pipelined) == _without_timing(serial)
+    assert 0 < serial["origin_request_offload"] < 1
+
+
+def test_failing_tier_worker_raises(tmp_path):
+    trace_path = str(tmp_path / "topology.tr")
+    _write_trace(trace_path)
+    tiers = _TIERS[:2] + [TierArgs("shield", 1, "NoSuchCache", 100000)]
+    with pytest.raises(TierWorkerError, match="NoSuchCache"):
+        simulate_topology(tiers, initialize_iterator("string", trace_path), 5000, pipeline=True,
+                          batch_size=100, queue_batches=1)
@@ -0,0 +1,42 @@
+import random
+
+import numpy as np
+
+from trace_synthesizer import TraceSynthesizer, fit_model, format_tr_lines
+from traces import initialize_iterator
+
+
+def _synthesize(trace_path, request_count):
+    model = fit_model(initialize_iterator("string", trace_path))
+    chunks = list(TraceSynthesizer(model).chunks(request_count, chunk_size=1000))
+    return model, [np.concatenate([chunk[i] for chunk in chunks]) for i in range(3)]
+
+
+def test_trace_without_reuse(tmp_path):
+    trace_path = str(tmp_path / "unique.tr")
+    with open(trace_path, "w") as f:
+        for i in range(500):
+            f.write(f"{i} {i} {i % 10 + 1}\n")
+    model, (ts, keys, sizes) = _synthesize(trace_path, 2000)
+    assert model["classes"][0]["reuse_time"] == {"bucket": [], "count": []}
+    assert len(keys) == 2000
+    assert len(np.unique(keys)) == 2000
+    assert sizes.min() >= 1
+
+
+def test_synthetic_trace_keeps_the_reuse_profile(tmp_path):
+    rng = random.Random(0)
+    trace_path = str(tmp_path / "zipf.tr")
+    with open(trace_path, "w") as f:
+        for i in range(20000):
+            f.write(f"{i} {int(rng.paretovariate(0.8)) % 2000} 100\n")
+    model, (ts, keys, sizes) = _synthesize(trace_path, 20000)
+    assert len(keys) == 20000
+    assert (np.diff(ts) >= 0).all()
+    unique_ratio = len(np.unique(keys)) / len(keys)
+    assert abs(unique_ratio - model["key_count"] / model["request_count"]) < 0.05
+
+
+def test_format_tr_lines():
+    lines = format_tr_lines(np.array([0, 15]), np.array([7, 123456]), np.array([10, 1]))
+    assert lines == b"0 7 10\n15 123456 1\n"
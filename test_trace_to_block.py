@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from trace_to_block import BlockTraceWriter, BlockTraceReader, write_block_trace
+from traces import CacheRequest, BlockCacheTraceIterator
+
+
+def _requests(keys):
+    return [CacheRequest(key, i % 7 + 1, i // 3, i) for i, key in enumerate(keys)]
+
+
+def _round_trip(tmp_path, keys, block_size=4):
+    path = str(tmp_path / "trace.blk")
+    write_block_trace(_requests(keys), path, block_size)
+    return [(request.key, request.size, request.ts, request.index)
+            for request in BlockCacheTraceIterator(path)]
+
+
+@pytest.mark.parametrize("keys", [
+    [1, 2, 3, 1, 2, 9, 1],
+    [(1 << 64) - 1, 1 << 63, 5, (1 << 64) - 1, 0, 1 << 63],
+    [-5, 3, -(1 << 63), 3, (1 << 63) - 1],
+    [1 << 64, -1, 2],
+    ["a", 1, "b", "a"],
+])
+def test_round_trip_keys(tmp_path, keys):
+    expected = [(request.key, request.size, request.ts, request.index) for request in _requests(keys)]
+    assert _round_trip(tmp_path, keys) == expected
+
+
+def test_range_by_index_and_ts(tmp_path):
+    path = str(tmp_path / "trace.blk")
+    requests = _requests(list(range(100)))
+    with open(path, "wb") as dest:
+        BlockTraceWriter(block_size=16).dump(requests, dest)
+    with open(path, "rb") as f:
+        reader = BlockTraceReader(f)
+        assert [index for _, _, _, index in reader.iter_range(20, 40)] == list(range(20, 40))
+        assert [ts for ts, _, _, _ in reader.iter_range(start_ts=10, end_ts=12)] == [10, 10, 10, 11, 11, 11]
+
+
+def test_failed_write_leaves_no_file(tmp_path):
+    path = str(tmp_path / "trace.blk")
+
+    def failing():
+        yield from _requests([1, 2, 3])
+        raise RuntimeError("source failed")
+
+    with pytest.raises(RuntimeError):
+        write_block_trace(failing(), path)
+    assert os.listdir(tmp_path) == []
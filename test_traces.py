@@ -0,0 +1,24 @@
+from traces import MergedCacheTraceIterator, initialize_iterator
+
+
+def _write_trace(path, lines):
+    with open(path, "w") as f:
+        f.writelines(f"{line}\n" for line in lines)
+    return initialize_iterator("string", path)
+
+
+def test_merge_by_ts_with_disjoint_keys(tmp_path):
+    first = _write_trace(str(tmp_path / "a.tr"), ["0 1 10", "2 2 10", "4 1 10"])
+    second = _write_trace(str(tmp_path / "b.tr"), ["1 1 20", "2 2 20"])
+    requests = list(MergedCacheTraceIterator([first, second], tenants=["a", "b"]))
+    assert [(r.ts, r.key, r.tenant, r.index) for r in requests] == [
+        (0, 2, "a", 0), (1, 3, "b", 1), (2, 4, "a", 2), (2, 5, "b", 3), (4, 2, "a", 4)
+    ]
+
+
+def test_keys_beyond_uint64_keep_their_tenant(tmp_path):
+    big = (1 << 64) - 1
+    first = _write_trace(str(tmp_path / "a.tr"), [f"0 {big} 10", "1 5 10"])
+    second = _write_trace(str(tmp_path / "b.tr"), [f"0 {big} 10"])
+    keys = [r.key for r in MergedCacheTraceIterator([first, second], tenants=["a", "b"])]
+    assert keys == [f"a:{big}", f"b:{big}", 10]
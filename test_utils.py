@@ -19,8 +19,9 @@ _expected_response_event_type = {
 
 
 class TraceInfo:
-    def __init__(self, filepath, cache_size, traces, expected_responses):
+    def __init__(self, filepath, cache_size, traces, expected_responses, cache_args=None):
         assert isinstance(cache_size, int)
+        assert cache_args is None or isinstance(cache_args, dict)
         for trace in traces:
             assert isinstance(trace, dict)
             assert {"key", "size"} == set(trace.keys()), trace
@@ -37,6 +38,8 @@ class TraceInfo:
         self.cache_size = cache_size
         self.traces = traces
         self.expected_responses = expected_responses
+        # keyword arguments of the cache's args, "args" in the trace file
+        self.cache_args = cache_args or {}
 
 
 def collect_trace_infos(dir_path):
@@ -59,7 +62,8 @@ def collect_trace_infos(dir_path):
                 filepath=fp,
                 cache_size=loaded_data["size"],
                 traces=loaded_data["traces"],
-                expected_responses=loaded_data["expectedResponses"]
+                expected_responses=loaded_data["expectedResponses"],
+                cache_args=loaded_data.get("args")
             )
         )
     return trace_infos
@@ -70,8 +74,24 @@ common_trace_infos = collect_trace_infos(correctness_base_fp)
 cache_info_map = {
     "lru": {
         "cache_cls": caches.LRUCache,
+        "args_cls": caches.LRUArgs,
         "trace_infos": common_trace_infos + collect_trace_infos(f"{correctness_base_fp}/lru")
     },
+    "lfu": {
+        "cache_cls": caches.LFUCache,
+        "args_cls": caches.LFUArgs,
+        "trace_infos": common_trace_infos + collect_trace_infos(f"{correctness_base_fp}/lfu")
+    },
+    "lfuda": {
+        "cache_cls": caches.LFUDACache,
+        "args_cls": caches.LFUDAArgs,
+        "trace_infos": common_trace_infos + collect_trace_infos(f"{correctness_base_fp}/lfuda")
+    },
+    "wlfu": {
+        "cache_cls": caches.WindowLFUCache,
+        "args_cls": caches.WindowLFUArgs,
+        "trace_infos": common_trace_infos + collect_trace_infos(f"{correctness_base_fp}/wlfu")
+    },
 }
 
 
@@ -88,8 +108,8 @@ def _assert_size(cache_obj: caches.Cache, key, expected_size: int):
     assert obj.size == expected_size, f"{obj.size} != {expected_size}"
 
 
-def execute_traces(cache_cls: caches.Cache, trace_info: TraceInfo):
-    cache_obj = cache_cls(trace_info.cache_size, caches.LRUArgs())
+def execute_traces(cache_cls: caches.Cache, trace_info: TraceInfo, args_cls=caches.LRUArgs):
+    cache_obj = cache_cls(trace_info.cache_size, args_cls(**trace_info.cache_args))
     print(cache_obj)
     for trace in trace_info.traces:
         print(trace)
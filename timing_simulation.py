@@ -0,0 +1,307 @@
+"""
+Discrete event simulation of request latency and origin bandwidth on top of the hit/miss replay.
+All latencies are in seconds and all bandwidths in bytes per second. The simulated clock is trace ts over
+the temporal format's divisor, in seconds, and so are the temporal windows of TimingSimulation.
+"""
+import math
+import random
+from collections import namedtuple, defaultdict
+from datetime import datetime
+from heapq import heappush, heappop
+
+from logger import log_window
+from simulation import Simulation, do_nothing
+
+_TEMPORAL_DIVISOR = {
+    "s": 1,
+    "milli": 1000,
+    "micro": 1000000,
+}
+
+LATENCY_DISTRIBUTIONS = {
+    "constant", "exponential", "lognormal"
+}
+
+TimingArgs = namedtuple(
+    "TimingArgs", [
+        "latency_distribution", "latency_mean", "latency_sigma",
+        "origin_bandwidth", "backend_bandwidth", "hit_latency",
+        "bandwidth_resolution", "seed"
+    ],
+    defaults=["lognormal", 0.05, 1.0, 1.25e9, 1.25e10, 0.0005, 1, 0]
+)
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram with bounded relative error (`precision`).
+    Bucket i covers (min_latency * (1 + precision) ** (i - 1), min_latency * (1 + precision) ** i].
+    """
+
+    def __init__(self, precision=0.01, min_latency=1e-6):
+        self.precision = precision
+        self.min_latency = min_latency
+        self._log_base = math.log1p(precision)
+        self.counts = defaultdict(int)
+        self.count = 0
+
+    def record(self, latency):
+        if latency <= self.min_latency:
+            self.counts[0] += 1
+        else:
+            self.counts[int(math.log(latency / self.min_latency) / self._log_base) + 1] += 1
+        self.count += 1
+
+    def merge(self, other):
+        for i, count in other.counts.items():
+            self.counts[i] += count
+        self.count += other.count
+
+    def percentile(self, p):
+        if self.count == 0:
+            return None
+        target = math.ceil(self.count * p / 100)
+        seen = 0
+        for i in sorted(self.counts.keys()):
+            seen += self.counts[i]
+            if seen >= target:
+                return self.min_latency * (1 + self.precision) ** i
+        return None
+
+
+class OriginModel:
+    """
+    Origin fetches queue their transfer for a single shared link of `origin_bandwidth` and complete a
+    sampled round trip latency after it; the latency does not hold the link, so one slow round trip
+    does not delay the fetches behind it. Cache hits queue for the backend link the same way, plus
+    hit_latency.
+    """
+
+    def __init__(self, args: TimingArgs):
+        assert args.latency_distribution in LATENCY_DISTRIBUTIONS
+        self.args = args
+        self._random = random.Random(args.seed)
+        self._origin_free_at = 0.0
+        self._backend_free_at = 0.0
+        mean = args.latency_mean
+        if args.latency_distribution == "constant":
+            self.sample_latency = lambda: mean
+        elif args.latency_distribution == "exponential":
+            expovariate, lambd = self._random.expovariate, 1 / mean
+            self.sample_latency = lambda: expovariate(lambd)
+        else:
+            lognormvariate, sigma = self._random.lognormvariate, args.latency_sigma
+            mu = math.log(mean) - sigma ** 2 / 2
+            self.sample_latency = lambda: lognormvariate(mu, sigma)
+
+    def fetch(self, now, size):
+        """
+        :return: (start, end) of the fetch's transfer on the origin link and the completion time of an origin
+                 fetch issued at `now`
+        """
+        start = now if now > self._origin_free_at else self._origin_free_at
+        self._origin_free_at = start + size / self.args.origin_bandwidth
+        return start, self._origin_free_at, self._origin_free_at + self.sample_latency()
+
+    def serve(self, now, size):
+        """
+        :return: completion time of a cache hit served at `now`
+        """
+        start = now if now > self._backend_free_at else self._backend_free_at
+        self._backend_free_at = start + size / self.args.backend_bandwidth
+        return self._backend_free_at + self.args.hit_latency
+
+
+class TimingStatistics:
+    def __init__(self, bandwidth_resolution):
+        self.bandwidth_resolution = bandwidth_resolution
+        self.total_latency = LatencyHistogram()
+        self.window_latency = LatencyHistogram()
+        # bandwidth_resolution bin -> origin bytes transferred in it, until its window is recorded
+        self.origin_bins = defaultdict(float)
+        self.window_start_ts_list = []
+        self.window_p50_list = []
+        self.window_p99_list = []
+        self.window_p999_list = []
+        self.window_origin_bytes_list = []
+        self.window_peak_origin_bandwidth_list = []
+        self.window_coalesced_count_list = []
+        self.window_coalesced_count = 0
+        self.origin_fetch_count = 0
+        self.origin_fetch_bytes = 0
+        self.coalesced_count = 0
+
+    def record_origin_fetch(self, transfer_start, transfer_end, size):
+        """
+        Spreads the fetch's bytes over the bins its transfer overlaps.
+        """
+        resolution = self.bandwidth_resolution
+        origin_bins = self.origin_bins
+        first_bin = int(transfer_start // resolution)
+        last_bin = int(transfer_end // resolution)
+        if first_bin == last_bin or transfer_end <= transfer_start:
+            origin_bins[first_bin] += size
+        else:
+            rate = size / (transfer_end - transfer_start)
+            for origin_bin in range(first_bin, last_bin + 1):
+                overlap = min(transfer_end, (origin_bin + 1) * resolution) - \
+                    max(transfer_start, origin_bin * resolution)
+                if overlap > 0:
+                    origin_bins[origin_bin] += overlap * rate
+        self.origin_fetch_count += 1
+        self.origin_fetch_bytes += size
+
+    def record_coalesced(self):
+        self.window_coalesced_count += 1
+        self.coalesced_count += 1
+
+    def record_window(self, window_start_ts, window_end=None):
+        """
+        :param window_end: clock time the window ends at, its origin bytes are those of the bins starting
+                           before it; None takes every bin
+        """
+        if window_end is None:
+            window_bins = list(self.origin_bins.values())
+            self.origin_bins.clear()
+        else:
+            end_bin = window_end / self.bandwidth_resolution
+            ended = [origin_bin for origin_bin in self.origin_bins if origin_bin < end_bin]
+            window_bins = [self.origin_bins.pop(origin_bin) for origin_bin in ended]
+        self.window_start_ts_list.append(window_start_ts)
+        self.window_p50_list.append(self.window_latency.percentile(50))
+        self.window_p99_list.append(self.window_latency.percentile(99))
+        self.window_p999_list.append(self.window_latency.percentile(99.9))
+        self.window_origin_bytes_list.append(round(sum(window_bins)))
+        self.window_peak_origin_bandwidth_list.append(max(window_bins, default=0) / self.bandwidth_resolution)
+        self.window_coalesced_count_list.append(self.window_coalesced_count)
+        self.total_latency.merge(self.window_latency)
+        self.window_latency = LatencyHistogram()
+        self.window_coalesced_count = 0
+
+    def as_dict(self):
+        return {
+            "p50_latency": self.total_latency.percentile(50),
+            "p99_latency": self.total_latency.percentile(99),
+            "p999_latency": self.total_latency.percentile(99.9),
+            "peak_origin_bandwidth": max(self.window_peak_origin_bandwidth_list, default=0),
+            "origin_fetch_count": self.origin_fetch_count,
+            "origin_fetch_bytes": self.origin_fetch_bytes,
+            "coalesced_count": self.coalesced_count,
+            "window_stats": {
+                "window_start_ts": self.window_start_ts_list,
+                "p50_latency": self.window_p50_list,
+                "p99_latency": self.window_p99_list,
+                "p999_latency": self.window_p999_list,
+                "origin_bytes": self.window_origin_bytes_list,
+                "peak_origin_bandwidth": self.window_peak_origin_bandwidth_list,
+                "coalesced_count": self.window_coalesced_count_list,
+            }
+        }
+
+
+class TimingSimulation(Simulation):
+    """
+    Replays the trace against a simulated clock driven by CacheRequest.ts, temporal_window is in seconds of it.
+    Hit/miss decisions are identical to Simulation.run; on top of them, misses become origin
+    fetches and a miss for a key whose fetch is still in flight is coalesced onto it.
+    In flight fetches are retired through a heap ordered by completion time.
+    """
+
+    def __init__(self, caching_stack, trace_iterator,
+                 ordinal_window=100000, temporal_window=600,
+                 temporal_format='s', on_miss_callback=do_nothing, on_hit_callback=do_nothing,
+                 timing_args=TimingArgs()):
+        super().__init__(caching_stack, trace_iterator, ordinal_window, temporal_window,
+                         temporal_format, on_miss_callback, on_hit_callback)
+        self._timing_args = timing_args
+        self._origin_model = OriginModel(timing_args)
+        self._timing_statistics = TimingStatistics(timing_args.bandwidth_resolution)
+
+    def get_state(self):
+        state = super().get_state()
+        state["timing_args"] = dict(self._timing_args._asdict())
+        state["timing_stats"] = self._timing_statistics.as_dict()
+        return state
+
+    def run(self):
+        start_time = datetime.now()
+        divisor = _TEMPORAL_DIVISOR[self._temporal_format]
+        simulator = self._simulator
+        segment_statistics = self._segment_statistics
+        timing_statistics = self._timing_statistics
+        fetch = self._origin_model.fetch
+        serve = self._origin_model.serve
+        cache_instance = simulator.cache_instance
+        track_expiry = cache_instance.expiry is not None
+        tenant_statistics = self._tenant_statistics
+        on_miss, on_hit, events = self._hooks()
+        in_flight = {}
+        completions = []
+        window_start = None
+        window_end = None
+
+        for request in self._trace_iterator:
+            now = request.ts / divisor
+            if window_start is None:
+                window_start = now
+                window_end = window_start + self._temporal_window
+            while now >= window_end:
+                timing_statistics.record_window(round(window_start * divisor), window_end)
+                window_start = window_end
+                window_end += self._temporal_window
+            while completions and completions[0][0] <= now:
+                completion, key = heappop(completions)
+                if in_flight.get(key) == completion:
+                    del in_flight[key]
+
+            is_hit = simulator.get(request) is not None
+            if is_hit:
+                if on_hit is not None:
+                    on_hit(request)
+            else:
+                segment_statistics.update_miss(request)
+                if track_expiry and cache_instance.last_get_expired:
+                    segment_statistics.update_expired_miss(request)
+                if tenant_statistics is not None:
+                    tenant_statistics.update_miss(request.tenant, request.size)
+                simulator.put(request)
+                if on_miss is not None:
+                    on_miss(request)
+            if events is not None:
+                events.append(request.index, request.size, is_hit)
+
+            completion = in_flight.get(request.key)
+            if completion is not None:
+                timing_statistics.record_coalesced()
+            elif is_hit:
+                completion = serve(now, request.size)
+            else:
+                transfer_start, transfer_end, completion = fetch(now, request.size)
+                timing_statistics.record_origin_fetch(transfer_start, transfer_end, request.size)
+                in_flight[request.key] = completion
+                heappush(completions, (completion, request.key))
+            timing_statistics.window_latency.record(completion - now)
+
+            segment_statistics.update_stat(request)
+            if tenant_statistics is not None:
+                tenant_statistics.update_stat(request.tenant, request.size)
+            if self._curr_trace_index != 0 and self._curr_trace_index % self._ordinal_window == 0:
+                log_window(self._execution_logger, self._curr_trace_index,
+                           self._trace_iterator, segment_statistics.curr_bmr(),
+                           segment_statistics.curr_omr())
+                segment_statistics.record_segment()
+                self._record_residency_window()
+            self._curr_trace_index += 1
+
+        if (self._curr_trace_index - 1) % self._ordinal_window != 0:
+            segment_statistics.record_segment()
+            self._record_residency_window()
+        if window_start is not None:
+            timing_statistics.record_window(round(window_start * divisor))
+        if events is not None:
+            events.flush()
+        end_time = datetime.now()
+        res = self.get_state()
+        res["simulation_time"] = (end_time - start_time).total_seconds()
+        res["simulation_timestamp"] = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+        return res
@@ -0,0 +1,112 @@
+from heapq import heappush, heappop
+
+
+class HierarchicalTimingWheel:
+    """
+    Hierarchical timing wheel over integer ticks.
+    Level i has `slots` buckets of slots ** i ticks each; a timer is placed on the lowest level whose
+    span covers it and cascades one level down whenever its bucket comes due, so scheduling and
+    expiring cost amortized O(1) per timer and advancing skips the ticks with no bucket due.
+    Timers beyond the top level's span wait in an overflow heap.
+    Timers are never cancelled, owners ignore stale ones when they fire.
+    """
+
+    def __init__(self, start_tick=0, slots=256, levels=4):
+        self.slots = slots
+        self.levels = levels
+        self.current_tick = start_tick
+        self.count = 0
+        self._spans = [slots ** (level + 1) for level in range(levels)]
+        self._granularity = [slots ** level for level in range(levels)]
+        self._wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self._level_counts = [0] * levels
+        self._overflow = []
+        self._due = []
+
+    def schedule(self, key, expire_tick):
+        self.count += 1
+        self._place(key, expire_tick)
+
+    def _place(self, key, expire_tick):
+        delta = expire_tick - self.current_tick
+        if delta <= 0:
+            self._due.append((expire_tick, key))
+            return
+        for level in range(self.levels):
+            if delta < self._spans[level]:
+                slot = (expire_tick // self._granularity[level]) % self.slots
+                self._wheels[level][slot].append((expire_tick, key))
+                self._level_counts[level] += 1
+                return
+        heappush(self._overflow, (expire_tick, key))
+
+    def _next_tick(self, now_tick):
+        """
+        :return: the first tick after current_tick and up to now_tick at which a bucket comes due or the
+            overflow heap moves into the wheel, now_tick if there is none
+        """
+        slots = self.slots
+        current = self.current_tick
+        best = now_tick
+        for level in range(self.levels):
+            if not self._level_counts[level]:
+                continue
+            granularity = self._granularity[level]
+            wheel = self._wheels[level]
+            base = current // granularity
+            # a level's buckets come due on multiples of its granularity, each once per rotation
+            for step in range(1, slots + 1):
+                tick = (base + step) * granularity
+                if tick >= best:
+                    break
+                if wheel[(base + step) % slots]:
+                    best = tick
+                    break
+        if self._overflow:
+            granularity = self._granularity[-1]
+            earliest = max(self._overflow[0][0] - self._spans[-1] + 1, current + 1)
+            best = min(best, -(-earliest // granularity) * granularity)
+        return best
+
+    def advance(self, now_tick):
+        """
+        Jumps from one due bucket to the next, so it costs O(slots * levels) per call at most
+        instead of O(now_tick - current_tick).
+        :return: list of (expire tick, key) for every timer with expire tick <= now_tick
+        """
+        expired = self._due
+        self._due = []
+        wheels = self._wheels
+        slots = self.slots
+        while self.current_tick < now_tick:
+            if self.count == len(expired):
+                # nothing pending, jump straight to now
+                self.current_tick = now_tick
+                break
+            tick = self._next_tick(now_tick)
+            self.current_tick = tick
+            for level in range(1, self.levels):
+                granularity = self._granularity[level]
+                if tick % granularity != 0:
+                    break
+                slot = (tick // granularity) % slots
+                bucket = wheels[level][slot]
+                if bucket:
+                    wheels[level][slot] = []
+                    self._level_counts[level] -= len(bucket)
+                    for expire_tick, key in bucket:
+                        self._place(key, expire_tick)
+            if self._overflow and tick % self._granularity[-1] == 0:
+                while self._overflow and self._overflow[0][0] - tick < self._spans[-1]:
+                    expire_tick, key = heappop(self._overflow)
+                    self._place(key, expire_tick)
+            bucket = wheels[0][tick % slots]
+            if bucket:
+                wheels[0][tick % slots] = []
+                self._level_counts[0] -= len(bucket)
+                expired.extend(bucket)
+            if self._due:
+                expired.extend(self._due)
+                self._due = []
+        self.count -= len(expired)
+        return expired
@@ -0,0 +1,326 @@
+"""
+Hierarchical caching, e.g. edge -> regional -> origin shield.
+
+A topology is a list of tiers from the edge upwards. Node i of a tier with `nodes` nodes has parent
+i * parent_nodes // nodes in the next tier, so children are split into contiguous groups.
+Every node is a CachingSystem with its tier's filter, cache policy and capacity. A request enters at an
+edge node; a node that misses admits the request through its filter and forwards it to its parent, the
+misses of the last tier go to the origin.
+
+Nodes share no state, so every tier can serve its stream of forwarded misses on its own in trace order.
+With pipeline=True every tier above the edge runs in its own worker process, fed by the tier below
+through a queue of batches. A worker that fails reports its error on the result queue and keeps draining
+its input, so the tiers below finish; simulate_topology then raises TierWorkerError.
+"""
+import argparse
+import hashlib
+import json
+import os
+import queue
+import random
+import traceback
+from collections import namedtuple, defaultdict
+from datetime import datetime
+from multiprocessing import Process, Queue
+
+from caches import initialize_cache
+from caching_system import CachingSystem
+from cluster import initialize_router
+from filters import initialize_filter
+from simulation import ordinal_window_index
+from traces import initialize_iterator, DEFAULT_TRACE_TYPE, CacheRequest
+
+EDGE_ROUTING_TYPES = {
+    "random", "key"
+}
+
+TierArgs = namedtuple(
+    "TierArgs", ["name", "nodes", "cache_type", "cache_size", "filter_type", "filter_args"],
+    defaults=["Null", None]
+)
+
+_TIER_FIELDS = ("request_count", "request_bytes", "hit_count", "hit_bytes")
+_SEGMENT_FIELDS = ("segment_total_count", "segment_total_bytes", "segment_miss_count", "segment_miss_bytes")
+
+
+def parent_index(i, nodes, parent_nodes):
+    return i * parent_nodes // nodes
+
+
+class _Tier:
+    """
+    The nodes of one tier and their statistics.
+    """
+
+    def __init__(self, tier_args: TierArgs, parent_nodes, ordinal_window):
+        self.tier_args = tier_args
+        self.caching_systems = [
+            CachingSystem(initialize_filter(tier_args.filter_type, **(tier_args.filter_args or {})),
+                          initialize_cache(tier_args.cache_type, tier_args.cache_size))
+            for _ in range(tier_args.nodes)
+        ]
+        # None for the last tier, whose misses go to the origin
+        self.parents = None if parent_nodes is None else [
+            parent_index(i, tier_args.nodes, parent_nodes) for i in range(tier_args.nodes)
+        ]
+        self.ordinal_window = ordinal_window
+        self.node_stats = [[0] * len(_TIER_FIELDS) for _ in range(tier_args.nodes)]
+        # window -> [forwarded count, forwarded bytes]
+        self.window_misses = defaultdict(lambda: [0, 0])
+
+    def serve(self, records):
+        """
+        :param records: list of (node, key, size, ts, index) in trace order
+        :return: list of the missed records addressed to the parent nodes
+        """
+        caching_systems = self.caching_systems
+        parents = self.parents
+        node_stats = self.node_stats
+        forwarded = []
+        for node, key, size, ts, index in records:
+            request = CacheRequest(key, size, ts, index)
+            caching_system = caching_systems[node]
+            stats = node_stats[node]
+            stats[0] += 1
+            stats[1] += size
+            if caching_system.get(request) is not None:
+                stats[2] += 1
+                stats[3] += size
+                continue
+            caching_system.put(request)
+            window_misses = self.window_misses[ordinal_window_index(index, self.ordinal_window)]
+            window_misses[0] += 1
+            window_misses[1] += size
+            forwarded.append((None if parents is None else parents[node], key, size, ts, index))
+        return forwarded
+
+    def result(self):
+        return {
+            "node_stats": self.node_stats,
+            "window_misses": dict(self.window_misses),
+        }
+
+
+class TierWorkerError(Exception):
+    pass
+
+
+def _tier_worker(tier_args, parent_nodes, ordinal_window, in_queue, out_queue, result_queue, level):
+    drained = False
+    try:
+        tier = _Tier(tier_args, parent_nodes, ordinal_window)
+        while True:
+            batch = in_queue.get()
+            if batch is None:
+                drained = True
+                break
+            forwarded = tier.serve(batch)
+            if out_queue is not None and forwarded:
+                out_queue.put(forwarded)
+        result = tier.result()
+    except Exception:
+        result = TierWorkerError(f"tier {tier_args.name} failed:\n{traceback.format_exc()}")
+        # the tier below must not block on a full queue
+        while not drained and in_queue.get() is not None:
+            pass
+    if out_queue is not None:
+        out_queue.put(None)
+    result_queue.put((level, result))
+
+
+def _check_workers(workers):
+    """
+    Raises TierWorkerError when a worker died without reporting, e.g. killed.
+    """
+    for worker in workers:
+        if worker.exitcode not in (None, 0):
+            for other in workers:
+                other.terminate()
+            raise TierWorkerError(f"tier worker {worker.name} exited with {worker.exitcode}")
+
+
+def _put(batch_queue, batch, workers):
+    while True:
+        try:
+            batch_queue.put(batch, timeout=1)
+            return
+        except queue.Full:
+            _check_workers(workers)
+
+
+def _edge_batches(trace_iterator, edge_nodes, edge_routing, batch_size, seed, window_totals, ordinal_window):
+    """
+    Routes every request to an edge node, counting the requests of every ordinal window.
+    :return: generator of lists of (node, key, size, ts, index)
+    """
+    if edge_routing == "key":
+        router = initialize_router("ring", list(range(edge_nodes)), 100)
+        route = lambda request: router.route(request.key)
+    else:
+        # clients spread over the edges independently of the key
+        randrange = random.Random(seed).randrange
+        route = lambda request: randrange(edge_nodes)
+    batch = []
+    for request in trace_iterator:
+        totals = window_totals[ordinal_window_index(request.index, ordinal_window)]
+        totals[0] += 1
+        totals[1] += request.size
+        batch.append((route(request), request.key, request.size, request.ts, request.index))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _tier_summary(tier_args, node_stats, upstream):
+    totals = [sum(stats[i] for stats in node_stats) for i in range(len(_TIER_FIELDS))]
+    summary = dict(zip(_TIER_FIELDS, totals))
+    request_count, request_bytes, hit_count, hit_bytes = totals
+    summary.update({
+        "tier_args": dict(tier_args._asdict()),
+        "hit_ratio": hit_count / request_count if request_count else None,
+        "byte_hit_ratio": hit_bytes / request_bytes if request_bytes else None,
+        # traffic to the next tier or, for the last tier, the origin
+        f"{upstream}_request_count": request_count - hit_count,
+        f"{upstream}_bytes": request_bytes - hit_bytes,
+        "node_stats": {
+            f"{tier_args.name}-{i}": dict(zip(_TIER_FIELDS, stats)) for i, stats in enumerate(node_stats)
+        },
+    })
+    return summary
+
+
+def simulate_topology(tiers, trace_iterator, ordinal_window=1000000, edge_routing="random", pipeline=True,
+                      batch_size=10000, queue_batches=64, seed=0):
+    """
+    :param tiers: list of TierArgs from the edge upwards
+    :param queue_batches: batches a queue holds before the tier below blocks
+    :return: dict with the end to end miss ratios (misses are origin fetches), tier_stats and origin offload
+    """
+    assert edge_routing in EDGE_ROUTING_TYPES
+    assert tiers
+    start_time = datetime.now()
+    parent_nodes = [tier_args.nodes for tier_args in tiers[1:]] + [None]
+    window_totals = defaultdict(lambda: [0, 0])
+    edge = _Tier(tiers[0], parent_nodes[0], ordinal_window)
+    batches = _edge_batches(trace_iterator, tiers[0].nodes, edge_routing, batch_size, seed, window_totals,
+                            ordinal_window)
+    tier_results = [None] * len(tiers)
+    if pipeline and len(tiers) > 1:
+        queues = [Queue(queue_batches) for _ in tiers[1:]]
+        result_queue = Queue()
+        workers = [
+            Process(target=_tier_worker, args=(
+                tier_args, parent_nodes[level], ordinal_window, queues[level - 1],
+                queues[level] if level < len(queues) else None, result_queue, level
+            ), daemon=True)
+            for level, tier_args in enumerate(tiers) if level > 0
+        ]
+        for worker in workers:
+            worker.start()
+        for batch in batches:
+            forwarded = edge.serve(batch)
+            if forwarded:
+                _put(queues[0], forwarded, workers)
+        _put(queues[0], None, workers)
+        errors = []
+        for _ in workers:
+            while True:
+                try:
+                    level, result = result_queue.get(timeout=1)
+                    break
+                except queue.Empty:
+                    _check_workers(workers)
+            if isinstance(result, TierWorkerError):
+                errors.append(result)
+            tier_results[level] = result
+        for worker in workers:
+            worker.join()
+        if errors:
+            raise errors[0]
+    else:
+        upper = [_Tier(tier_args, parent_nodes[level], ordinal_window)
+                 for level, tier_args in enumerate(tiers) if level > 0]
+        for batch in batches:
+            forwarded = edge.serve(batch)
+            for tier in upper:
+                if not forwarded:
+                    break
+                forwarded = tier.serve(forwarded)
+        for level, tier in enumerate(upper, 1):
+            tier_results[level] = tier.result()
+    tier_results[0] = edge.result()
+
+    window_count = max(window_totals.keys()) + 1 if window_totals else 0
+    origin_misses = tier_results[-1]["window_misses"]
+    segment_stats = {
+        "segment_total_count": [window_totals[w][0] for w in range(window_count)],
+        "segment_total_bytes": [window_totals[w][1] for w in range(window_count)],
+        "segment_miss_count": [origin_misses[w][0] if w in origin_misses else 0 for w in range(window_count)],
+        "segment_miss_bytes": [origin_misses[w][1] if w in origin_misses else 0 for w in range(window_count)],
+    }
+
+    def ratio(miss_name, total_name, warmup=0):
+        start_index = int(window_count * warmup / 100)
+        total = sum(segment_stats[total_name][start_index:])
+        return sum(segment_stats[miss_name][start_index:]) / total if total else None
+
+    tier_stats = {
+        tier_args.name: _tier_summary(tier_args, tier_results[level]["node_stats"],
+                                      "origin" if level == len(tiers) - 1 else "upstream")
+        for level, tier_args in enumerate(tiers)
+    }
+    total_count = sum(segment_stats["segment_total_count"])
+    total_bytes = sum(segment_stats["segment_total_bytes"])
+    origin_count = sum(segment_stats["segment_miss_count"])
+    origin_bytes = sum(segment_stats["segment_miss_bytes"])
+    end_time = datetime.now()
+    return {
+        "topology": [dict(tier_args._asdict()) for tier_args in tiers],
+        "edge_routing": edge_routing,
+        "trace_file": trace_iterator.trace_filename,
+        "no_warmup_byte_miss_ratio": ratio("segment_miss_bytes", "segment_total_bytes"),
+        "segment_stats": segment_stats,
+        "20p_warmup_bmr": ratio("segment_miss_bytes", "segment_total_bytes", 20),
+        "20p_warmup_omr": ratio("segment_miss_count", "segment_total_count", 20),
+        "tier_stats": tier_stats,
+        "origin_request_offload": 1 - origin_count / total_count if total_count else None,
+        "origin_byte_offload": 1 - origin_bytes / total_bytes if total_bytes else None,
+        "pipeline": pipeline,
+        "simulation_time": (end_time - start_time).total_seconds(),
+        "simulation_timestamp": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('topology', help='JSON list of tiers from the edge upwards, e.g. '
+                                         '[{"name": "edge", "nodes": 4, "cache_type": "LRU", "cache_size": 1e9}, '
+                                         '{"name": "shield", "nodes": 1, "cache_type": "GDSF", "cache_size": 1e10}]')
+    parser.add_argument('traceFile')
+    parser.add_argument('--traceType', default=DEFAULT_TRACE_TYPE, dest='traceType')
+    parser.add_argument('--ordinalWindowSize', default=1000000, type=int)
+    parser.add_argument('--edgeRouting', default="random", choices=sorted(EDGE_ROUTING_TYPES), dest='edgeRouting')
+    parser.add_argument('--serial', action='store_true', help="run every tier in this process")
+    parser.add_argument('--batchSize', default=10000, type=int, dest='batchSize')
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('--resultIdentifier', default="regular", dest='resultIdentifier')
+    args = parser.parse_args()
+
+    trace_dir = os.environ["TRACE_DIRECTORY"]
+    simulation_res_dir = os.environ["SIMULATION_RESULT_DIRECTORY"]
+    if not os.path.exists(simulation_res_dir):
+        os.makedirs(simulation_res_dir)
+
+    tiers = [TierArgs(**{**tier, "cache_size": int(tier["cache_size"])}) for tier in json.loads(args.topology)]
+    trace_iterator = initialize_iterator(args.traceType, f"{trace_dir}/{args.traceFile}")
+    res = simulate_topology(tiers, trace_iterator, args.ordinalWindowSize, args.edgeRouting, not args.serial,
+                            args.batchSize, seed=args.seed)
+
+    h = hashlib.blake2s(digest_size=16)
+    h.update(f"topology_{tiers}_{args.edgeRouting}_{args.seed}_{trace_iterator.trace_filename}_"
+             f"{args.resultIdentifier}".encode())
+    with open(f"{simulation_res_dir}/{h.hexdigest()}.json", "w") as f:
+        json.dump(res, f, sort_keys=True, indent=4)
+    print(res)
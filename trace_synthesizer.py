@@ -0,0 +1,463 @@
+"""
+Profile matched synthetic traces.
+
+fit_model summarises a trace into a compact JSON model. Keys are grouped into popularity classes by
+floor(log2(request count)); every class keeps log bucketed histograms of
+    - the request count of its keys (popularity distribution),
+    - the reuse times of its keys, in requests between two requests of a key,
+    - the size of its keys,
+plus the rate new keys appear at and a profile of ts over the trace. The reuse time histograms are the
+footprint descriptors of the trace: the average footprint of a window, and with it the LRU miss ratio
+curve, follows from the reuse times and the rate of new keys.
+
+TraceSynthesizer writes a trace of any length. Keys of every class arrive uniformly in request time at the
+class's rate, draw a request count and a size of their class and request again after reuse times drawn from their class.
+Generation runs chunk by chunk: the requests of the keys arriving in a chunk are generated at once
+with NumPy and parked in the chunk they fall in until that chunk is emitted. Generation starts
+`warmup` requests early, by default the length of the fitted trace, so the long lived keys of a
+steady state workload are already active when the trace starts.
+ts follow the fitted trace's ts profile, repeated for traces longer than the fitted one.
+
+validation_report compares the LRU miss ratio curves of two traces, computed exactly from byte stack
+distances (the bytes of the distinct keys requested since the previous request of a key).
+"""
+import argparse
+import array
+import json
+import os
+import struct
+from datetime import datetime
+
+import numpy as np
+
+from accelerated import NUMBA_AVAILABLE, njit, load_trace_arrays
+from trace_to_binary import HEADER_FMT as BIN_HEADER_FMT
+from traces import initialize_iterator, DEFAULT_TRACE_TYPE, CacheRequest, trace_name_of
+
+MODEL_VERSION = 1
+# sub buckets per power of two of the histograms
+SUB_BUCKETS = 8
+MAX_POPULARITY_CLASS = 30
+TS_PROFILE_POINTS = 256
+
+_BUCKET_EDGES = np.concatenate([
+    [0], np.unique(np.floor(2 ** (np.arange(56 * SUB_BUCKETS) / SUB_BUCKETS)).astype(np.int64))
+])
+_POWERS_OF_TEN = 10 ** np.arange(19, dtype=np.int64)
+
+
+def _histogram(values):
+    """
+    :return: dict of the non empty log buckets of values and their counts
+    """
+    buckets, counts = np.unique(np.searchsorted(_BUCKET_EDGES, values, side="right") - 1, return_counts=True)
+    return {"bucket": buckets.tolist(), "count": counts.tolist()}
+
+
+class _HistogramSampler:
+    """
+    Draws values from one histogram per group, uniformly within the drawn bucket.
+    A group with an empty histogram, e.g. the reuse times of a trace without reuse, draws 0.
+    """
+
+    def __init__(self, histograms):
+        cdfs, buckets = [], []
+        for group, histogram in enumerate(histograms):
+            if not histogram["count"]:
+                cdfs.append(np.array([group + 1.0]))
+                buckets.append([0])
+                continue
+            cdf = np.cumsum(histogram["count"], dtype=np.float64)
+            cdf /= cdf[-1]
+            cdf[-1] = 1
+            # group g draws from (g, g + 1]
+            cdfs.append(group + cdf)
+            buckets.append(histogram["bucket"])
+        buckets = np.concatenate(buckets)
+        self._cdf = np.concatenate(cdfs)
+        self._low = _BUCKET_EDGES[buckets]
+        self._width = _BUCKET_EDGES[buckets + 1] - self._low
+
+    def sample(self, rng, groups):
+        slot = np.searchsorted(self._cdf, groups + rng.random(len(groups)), side="right")
+        return self._low[slot] + (rng.random(len(groups)) * self._width[slot]).astype(np.int64)
+
+
+def _load_requests(trace_iterator):
+    """
+    :return: (ts, sizes, dense key ids) as numpy.ndarray(int64) and the number of keys
+    """
+    key_to_id = {}
+    ts = array.array("q")
+    sizes = array.array("q")
+    key_ids = array.array("q")
+    for request in trace_iterator:
+        ts.append(request.ts)
+        sizes.append(request.size)
+        key_ids.append(key_to_id.setdefault(request.key, len(key_to_id)))
+    return np.frombuffer(ts, dtype=np.int64), np.frombuffer(sizes, dtype=np.int64), \
+        np.frombuffer(key_ids, dtype=np.int64), len(key_to_id)
+
+
+def fit_model(trace_iterator):
+    """
+    :return: JSON serialisable workload model of the trace
+    """
+    ts, sizes, key_ids, key_count = _load_requests(trace_iterator)
+    request_count = len(key_ids)
+    assert request_count > 1
+    key_requests = np.bincount(key_ids, minlength=key_count)
+    key_class = np.minimum(np.log2(key_requests).astype(np.int64), MAX_POPULARITY_CLASS)
+
+    order = np.argsort(key_ids, kind="stable")
+    sorted_keys = key_ids[order]
+    reused = sorted_keys[1:] == sorted_keys[:-1]
+    reuse_times = (order[1:] - order[:-1])[reused]
+    reuse_class = key_class[sorted_keys[1:][reused]]
+    # a key's size is the size of its first request
+    first = np.ones(request_count, dtype=bool)
+    first[1:] = ~reused
+    key_sizes = sizes[order[first]]
+
+    classes = []
+    for popularity_class in np.unique(key_class).tolist():
+        in_class = key_class == popularity_class
+        classes.append({
+            "popularity_class": popularity_class,
+            "key_count": int(in_class.sum()),
+            "request_count": int(key_requests[in_class].sum()),
+            "requests_per_key": _histogram(key_requests[in_class]),
+            "reuse_time": _histogram(reuse_times[reuse_class == popularity_class]),
+            "size": _histogram(key_sizes[in_class]),
+        })
+    duration = int(ts[-1] - ts[0])
+    return {
+        "version": MODEL_VERSION,
+        "trace_file": trace_iterator.trace_filename,
+        "request_count": request_count,
+        "key_count": key_count,
+        "ts_start": int(ts[0]),
+        # a trace longer than the fitted one repeats the profile every ts_period
+        "ts_period": duration + max(duration // (request_count - 1), 1),
+        "ts_profile": (ts[np.linspace(0, request_count - 1, TS_PROFILE_POINTS).astype(np.int64)] - ts[0]).tolist(),
+        "classes": classes,
+    }
+
+
+class TraceSynthesizer:
+    def __init__(self, model, seed=0, warmup=None):
+        """
+        :param warmup: requests generated and dropped before the trace starts, defaults to the
+                       length of the fitted trace
+        """
+        assert model["version"] == MODEL_VERSION
+        self.model = model
+        self.rng = np.random.default_rng(seed)
+        self.warmup = model["request_count"] if warmup is None else warmup
+        classes = model["classes"]
+        # new keys of every class per request
+        self._class_rates = np.array([c["key_count"] for c in classes], dtype=np.float64) / model["request_count"]
+        # arrivals owed to every class, started at a random phase
+        self._class_arrivals = self.rng.random(len(classes))
+        self._requests_per_key = _HistogramSampler([c["requests_per_key"] for c in classes])
+        self._reuse_time = _HistogramSampler([c["reuse_time"] for c in classes])
+        self._size = _HistogramSampler([c["size"] for c in classes])
+        profile_points = len(model["ts_profile"])
+        self._profile_index = np.linspace(0, model["request_count"] - 1, profile_points)
+        self._profile_ts = np.asarray(model["ts_profile"], dtype=np.float64)
+
+    def _arrivals(self, chunk, chunk_size, next_key):
+        """
+        Generates every request of the keys arriving in the chunk.
+        :return: (request times, keys, sizes) of the requests
+        """
+        rng = self.rng
+        # every class gets its expected arrivals rounded, keeping the fraction for the next chunk, so the
+        # few keys of the most popular classes arrive as often as in the fitted trace
+        owed = self._class_arrivals + self._class_rates * chunk_size
+        class_counts = owed.astype(np.int64)
+        self._class_arrivals = owed - class_counts
+        groups = rng.permutation(np.repeat(np.arange(len(class_counts)), class_counts))
+        count = len(groups)
+        arrival = (chunk + rng.random(count)) * chunk_size
+        requests_per_key = self._requests_per_key.sample(rng, groups)
+        key_sizes = self._size.sample(rng, groups)
+        owner = np.repeat(np.arange(count), requests_per_key)
+        first = np.cumsum(requests_per_key) - requests_per_key
+        offsets = self._reuse_time.sample(rng, groups[owner])
+        offsets[first] = 0
+        np.cumsum(offsets, out=offsets)
+        offsets -= np.repeat(offsets[first], requests_per_key)
+        return arrival[owner] + offsets, next_key + owner, key_sizes[owner]
+
+    def _ts(self, indexes):
+        request_count = self.model["request_count"]
+        cycle, position = np.divmod(indexes, request_count)
+        return self.model["ts_start"] + cycle * self.model["ts_period"] + \
+            np.interp(position, self._profile_index, self._profile_ts).astype(np.int64)
+
+    def chunks(self, request_count, chunk_size=1 << 20):
+        """
+        :return: generator of (ts, keys, sizes) numpy.ndarray(int64) chunks of request_count requests in total
+        """
+        # chunk -> list of (request times, keys, sizes) falling in it
+        parked = {}
+        chunk = -((self.warmup + chunk_size - 1) // chunk_size)
+        next_key = 0
+        emitted = 0
+        while emitted < request_count:
+            times, keys, sizes = self._arrivals(chunk, chunk_size, next_key)
+            if len(keys):
+                next_key = int(keys[-1]) + 1
+            destination = (times // chunk_size).astype(np.int64)
+            order = np.argsort(destination)
+            for part in np.split(order, np.flatnonzero(np.diff(destination[order])) + 1):
+                if len(part):
+                    parked.setdefault(int(destination[part[0]]), []).append((times[part], keys[part], sizes[part]))
+            parts = parked.pop(chunk, [])
+            chunk += 1
+            if chunk <= 0 or not parts:
+                continue
+            times = np.concatenate([part[0] for part in parts])
+            order = np.argsort(times)[:request_count - emitted]
+            keys = np.concatenate([part[1] for part in parts])[order]
+            sizes = np.concatenate([part[2] for part in parts])[order]
+            yield self._ts(np.arange(emitted, emitted + len(order))), keys, sizes
+            emitted += len(order)
+
+
+def format_tr_lines(ts, keys, sizes) -> bytes:
+    """
+    "{ts} {key} {size}\\n" lines of non negative integer columns, formatted digit by digit over whole columns.
+    """
+    columns = (ts, keys, sizes)
+    count = len(ts)
+    widths = [len(str(int(column.max()))) if count else 1 for column in columns]
+    chars = np.empty((sum(widths) + len(columns), count), dtype=np.uint8)
+    keep = np.empty(chars.shape, dtype=bool)
+    position = 0
+    for column, width in zip(columns, widths):
+        digit_count = np.maximum(np.searchsorted(_POWERS_OF_TEN, column, side="right"), 1)
+        remaining = column.astype(np.int64)
+        digit = np.empty_like(remaining)
+        for i in range(width - 1, -1, -1):
+            np.divmod(remaining, 10, out=(remaining, digit))
+            chars[position + i] = digit
+            chars[position + i] += ord("0")
+            # drop leading zeros
+            np.less_equal(width - i, digit_count, out=keep[position + i])
+        position += width
+        chars[position] = ord(" ")
+        keep[position] = True
+        position += 1
+    chars[-1] = ord("\n")
+    return chars.T[keep.T].tobytes()
+
+
+def _write_string(chunks, dest):
+    for ts, keys, sizes in chunks:
+        dest.write(format_tr_lines(ts, keys, sizes))
+
+
+def _write_binary(chunks, dest):
+    # trace_to_binary.BinTraceWriter(1, int)
+    dest.write(struct.pack(BIN_HEADER_FMT, 1, b"Q"))
+    for ts, keys, sizes in chunks:
+        np.stack([ts, sizes, keys], axis=1).astype("<u8").tofile(dest)
+
+
+def _write_bin_arr(chunks, dest):
+    # trace_to_binary.BinArrTraceWriter
+    for ts, keys, sizes in chunks:
+        np.stack([ts, sizes, keys], axis=1).astype(np.int64).tofile(dest)
+
+
+def _requests_of(chunks):
+    index = 0
+    for ts, keys, sizes in chunks:
+        for request_ts, key, size in zip(ts.tolist(), keys.tolist(), sizes.tolist()):
+            yield CacheRequest(key, size, request_ts, index)
+            index += 1
+
+
+def _write_pickle(chunks, dest):
+    from trace_to_pickle import s_dump
+    s_dump(_requests_of(chunks), dest)
+
+
+def _write_block(chunks, dest):
+    from trace_to_block import BlockTraceWriter
+    BlockTraceWriter().dump(_requests_of(chunks), dest)
+
+
+_trace_type_to_writer = {
+    "string": _write_string,
+    "batch_string": _write_string,
+    "pickle": _write_pickle,
+    "binary": _write_binary,
+    "bin_arr": _write_bin_arr,
+    "block": _write_block,
+}
+
+
+def write_trace(chunks, trace_type, file_path):
+    """
+    :param chunks: TraceSynthesizer.chunks
+    :param trace_type: a traces.py trace type
+    """
+    with open(file_path, "wb") as dest:
+        _trace_type_to_writer[trace_type](chunks, dest)
+
+
+def _byte_stack_distances(sizes, key_ids, key_count):
+    """
+    :return: numpy.ndarray(int64), per request the bytes of the distinct keys requested since the previous
+             request of its key, its own size included; -1 for the first request of a key
+    """
+    request_count = len(key_ids)
+    # Fenwick tree over request positions holding every key's size at its latest request
+    tree = np.zeros(request_count + 1, dtype=np.int64)
+    last = np.full(key_count, -1, dtype=np.int64)
+    last_size = np.zeros(key_count, dtype=np.int64)
+    distances = np.empty(request_count, dtype=np.int64)
+    for i in range(request_count):
+        key = key_ids[i]
+        previous = last[key]
+        if previous < 0:
+            distances[i] = -1
+        else:
+            total = 0
+            j = i
+            while j > 0:
+                total += tree[j]
+                j -= j & -j
+            j = previous + 1
+            while j > 0:
+                total -= tree[j]
+                j -= j & -j
+            distances[i] = total + sizes[i]
+            j = previous + 1
+            while j <= request_count:
+                tree[j] -= last_size[key]
+                j += j & -j
+        j = i + 1
+        while j <= request_count:
+            tree[j] += sizes[i]
+            j += j & -j
+        last[key] = i
+        last_size[key] = sizes[i]
+    return distances
+
+
+if NUMBA_AVAILABLE:
+    _byte_stack_distances = njit(cache=True, nogil=True)(_byte_stack_distances)
+
+
+def lru_miss_ratio_curve(sizes, key_ids, key_count, cache_sizes):
+    """
+    :return: (object miss ratios, byte miss ratios) of LRU at every cache size
+    Keys larger than a cache still take their place in its stack while LRUCache never admits them, so the
+    miss ratios of caches not much larger than the largest keys are slightly high.
+    """
+    distances = _byte_stack_distances(sizes, key_ids, key_count)
+    reused = distances >= 0
+    order = np.argsort(distances[reused], kind="stable")
+    reuse_distances = distances[reused][order]
+    hit_bytes = np.concatenate([[0], np.cumsum(sizes[reused][order])])
+    hits = np.searchsorted(reuse_distances, np.asarray(cache_sizes, dtype=np.int64), side="right")
+    total_bytes = int(sizes.sum())
+    return (1 - hits / len(key_ids)).tolist(), (1 - hit_bytes[hits] / total_bytes).tolist()
+
+
+def _trace_summary(sizes, key_ids, key_count):
+    key_requests = np.bincount(key_ids, minlength=key_count)
+    return {
+        "request_count": len(key_ids),
+        "key_count": key_count,
+        "one_hit_wonder_ratio": float((key_requests == 1).sum() / key_count),
+        "mean_request_size": float(sizes.mean()),
+        "total_bytes": int(sizes.sum()),
+    }
+
+
+def validation_report(real_iterator, synthetic_iterator, points=32):
+    """
+    Compares the LRU miss ratio curves of the traces at points cache sizes, log spaced up to the bytes of
+    all the real trace's keys.
+    """
+    real_sizes, real_key_ids, real_keys = load_trace_arrays(real_iterator)
+    synthetic_sizes, synthetic_key_ids, synthetic_keys = load_trace_arrays(synthetic_iterator)
+    _, first = np.unique(real_key_ids, return_index=True)
+    footprint = int(real_sizes[first].sum())
+    cache_sizes = np.unique(np.geomspace(max(footprint >> 16, 1), footprint, points).astype(np.int64))
+    real_omr, real_bmr = lru_miss_ratio_curve(real_sizes, real_key_ids, len(real_keys), cache_sizes)
+    synthetic_omr, synthetic_bmr = lru_miss_ratio_curve(
+        synthetic_sizes, synthetic_key_ids, len(synthetic_keys), cache_sizes
+    )
+    omr_errors = np.abs(np.subtract(synthetic_omr, real_omr))
+    bmr_errors = np.abs(np.subtract(synthetic_bmr, real_bmr))
+    return {
+        "real_trace_file": real_iterator.trace_filename,
+        "synthetic_trace_file": synthetic_iterator.trace_filename,
+        "real": _trace_summary(real_sizes, real_key_ids, len(real_keys)),
+        "synthetic": _trace_summary(synthetic_sizes, synthetic_key_ids, len(synthetic_keys)),
+        "cache_sizes": cache_sizes.tolist(),
+        "real_omr": real_omr,
+        "synthetic_omr": synthetic_omr,
+        "real_bmr": real_bmr,
+        "synthetic_bmr": synthetic_bmr,
+        "omr_mean_absolute_error": float(omr_errors.mean()),
+        "omr_max_absolute_error": float(omr_errors.max()),
+        "bmr_mean_absolute_error": float(bmr_errors.mean()),
+        "bmr_max_absolute_error": float(bmr_errors.max()),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    fit_parser = subparsers.add_parser("fit", help="writes {trace}.model.json next to the trace")
+    fit_parser.add_argument('traceFile')
+    fit_parser.add_argument('--traceType', default=DEFAULT_TRACE_TYPE, dest='traceType')
+    generate_parser = subparsers.add_parser("generate")
+    generate_parser.add_argument('modelFile')
+    generate_parser.add_argument('outputFile')
+    generate_parser.add_argument('requestCount', type=float)
+    generate_parser.add_argument('--traceType', default=DEFAULT_TRACE_TYPE, dest='traceType',
+                                 choices=sorted(_trace_type_to_writer))
+    generate_parser.add_argument('--seed', default=0, type=int)
+    generate_parser.add_argument('--warmup', default=None, type=int)
+    generate_parser.add_argument('--chunkSize', default=1 << 20, type=int, dest='chunkSize')
+    validate_parser = subparsers.add_parser("validate", help="fits the trace, synthesizes a trace of the same "
+                                                             "length and compares their LRU miss ratio curves")
+    validate_parser.add_argument('traceFile')
+    validate_parser.add_argument('--traceType', default=DEFAULT_TRACE_TYPE, dest='traceType')
+    validate_parser.add_argument('--seed', default=0, type=int)
+    validate_parser.add_argument('--points', default=32, type=int)
+    args = parser.parse_args()
+
+    trace_dir = os.environ["TRACE_DIRECTORY"]
+    start_time = datetime.now()
+    if args.command == "fit":
+        model = fit_model(initialize_iterator(args.traceType, f"{trace_dir}/{args.traceFile}"))
+        with open(f"{trace_dir}/{trace_name_of(args.traceFile)}.model.json", "w") as f:
+            json.dump(model, f)
+    elif args.command == "generate":
+        with open(f"{trace_dir}/{args.modelFile}") as f:
+            synthesizer = TraceSynthesizer(json.load(f), args.seed, args.warmup)
+        write_trace(synthesizer.chunks(int(args.requestCount), args.chunkSize), args.traceType,
+                    f"{trace_dir}/{args.outputFile}")
+    else:
+        result_dir = os.environ["SYNTHETIC_TRACE_RESULT_DIRECTORY"]
+        if not os.path.exists(result_dir):
+            os.makedirs(result_dir)
+        model = fit_model(initialize_iterator(args.traceType, f"{trace_dir}/{args.traceFile}"))
+        synthetic_file = f"{trace_dir}/{trace_name_of(args.traceFile)}_synthetic.tr"
+        write_trace(TraceSynthesizer(model, args.seed).chunks(model["request_count"]), "string", synthetic_file)
+        report = validation_report(initialize_iterator(args.traceType, f"{trace_dir}/{args.traceFile}"),
+                                   initialize_iterator("string", synthetic_file), args.points)
+        report["model"] = model
+        with open(f"{result_dir}/{trace_name_of(args.traceFile)}_synthetic_validation.json", "w") as f:
+            json.dump(report, f, sort_keys=True, indent=4)
+        print({key: value for key, value in report.items() if key.endswith("error")})
+    print(f"{args.command} took {(datetime.now() - start_time).total_seconds():.2f} s")
@@ -0,0 +1,301 @@
+"""
+Converts traces to a block compressed format that seeks by request index and timestamp.
+
+Block Format
+| header | block 0 | ... | block n-1 | key table | footer index | trailer |
+
+header:  {magic} {version} {codec}
+block:   compressed({ts deltas} {sizes} {key ids}), every column is `count` varints.
+         ts deltas are zigzag encoded against the previous request, the first one against
+         the block's first ts, so a block decodes without its predecessors.
+         Key ids are dense ids in order of first appearance.
+key table: compressed uint64 (or int64 with negative keys) array of the original keys ordered by key id,
+           or a JSON list when the trace has keys that are not integers or fit neither.
+footer:  compressed int64 columns {first index} {first ts} {offset} {length} {count} per block,
+         followed by the key table's offset, length and kind.
+trailer: {footer offset} {footer length} {block count} {magic}
+"""
+import argparse
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b"BLKTR"
+VERSION = 1
+HEADER_FMT = "<5sBB"
+HEADER_FMT_LEN = struct.calcsize(HEADER_FMT)
+TRAILER_FMT = "<QQQ5s"
+TRAILER_FMT_LEN = struct.calcsize(TRAILER_FMT)
+KEY_TABLE_FMT = "<QQB"
+KEY_TABLE_FMT_LEN = struct.calcsize(KEY_TABLE_FMT)
+
+CODEC_ZLIB = 0
+CODEC_ZSTD = 1
+CODECS = {"zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+DEFAULT_CODEC = "zstd" if zstandard is not None else "zlib"
+DEFAULT_BLOCK_SIZE = 1 << 16
+
+KEY_TABLE_INT = 0
+KEY_TABLE_JSON = 1
+KEY_TABLE_UINT = 2
+
+_UINT64_END = 1 << 64
+_INT64_START = -(1 << 63)
+
+_INDEX_COLUMNS = 5
+
+
+def encode_varints(values) -> bytes:
+    """
+    LEB128 encodes a uint64 array without a Python level loop.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    if len(values) == 0:
+        return b""
+    bit_length = np.zeros(len(values), dtype=np.int64)
+    remaining = values.copy()
+    while remaining.any():
+        nonzero = remaining != 0
+        bit_length[nonzero] += 7
+        remaining >>= np.uint64(7)
+    byte_count = np.maximum(bit_length // 7, 1)
+    offsets = np.cumsum(byte_count) - byte_count
+    owner = np.repeat(np.arange(len(values)), byte_count)
+    group = np.arange(int(byte_count.sum())) - np.repeat(offsets, byte_count)
+    out = (values[owner] >> (np.uint64(7) * group.astype(np.uint64))) & np.uint64(0x7f)
+    out |= (group < byte_count[owner] - 1).astype(np.uint64) << np.uint64(7)
+    return out.astype(np.uint8).tobytes()
+
+
+def decode_varints(data) -> np.ndarray:
+    """
+    Inverse of encode_varints.
+    :return: numpy.ndarray(uint64)
+    """
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if len(raw) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(raw < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    group = np.arange(len(raw)) - np.repeat(starts, ends - starts + 1)
+    shifted = (raw & 0x7f).astype(np.uint64) << (np.uint64(7) * group.astype(np.uint64))
+    return np.add.reduceat(shifted, starts)
+
+
+def _zigzag_encode(values):
+    values = np.asarray(values, dtype=np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _zigzag_decode(values):
+    values = values.astype(np.uint64)
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+
+def _compressor(codec):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ImportError("zstandard is required for zstd compressed block traces")
+        return zstandard.ZstdCompressor(level=3).compress
+    return lambda data: zlib.compress(data, 6)
+
+
+def _decompressor(codec):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ImportError("zstandard is required for zstd compressed block traces")
+        return zstandard.ZstdDecompressor().decompress
+    return zlib.decompress
+
+
+class BlockTraceWriter:
+    def __init__(self, block_size=DEFAULT_BLOCK_SIZE, codec=DEFAULT_CODEC):
+        self.block_size = block_size
+        self.codec = CODECS[codec]
+        self._compress = _compressor(self.codec)
+        self._key_ids = {}
+
+    def _write_block(self, dest, offset, first_index, ts, sizes, keys):
+        ts = np.asarray(ts, dtype=np.int64)
+        deltas = np.diff(ts, prepend=ts[0])
+        key_ids = self._key_ids
+        ids = [key_ids.setdefault(key, len(key_ids)) for key in keys]
+        payload = self._compress(
+            encode_varints(_zigzag_encode(deltas)) + encode_varints(sizes) + encode_varints(ids)
+        )
+        dest.write(payload)
+        return [first_index, int(ts[0]), offset, len(payload), len(ts)]
+
+    def dump(self, source, dest):
+        """
+        :param source: iterable of traces.CacheRequest
+        :param dest: binary file
+        """
+        dest.write(struct.pack(HEADER_FMT, MAGIC, VERSION, self.codec))
+        offset = HEADER_FMT_LEN
+        index = []
+        ts, sizes, keys = [], [], []
+        first_index = 0
+        for request in source:
+            ts.append(request.ts)
+            sizes.append(request.size)
+            keys.append(request.key)
+            if len(ts) == self.block_size:
+                index.append(self._write_block(dest, offset, first_index, ts, sizes, keys))
+                offset += index[-1][3]
+                first_index += len(ts)
+                ts, sizes, keys = [], [], []
+        if ts:
+            index.append(self._write_block(dest, offset, first_index, ts, sizes, keys))
+            offset += index[-1][3]
+
+        keys = list(self._key_ids.keys())
+        int_keys = all(isinstance(key, int) for key in keys)
+        low, high = (min(keys), max(keys)) if int_keys and keys else (0, 0)
+        if int_keys and 0 <= low and high < _UINT64_END:
+            key_table_kind = KEY_TABLE_UINT
+            key_table = self._compress(np.asarray(keys, dtype=np.uint64).tobytes())
+        elif int_keys and _INT64_START <= low and high < -_INT64_START:
+            key_table_kind = KEY_TABLE_INT
+            key_table = self._compress(np.asarray(keys, dtype=np.int64).tobytes())
+        else:
+            key_table_kind = KEY_TABLE_JSON
+            key_table = self._compress(json.dumps(keys).encode("utf-8"))
+        dest.write(key_table)
+        key_table_offset = offset
+        offset += len(key_table)
+
+        footer = self._compress(
+            np.asarray(index, dtype=np.int64).reshape(-1, _INDEX_COLUMNS).T.copy().tobytes()
+        ) + struct.pack(KEY_TABLE_FMT, key_table_offset, len(key_table), key_table_kind)
+        dest.write(footer)
+        dest.write(struct.pack(TRAILER_FMT, offset, len(footer), len(index), MAGIC))
+
+
+def write_block_trace(source, path, block_size=DEFAULT_BLOCK_SIZE, codec=DEFAULT_CODEC):
+    """
+    Dumps source to a temporary file moved to path once complete, so a failed conversion leaves no
+    truncated trace behind.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as dest:
+            BlockTraceWriter(block_size, codec).dump(source, dest)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class BlockTraceReader:
+    """
+    Random access reader. Blocks are located through the footer index, so opening a range by
+    request index or timestamp only decodes the blocks that overlap it.
+    Seeking by timestamp assumes timestamps are non decreasing.
+    """
+
+    def __init__(self, bin_file):
+        self.bin_file = bin_file
+        bin_file.seek(0)
+        magic, version, self.codec = struct.unpack(HEADER_FMT, bin_file.read(HEADER_FMT_LEN))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"not a version {VERSION} block trace")
+        self._decompress = _decompressor(self.codec)
+        bin_file.seek(-TRAILER_FMT_LEN, 2)
+        footer_offset, footer_length, block_count, magic = struct.unpack(
+            TRAILER_FMT, bin_file.read(TRAILER_FMT_LEN)
+        )
+        if magic != MAGIC:
+            raise ValueError("block trace is truncated")
+        bin_file.seek(footer_offset)
+        footer = bin_file.read(footer_length)
+        columns = np.frombuffer(self._decompress(footer[:-KEY_TABLE_FMT_LEN]), dtype=np.int64)
+        columns = columns.reshape(_INDEX_COLUMNS, block_count)
+        self.first_indexes, self.first_ts, self.offsets, self.lengths, self.counts = columns
+        self._key_table_offset, self._key_table_length, self._key_table_kind = struct.unpack(
+            KEY_TABLE_FMT, footer[-KEY_TABLE_FMT_LEN:]
+        )
+        self._key_table = None
+        self.total_count = int(self.counts.sum())
+
+    @property
+    def key_table(self):
+        if self._key_table is None:
+            self.bin_file.seek(self._key_table_offset)
+            data = self._decompress(self.bin_file.read(self._key_table_length))
+            if self._key_table_kind == KEY_TABLE_UINT:
+                self._key_table = np.frombuffer(data, dtype=np.uint64)
+            elif self._key_table_kind == KEY_TABLE_INT:
+                self._key_table = np.frombuffer(data, dtype=np.int64)
+            else:
+                self._key_table = np.asarray(json.loads(data.decode("utf-8")), dtype=object)
+        return self._key_table
+
+    def read_block(self, block):
+        """
+        :return: (ts, sizes, key ids) as numpy.ndarray(int64)
+        """
+        self.bin_file.seek(int(self.offsets[block]))
+        count = int(self.counts[block])
+        values = decode_varints(self._decompress(self.bin_file.read(int(self.lengths[block]))))
+        ts = self.first_ts[block] + np.cumsum(_zigzag_decode(values[:count]))
+        return ts, values[count:2 * count].astype(np.int64), values[2 * count:].astype(np.int64)
+
+    def block_for_index(self, index):
+        return max(int(np.searchsorted(self.first_indexes, index, side="right")) - 1, 0)
+
+    def block_for_ts(self, ts):
+        # the last block starting strictly before ts may still hold requests at ts
+        return max(int(np.searchsorted(self.first_ts, ts, side="left")) - 1, 0)
+
+    def iter_range(self, start_index=0, end_index=None, start_ts=None, end_ts=None, dense_keys=False):
+        """
+        Yields (ts, size, key, index) for requests with start_index <= index < end_index
+        and start_ts <= ts < end_ts.
+        """
+        end_index = self.total_count if end_index is None else min(end_index, self.total_count)
+        block = self.block_for_index(start_index)
+        if start_ts is not None:
+            block = max(block, self.block_for_ts(start_ts))
+        key_table = None if dense_keys else self.key_table
+        for block in range(block, len(self.counts)):
+            first_index = int(self.first_indexes[block])
+            if first_index >= end_index or (end_ts is not None and self.first_ts[block] >= end_ts):
+                return
+            ts, sizes, key_ids = self.read_block(block)
+            lo, hi = max(start_index - first_index, 0), min(end_index - first_index, len(ts))
+            if start_ts is not None:
+                lo = max(lo, int(np.searchsorted(ts, start_ts, side="left")))
+            if end_ts is not None:
+                hi = min(hi, int(np.searchsorted(ts, end_ts, side="left")))
+            if lo >= hi:
+                continue
+            keys = key_ids[lo:hi] if key_table is None else key_table[key_ids[lo:hi]]
+            yield from zip(
+                ts[lo:hi].tolist(), sizes[lo:hi].tolist(), keys.tolist(),
+                range(first_index + lo, first_index + hi)
+            )
+
+
+if __name__ == "__main__":
+    from traces import initialize_iterator, DEFAULT_TRACE_TYPE
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('source')
+    parser.add_argument('dest')
+    parser.add_argument('--traceType', default=DEFAULT_TRACE_TYPE, dest='traceType')
+    parser.add_argument('--blockSize', default=DEFAULT_BLOCK_SIZE, type=int, dest='blockSize')
+    parser.add_argument('--codec', default=DEFAULT_CODEC, choices=sorted(CODECS.keys()))
+    args = parser.parse_args()
+
+    write_block_trace(initialize_iterator(args.traceType, args.source), args.dest, args.blockSize, args.codec)
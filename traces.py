@@ -1,20 +1,40 @@
+import heapq
 import pickle
 from abc import abstractmethod, ABC
 
+import plugins
 from trace_to_binary import BinTraceReader, BinArrTraceReader
 
 DEFAULT_TRACE_TYPE = "string"
 
 
 class CacheRequest:
-    def __init__(self, key, size, ts, index):
+    __slots__ = ("key", "size", "ts", "index", "ttl", "range_start", "range_end", "tenant")
+
+    def __init__(self, key, size, ts, index, ttl=None, range_start=None, range_end=None, tenant=None):
         self.key = key
         self.size = size
         self.ts = ts
         self.index = index
+        self.ttl = ttl
+        self.range_start = range_start
+        self.range_end = range_end
+        # set by MergedCacheTraceIterator
+        self.tenant = tenant
+
+    def __setstate__(self, state):
+        # pickles of dict backed requests store a dict, possibly without the ttl, range and tenant fields
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **state[1]}
+        for name in self.__slots__:
+            setattr(self, name, state.get(name))
 
 
 def parse_tr_line(tr_data_line: str, trace_index: int) -> CacheRequest:
+    """
+    {timestamp} {key} {size} [{ttl} [{range start} {range end}]]
+    ttl is in timestamp units, "-" for none. The byte range is [range start, range end) of the object.
+    """
     split_line = tr_data_line.split(" ")
     ts = int(split_line[0])
     size = int(split_line[2])
@@ -22,8 +42,19 @@ def parse_tr_line(tr_data_line: str, trace_index: int) -> CacheRequest:
         key = int(split_line[1])
     except:
         key = split_line[1]
-    trace = CacheRequest(key, size, ts, trace_index)
-    return trace
+    ttl = None
+    if len(split_line) > 3 and split_line[3].strip() not in ("", "-"):
+        ttl = int(split_line[3])
+    range_start = range_end = None
+    if len(split_line) > 5:
+        range_start = int(split_line[4])
+        range_end = int(split_line[5])
+    return CacheRequest(key, size, ts, trace_index, ttl, range_start, range_end)
+
+
+def trace_name_of(file_path):
+    trace_filename = file_path.split("/")[-1]
+    return trace_filename.split(".")[0]
 
 
 class CacheTraceIterator(ABC):
@@ -31,6 +62,8 @@ class CacheTraceIterator(ABC):
         self.file_path = file_path
         self.total_count = 0
         self.total_size = 0
+        # name reported instead of the file's, e.g. the source trace of a cached conversion
+        self.trace_name = None
 
     @abstractmethod
     def __iter__(self):
@@ -38,8 +71,9 @@ class CacheTraceIterator(ABC):
 
     @property
     def trace_filename(self):
-        trace_filename = self.file_path.split("/")[-1]
-        return trace_filename.split(".")[0]
+        if self.trace_name is not None:
+            return self.trace_name
+        return trace_name_of(self.file_path)
 
 
 class StringCacheTraceIterator(CacheTraceIterator):
@@ -133,7 +167,7 @@ class BinArrCacheTraceIterator(CacheTraceIterator):
         self.file = open(self.file_path, 'rb+')
         self.reader = BinArrTraceReader(self.file)
         for line in self.reader:
-            trace = CacheRequest(line[2], line[1], self.total_count)
+            trace = CacheRequest(line[2], line[1], line[0], self.total_count)
             self.total_count += 1
             self.total_size += trace.size
             yield trace
@@ -143,18 +177,145 @@ class BinArrCacheTraceIterator(CacheTraceIterator):
             self.file.close()
 
 
+class BlockCacheTraceIterator(CacheTraceIterator):
+    """
+    Iterates a block compressed trace written by trace_to_block.BlockTraceWriter.
+    Optionally restricted to start_index <= index < end_index and start_ts <= ts < end_ts;
+    only the blocks overlapping the range are decoded.
+    Requests keep their index in the full trace.
+    """
+
+    def __init__(self, file_path, start_index=0, end_index=None, start_ts=None, end_ts=None, dense_keys=False):
+        super().__init__(file_path)
+        self.start_index = start_index
+        self.end_index = end_index
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+        self.dense_keys = dense_keys
+
+    @property
+    def trace_filename(self):
+        trace_filename = super().trace_filename
+        if self.start_index or self.end_index is not None:
+            trace_filename += f"[{self.start_index}:{'' if self.end_index is None else self.end_index}]"
+        if self.start_ts is not None or self.end_ts is not None:
+            trace_filename += f"[ts={'' if self.start_ts is None else self.start_ts}:" \
+                              f"{'' if self.end_ts is None else self.end_ts}]"
+        return trace_filename
+
+    def __iter__(self):
+        from trace_to_block import BlockTraceReader
+        with open(self.file_path, 'rb') as file:
+            reader = BlockTraceReader(file)
+            for ts, size, key, index in reader.iter_range(
+                    self.start_index, self.end_index, self.start_ts, self.end_ts, self.dense_keys):
+                self.total_count += 1
+                self.total_size += size
+                yield CacheRequest(key, size, ts, index)
+
+
+_KEY_LIMIT = 1 << 64
+
+
+class MergedCacheTraceIterator(CacheTraceIterator):
+    """
+    Merges the traces of several tenants by ts, streaming: a heap holds the next request of every trace.
+    Requests are tagged with their trace's tenant and re-indexed in merged order; requests with equal ts
+    keep the order of the traces.
+    With remap_keys every tenant gets a disjoint key space: integer key k of the i-th trace becomes
+    k * len(iterators) + i when that fits in a uint64 like the keys of the binary trace formats, any other
+    key "{tenant}:{key}".
+    """
+
+    def __init__(self, iterators, tenants=None, remap_keys=True):
+        """
+        :param tenants: tenant id of every trace, defaults to the trace names
+        """
+        super().__init__(None)
+        self.iterators = iterators
+        self.tenants = [iterator.trace_filename for iterator in iterators] if tenants is None else list(tenants)
+        if len(set(self.tenants)) != len(self.tenants) or len(self.tenants) != len(iterators):
+            raise ValueError(f"every trace needs its own tenant, got {self.tenants}")
+        self.remap_keys = remap_keys
+        self.trace_name = "+".join(iterator.trace_filename for iterator in iterators)
+
+    def __iter__(self):
+        tenants = self.tenants
+        tenant_count = len(tenants)
+        remap_keys = self.remap_keys
+        heap = []
+        for position, iterator in enumerate(self.iterators):
+            iterator = iter(iterator)
+            request = next(iterator, None)
+            if request is not None:
+                heap.append([request.ts, position, request, iterator])
+        heapq.heapify(heap)
+        while heap:
+            entry = heap[0]
+            _, position, request, iterator = entry
+            if remap_keys:
+                key = request.key
+                if isinstance(key, int) and 0 <= key * tenant_count + position < _KEY_LIMIT:
+                    request.key = key * tenant_count + position
+                else:
+                    request.key = f"{tenants[position]}:{key}"
+            request.tenant = tenants[position]
+            request.index = self.total_count
+            self.total_count += 1
+            self.total_size += request.size
+            yield request
+            request = next(iterator, None)
+            if request is None:
+                heapq.heappop(heap)
+            else:
+                entry[0] = request.ts
+                entry[2] = request
+                heapq.heapreplace(heap, entry)
+
+
 _name_to_cls = {
     "string": StringCacheTraceIterator,
     "batch_string": BatchStringCacheTraceIterator,
     "pickle": PickleCacheTraceIterator,
     "binary": BinCacheTraceIterator,
-    "bin_arr": BinArrCacheTraceIterator
+    "bin_arr": BinArrCacheTraceIterator,
+    "block": BlockCacheTraceIterator
 }
 
 
-def initialize_iterator(trace_type, file_path):
+CACHED_TRACE_TYPE_PREFIX = "cached:"
+
+
+def initialize_iterator(trace_type, file_path, **kwargs):
+    """
+    "cached:{trace type}" iterates the {trace type} conversion of the string trace at file_path, built
+    once through artifact_cache and reported under the string trace's name. Conversions that would drop
+    the trace's ttl or range columns raise ValueError.
+    :param kwargs: iterator specific options, e.g. the start_index/end_index/start_ts/end_ts
+                   range of a "block" trace
+    """
+    if trace_type.startswith(CACHED_TRACE_TYPE_PREFIX):
+        import artifact_cache
+        trace_type = trace_type[len(CACHED_TRACE_TYPE_PREFIX):]
+        cache = artifact_cache.default_cache()
+        if cache is None:
+            raise KeyError(f"cached trace types need {artifact_cache.ARTIFACT_CACHE_DIRECTORY} to be set")
+        iterator = initialize_iterator(
+            trace_type, cache.path(file_path, artifact_cache.TRACE_TYPE_ARTIFACTS[trace_type]), **kwargs
+        )
+        iterator.trace_name = trace_name_of(file_path)
+        return iterator
     try:
-        cls = _name_to_cls[trace_type]
+        cls = plugins.resolve(plugins.TRACE, trace_type)
     except KeyError:
         raise KeyError(f"Cache with {trace_type} is not implemented. Check _name_to_cls in traces.py")
-    return cls(file_path)
+    return cls(file_path, **kwargs)
+
+
+def initialize_merged_iterator(trace_type, file_paths, tenants=None, remap_keys=True, **kwargs):
+    """
+    MergedCacheTraceIterator over the traces at file_paths, all of trace_type.
+    """
+    return MergedCacheTraceIterator(
+        [initialize_iterator(trace_type, file_path, **kwargs) for file_path in file_paths], tenants, remap_keys
+    )